@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-19 07:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0015_tutorprofile_specialization'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='school',
+            name='qr_code_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
@@ -1,10 +1,12 @@
+import hashlib
 import uuid
 from io import BytesIO
 import qrcode
 from django.core.files import File
+from django.core.files.storage import default_storage
 from django.contrib.auth.base_user import BaseUserManager, AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.conf import settings
 import qrcode
@@ -137,6 +139,7 @@ class School(models.Model):
         max_length=255, blank=True, null=True, help_text="The motto or mission statement of the school."
     )
     qr_code = models.ImageField(upload_to='school_qrcodes/', blank=True, null=True)
+    qr_code_hash = models.CharField(max_length=64, blank=True, editable=False)  # SHA-256 of the QR code's payload
     ownership_type = models.CharField(max_length=20, choices=OWNERSHIP_CHOICES, null=True, blank=True, db_index=True)
 
     # New fields
@@ -152,9 +155,9 @@ class School(models.Model):
     def __str__(self):
         return self.name
 
-    def generate_qr_code(self):
-        """Generate a QR code dynamically with school information."""
-        qr_data = (
+    def qr_payload(self):
+        """The school information encoded in the QR code."""
+        return (
             f"School: {self.name}, "
             f"Type: {self.get_school_type_display()}, "
             f"District: {self.district.name if self.district else 'N/A'}, "
@@ -163,6 +166,20 @@ class School(models.Model):
             f"Website: {self.website or 'N/A'}, "
             f"Established: {self.established_year or 'N/A'}"
         )
+
+    def generate_qr_code(self):
+        """
+        Point qr_code at the image for the current school information. Images are named by
+        the payload hash, so an image already in storage is reused instead of rendered again.
+        """
+        qr_data = self.qr_payload()
+        qr_hash = hashlib.sha256(qr_data.encode('utf-8')).hexdigest()
+        name = f"{self.qr_code.field.upload_to}{qr_hash}.png"
+        self.qr_code_hash = qr_hash
+        if default_storage.exists(name):
+            self.qr_code.name = name
+            return
+
         qr = qrcode.QRCode(
             version=1,
             error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -175,13 +192,30 @@ class School(models.Model):
         buffer = BytesIO()
         img.save(buffer, 'PNG')
         buffer.seek(0)
-        filename = f"{self.name.replace(' ', '_')}_qr_code.png"
-        self.qr_code.save(filename, File(buffer), save=False)
+        self.qr_code.name = default_storage.save(name, File(buffer))
 
     def save(self, *args, **kwargs):
-        """Override save to ensure QR code is generated."""
+        """
+        Override save to regenerate the QR code, only when the information it encodes has
+        changed, and delete the image it replaces once the save has committed.
+        """
+        qr_hash = hashlib.sha256(self.qr_payload().encode('utf-8')).hexdigest()
+        if self.qr_code and qr_hash == self.qr_code_hash:
+            super().save(*args, **kwargs)
+            return
+
+        previous = self.qr_code.name if self.qr_code else None
         self.generate_qr_code()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'qr_code', 'qr_code_hash'}
         super().save(*args, **kwargs)
+        if previous and previous != self.qr_code.name:
+            transaction.on_commit(lambda: self.delete_unused_qr_code(previous))
+
+    @classmethod
+    def delete_unused_qr_code(cls, name):
+        if not cls.objects.filter(qr_code=name).exists():
+            default_storage.delete(name)
 
 
 
@@ -246,13 +280,12 @@ class TeacherProfile(models.Model):
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name}"
 
-    def generate_qr_code(self):
-        """Generate a QR code dynamically with teacher information."""
-        # Fetch all associated subjects
+    def qr_payload(self):
+        """The teacher information encoded in the QR code."""
+        # Fetch all associated subjects (prefetch them to avoid the query)
         subjects_list = ", ".join(subject.name for subject in self.subjects.all())
-        qr_data = (
+        return (
             f"Teacher: {self.user.first_name} {self.user.last_name}, "
-            f"Email: {self.user.email}, "
             f"School: {self.school.name if self.school else 'N/A'}, "
             f"Subjects: {subjects_list if subjects_list else 'None'}, "
             f"Favorite Subjects: {self.favorite_subjects or 'None'}, "
@@ -260,6 +293,14 @@ class TeacherProfile(models.Model):
             f"Specialization: {self.get_specialization_display() if self.specialization else 'None'}, "
             f"Years of Experience: {self.years_of_experience or 'N/A'}"
         )
+
+    def qr_code_hash(self):
+        """SHA-256 of the QR payload; it changes whenever the encoded information does."""
+        return hashlib.sha256(self.qr_payload().encode('utf-8')).hexdigest()
+
+    def generate_qr_code(self):
+        """Generate a QR code dynamically with teacher information."""
+        qr_data = self.qr_payload()
         qr = qrcode.QRCode(
             version=1,
             error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -1,3 +1,38 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import ExtractedText, GenerationJob, GenerationRecord
+
+
+# Admin for GenerationJob
+class GenerationJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'user', 'status', 'attempts', 'created_at', 'finished_at']
+    search_fields = ['user__email', 'kind']
+    list_filter = ['status', 'kind', 'created_at']
+    ordering = ['-created_at']
+
+
+admin.site.register(GenerationJob, GenerationJobAdmin)
+
+
+# Admin for GenerationRecord
+class GenerationRecordAdmin(admin.ModelAdmin):
+    list_display = ['id', 'feature', 'model', 'content_type', 'object_id', 'prompt_tokens', 'completion_tokens',
+                    'latency', 'cache_hits', 'created_at']
+    search_fields = ['prompt_hash', 'model']
+    list_filter = ['feature', 'model', 'created_at']
+    ordering = ['-created_at']
+
+
+admin.site.register(GenerationRecord, GenerationRecordAdmin)
+
+
+# Admin for ExtractedText
+class ExtractedTextAdmin(admin.ModelAdmin):
+    list_display = ['id', 'sha256', 'engine', 'size', 'uploads', 'created_at', 'last_used_at']
+    list_filter = ['engine']
+    search_fields = ['sha256']
+    ordering = ['-last_used_at']
+    exclude = ['text']
+
+
+admin.site.register(ExtractedText, ExtractedTextAdmin)
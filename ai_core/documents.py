@@ -0,0 +1,268 @@
+"""
+PDF versions of saved content, pre-rendered in the background when the content is saved.
+
+Each downloadable model has a document builder returning the HTML and render profile
+of its PDF. Saving a row schedules `prerender_pdf` (on the AI job queue when it is
+enabled, otherwise on the in-process PDF pool), which builds the document off the
+request thread and stores the PDF in the row's `rendered_pdf` field under its render
+cache key. Download views call
+`document_response`, which serves that file when it still matches the content and
+renders on demand otherwise.
+"""
+import functools
+import hashlib
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.template.loader import render_to_string
+from PIL import Image, UnidentifiedImageError
+
+from ai_core.jobs import enqueue_job, job_handler, job_queue_enabled
+from ai_core.utils import PDFRenderBusy, generate_pdf, pdf_cache_key, pdf_file_response, pdf_profile, \
+    pdf_response, submit_pdf, submit_pdf_task
+
+logger = logging.getLogger(__name__)
+
+LOGO_PATH = 'core/images/header_logo.png'
+
+# Largest side, in pixels, of the image copies embedded in application PDFs (about twice their printed size)
+APPLICANT_IMAGE_SIZE = 800
+QR_CODE_SIZE = 300
+
+
+@dataclass
+class PDFDocument:
+    html: str
+    profile: str
+    filename: str
+    date: str  # "Generated on" date printed in the header
+    base_url: str = None
+
+    @property
+    def key(self):
+        engine, options = pdf_profile(self.profile, self.date)
+        return pdf_cache_key(self.html, engine, options, self.base_url)
+
+
+def static_file_url(path):
+    """file:// URL of a static file, so renders load it from disk instead of over HTTP."""
+    location = finders.find(path) or os.path.join(settings.STATIC_ROOT, path)
+    return f"file://{location}"
+
+
+@functools.lru_cache(maxsize=1024)
+def _stored_file_hash(name, size, modified):
+    digest = hashlib.sha256()
+    with default_storage.open(name, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _image_hash(name):
+    """SHA-256 of a stored file, memoised while its size and modification time are unchanged."""
+    try:
+        modified = default_storage.get_modified_time(name).timestamp()
+    except NotImplementedError:
+        # Without a modification time a replaced file cannot be told apart, so hash it every time
+        return _stored_file_hash.__wrapped__(name, None, None)
+    return _stored_file_hash(name, default_storage.size(name), modified)
+
+
+def image_file_url(image_field, max_size, image_format='PNG'):
+    """
+    file:// URL of a copy of an uploaded image resized to fit `max_size`, for PDF renders.
+    Copies are kept in `AI_PDF_CACHE_DIR/images` under the image's SHA-256, so each
+    upload is resized once and a replaced image gets a new URL (and a new PDF cache key).
+    They count towards `AI_PDF_CACHE_MAX_BYTES` with the PDFs, and using one refreshes
+    its mtime so eviction is least recently used.
+    """
+    if not image_field:
+        return None
+    try:
+        digest = _image_hash(image_field.name)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Image {image_field.name} is not readable for the PDF: {e}")
+        return None
+
+    directory = os.path.join(settings.AI_PDF_CACHE_DIR, 'images')
+    path = os.path.join(directory, f"{digest}_{max_size}.{image_format.lower()}")
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with default_storage.open(image_field.name, 'rb') as source, os.fdopen(fd, 'wb') as out:
+                try:
+                    image = Image.open(source)
+                    image.thumbnail((max_size, max_size))
+                    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                        image = image.convert('RGB')
+                    image.save(out, image_format)
+                except (UnidentifiedImageError, OSError) as e:
+                    logger.warning(f"Embedding {image_field.name} as uploaded, it could not be resized: {e}")
+                    source.seek(0)
+                    out.seek(0)
+                    out.truncate()
+                    for chunk in iter(lambda: source.read(64 * 1024), b''):
+                        out.write(chunk)
+            os.replace(tmp_path, path)  # atomic, so a concurrent render never reads a partial file
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return f"file://{path}"
+
+
+def lesson_plan_document(lesson_plan):
+    date = lesson_plan.created_at.strftime('%Y-%m-%d')
+    if lesson_plan.is_math_note:
+        # Math lesson notes (ai_core.views.maths_assistant) are printed as they are shown
+        return PDFDocument(lesson_plan.content, 'math_lesson_note', 'math_lesson_note.pdf', date)
+    html = render_to_string('ai_core/lesson_plan_pdf.html', {
+        'lesson_plan_content': lesson_plan.content,
+        'generated_date': date,
+        'logo_url': static_file_url(LOGO_PATH),
+    })
+    return PDFDocument(html, 'lesson_plan', 'lesson_plan.pdf', date)
+
+
+def writing_prompt_document(writing_prompt):
+    date = writing_prompt.created_at.strftime('%Y-%m-%d')
+    html = render_to_string('ai_core/writing_prompt_pdf.html', {
+        'writing_prompt_content': writing_prompt.prompt,
+        'generated_date': date,
+        'logo_url': static_file_url(LOGO_PATH),
+    })
+    return PDFDocument(html, 'writing_prompt', 'creative_writing_prompt.pdf', date)
+
+
+def summary_document(summarized_content):
+    return PDFDocument(
+        summarized_content.content_html, 'default', f"summarized_content_{summarized_content.id}.pdf",
+        summarized_content.created_at.strftime('%Y-%m-%d'),
+    )
+
+
+def application_document(application):
+    date = application.application_date.strftime('%Y-%m-%d')
+    html = render_to_string('application/application_pdf.html', {
+        'application': application,
+        'generated_date': date,
+        'logo_url': static_file_url(LOGO_PATH),
+        'applicant_image_url': image_file_url(application.applicant_image, APPLICANT_IMAGE_SIZE, 'JPEG'),
+        'qr_code_url': image_file_url(application.qr_code, QR_CODE_SIZE),
+    })
+    return PDFDocument(html, 'application', f"application_{application.application_code}.pdf", date)
+
+
+PDF_DOCUMENTS = {
+    'core.lessonplan': lesson_plan_document,
+    'core.creativewritingprompt': writing_prompt_document,
+    'core.summarizedcontent': summary_document,
+    'core.application': application_document,
+}
+
+
+def build_document(instance):
+    return PDF_DOCUMENTS[instance._meta.label_lower](instance)
+
+
+def stored_pdf_matches(instance, document):
+    """Whether the row's pre-rendered PDF was rendered from the document's current HTML."""
+    name = instance.rendered_pdf.name if instance.rendered_pdf else ''
+    return os.path.basename(name).startswith(document.key)
+
+
+def store_rendered_pdf(model_label, object_id, path, key):
+    """Copy a rendered PDF from the render cache into the row's `rendered_pdf` field."""
+    model = apps.get_model(model_label)
+    name = f"generated_pdfs/{key}.pdf"
+    if not default_storage.exists(name):
+        with open(path, 'rb') as f:
+            name = default_storage.save(name, File(f))
+    # update() rather than save(), so storing the file does not schedule another render
+    model.objects.filter(pk=object_id).update(rendered_pdf=name)
+
+
+def _store_when_rendered(model_label, object_id, future):
+    close_old_connections()
+    try:
+        path, key = future.result()
+        store_rendered_pdf(model_label, object_id, path, key)
+    except Exception as e:
+        logger.warning(f"Pre-rendering the PDF for {model_label} #{object_id} failed: {e}")
+    finally:
+        close_old_connections()
+
+
+def prerender_pdf(model_label, object_id):
+    """
+    Render a row's PDF unless its stored PDF is already current. Runs on the PDF pool,
+    so building the document (image hashing and resizing included) stays off the
+    request thread; it only queues the render and returns.
+    """
+    close_old_connections()
+    try:
+        instance = apps.get_model(model_label).objects.get(pk=object_id)
+        document = build_document(instance)
+        if stored_pdf_matches(instance, document):
+            return
+        future = submit_pdf(document.html, document.profile, document.base_url, document.date)
+    except PDFRenderBusy as e:
+        logger.info(f"Skipping PDF pre-render for {model_label} #{object_id}: {e}")
+        return
+    except Exception as e:
+        logger.warning(f"Pre-rendering the PDF for {model_label} #{object_id} failed: {e}")
+        return
+    finally:
+        close_old_connections()
+    future.add_done_callback(functools.partial(_store_when_rendered, model_label, object_id))
+
+
+def queue_prerender(user, model_label, object_id):
+    if job_queue_enabled():
+        enqueue_job(user, 'render_pdf', model=model_label, object_id=object_id)
+    else:
+        try:
+            submit_pdf_task(f"prerender:{model_label}:{object_id}", 'prerender', prerender_pdf, model_label, object_id)
+        except PDFRenderBusy as e:
+            logger.info(f"Skipping PDF pre-render for {model_label} #{object_id}: {e}")
+
+
+def schedule_prerender(sender, instance, **kwargs):
+    """post_save receiver: pre-render once the transaction that saved the row has committed."""
+    if not settings.AI_PDF_PRERENDER or kwargs.get('raw'):
+        return
+    user, label, object_id = instance.user, instance._meta.label_lower, instance.pk
+    transaction.on_commit(lambda: queue_prerender(user, label, object_id))
+
+
+@job_handler('render_pdf')
+def render_pdf_job(user, model, object_id):
+    instance = apps.get_model(model).objects.get(pk=object_id)
+    document = build_document(instance)
+    if not stored_pdf_matches(instance, document):
+        path, key = generate_pdf(document.html, document.profile, document.base_url, date=document.date)
+        store_rendered_pdf(model, object_id, path, key)
+    return {'object_id': object_id}
+
+
+def document_response(request, instance):
+    """
+    Download response for a row's PDF: the pre-rendered file when it matches the current
+    content, otherwise an on-demand render through the PDF cache and pool.
+    """
+    document = build_document(instance)
+    if stored_pdf_matches(instance, document):
+        return pdf_file_response(request, lambda: instance.rendered_pdf.open('rb'), document.key, document.filename)
+    return pdf_response(request, document.html, document.filename, document.profile, document.base_url,
+                        date=document.date)
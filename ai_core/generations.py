@@ -0,0 +1,83 @@
+"""
+Generation metadata for saved AI output.
+
+Views wrap a generation in `track_generation` and pass the saved row to
+`record_generation`, which stores a GenerationRecord with the model, inputs,
+token counts, latency and routing outcome of the calls made for it.
+`prompt_hash` identifies the inputs, so earlier generations of the same request
+can be found with one indexed read.
+"""
+import hashlib
+import json
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.contrib.contenttypes.models import ContentType
+
+from ai_core import llm
+from ai_core.models import GenerationRecord
+
+
+def text_fingerprint(text):
+    """Stand-in for a long text input in `parameters`: its SHA-256 and estimated length."""
+    if not text:
+        return None
+    return {
+        'sha256': hashlib.sha256(text.encode('utf-8')).hexdigest(),
+        'tokens': llm.estimate_tokens(text),
+    }
+
+
+def prompt_hash(feature, parameters):
+    """SHA-256 identifying a generation request by its feature and parameters."""
+    payload = json.dumps([feature, parameters], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class GenerationRun:
+    """Calls and timing collected by `track_generation`."""
+
+    def __init__(self, calls):
+        self.calls = calls
+        self.started = time.monotonic()
+        self.latency = None
+
+
+@contextmanager
+def track_generation():
+    """Collect the LLM calls made inside the block and time it, for `record_generation`."""
+    with llm.collect_calls() as calls:
+        run = GenerationRun(calls)
+        try:
+            yield run
+        finally:
+            run.latency = time.monotonic() - run.started
+
+
+def record_generation(generated_object, feature, parameters, run):
+    """Store a GenerationRecord for a saved generation from the calls collected in `run`."""
+    calls = run.calls
+    provider_calls = [call for call in calls if call['cache'] == 'miss' and call['status'] == 'ok']
+    models = Counter((call['provider'], call['model']) for call in provider_calls if call['kind'] == 'chat')
+    provider, model = models.most_common(1)[0][0] if models else ('', '')
+    first_token = next((call['ttft'] for call in provider_calls if call['ttft'] is not None), None)
+
+    return GenerationRecord.objects.create(
+        content_type=ContentType.objects.get_for_model(generated_object),
+        object_id=generated_object.pk,
+        feature=feature,
+        prompt_hash=prompt_hash(feature, parameters),
+        parameters=parameters,
+        provider=provider,
+        model=model,
+        prompt_tokens=sum(call['prompt_tokens'] for call in provider_calls),
+        completion_tokens=sum(call['completion_tokens'] for call in provider_calls),
+        calls=len(calls),
+        cache_hits=sum(1 for call in calls if call['cache'] == 'hit'),
+        retries=sum(call['retries'] for call in calls),
+        routes=dict(Counter(call['route'] for call in calls if call['route'])),
+        latency=run.latency if run.latency is not None else time.monotonic() - run.started,
+        ttft=first_token,
+        cost=sum(call['cost'] or 0.0 for call in calls),
+    )
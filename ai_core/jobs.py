@@ -0,0 +1,181 @@
+"""
+Database-backed queue for AI generation jobs.
+
+Views call `enqueue_job` and return straight away with the job id; the
+`run_ai_worker` management command claims pending jobs one at a time and
+runs the registered handler, which writes the generated row and returns a
+small result dict that the status endpoint hands back to the browser.
+"""
+import datetime
+import logging
+
+from django.conf import settings
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+
+from ai_core.llm import LLMUnavailable, current_feature
+from ai_core.models import ExtractedText, GenerationJob, JobStatus
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register a function as the handler for jobs of the given kind."""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def job_queue_enabled():
+    """Whether views should queue generations instead of running them in the request."""
+    return getattr(settings, 'AI_JOB_QUEUE_ENABLED', False)
+
+
+def enqueue_job(user, kind, **payload):
+    """Create a pending job for the worker. The payload must be JSON serializable."""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    return GenerationJob.objects.create(user=user, kind=kind, payload=payload)
+
+
+def claim_next_job():
+    """
+    Move the oldest pending job to RUNNING and return it, or None if the queue is empty.
+    The conditional update makes the claim safe when several workers poll the same table.
+    """
+    while True:
+        job_id = (
+            GenerationJob.objects.filter(status=JobStatus.PENDING)
+            .order_by('created_at')
+            .values_list('pk', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+
+        claimed = GenerationJob.objects.filter(pk=job_id, status=JobStatus.PENDING).update(
+            status=JobStatus.RUNNING,
+            started_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return GenerationJob.objects.select_related('user').get(pk=job_id)
+        # Another worker claimed it first; try the next one
+
+
+def requeue_stale_jobs(stale_after, max_attempts):
+    """
+    Return jobs left RUNNING by a crashed worker to the queue, or fail them once they
+    have used up their attempts. Returns the number of (requeued, failed) jobs.
+    """
+    cutoff = timezone.now() - datetime.timedelta(seconds=stale_after)
+    stale = GenerationJob.objects.filter(status=JobStatus.RUNNING, started_at__lt=cutoff)
+    requeued = stale.filter(attempts__lt=max_attempts).update(status=JobStatus.PENDING, started_at=None)
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status=JobStatus.FAILED,
+        error="Job did not finish before the worker stopped.",
+        finished_at=timezone.now(),
+    )
+    return requeued, failed
+
+
+def run_job(job):
+    """
+    Run a claimed job and store its result or error. A job turned away by the rate
+    limiter or an open circuit breaker goes back to the queue until it has used up its
+    attempts; `job.retry_after` then tells the worker how long to back off.
+    """
+    handler = JOB_HANDLERS.get(job.kind)
+    feature = current_feature.set(f"job:{job.kind}")
+    try:
+        if handler is None:
+            raise ValueError(f"No handler registered for job kind '{job.kind}'")
+        job.result = handler(job.user, **job.payload)
+        job.status = JobStatus.COMPLETED
+    except LLMUnavailable as e:
+        if job.attempts < settings.AI_JOB_MAX_ATTEMPTS:
+            logger.warning(f"Requeueing {job.kind} job #{job.pk}: {e}")
+            job.status = JobStatus.PENDING
+            job.started_at = None
+            job.retry_after = e.retry_after
+            job.save(update_fields=['status', 'started_at'])
+            return job
+        logger.error(f"Error running {job.kind} job #{job.pk}: {e}")
+        job.error = str(e)
+        job.status = JobStatus.FAILED
+    except Exception as e:
+        logger.error(f"Error running {job.kind} job #{job.pk}: {e}")
+        job.error = str(e)
+        job.status = JobStatus.FAILED
+    finally:
+        current_feature.reset(feature)
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'finished_at'])
+    return job
+
+
+@job_handler('lesson_plan')
+def lesson_plan_job(user, topic, level, area, section_token=None):
+    from ai_core.views.content_creation import LessonPlanGeneratorView
+
+    lesson_plan = LessonPlanGeneratorView().create_lesson_plan(user, topic, level, area, section_token)
+    if lesson_plan is None:
+        raise RuntimeError("Failed to generate lesson plan.")
+    return {
+        'object_id': lesson_plan.id,
+        'html': lesson_plan.content,
+        'download_url': reverse('ai_core:download_lesson_plan', args=[lesson_plan.id]),
+    }
+
+
+@job_handler('math_lesson_note')
+def math_lesson_note_job(user, topic, level, section_token=None):
+    from ai_core.views.maths_assistant import MathLessonNoteGeneratorView
+
+    lesson_note = MathLessonNoteGeneratorView().create_lesson_note(user, topic, level, section_token)
+    if lesson_note is None:
+        raise RuntimeError("Failed to generate lesson note.")
+    return {
+        'object_id': lesson_note.id,
+        'html': lesson_note.content,
+        'download_url': reverse('ai_core:download_math_lesson', args=[lesson_note.id]),
+    }
+
+
+@job_handler('question_bank')
+def question_bank_job(user, class_level, topic, subject, resource_type, difficulty_level, number_of_questions,
+                      pdf_text=None, pdf_file=None, source_text_id=None):
+    from ai_core.views.class_notes import QuestionBankGeneratorView
+
+    source_text = ExtractedText.objects.filter(pk=source_text_id).first() if source_text_id else None
+    if source_text:
+        pdf_text = source_text.text
+    resource = QuestionBankGeneratorView().create_resource(
+        class_level, topic, subject, resource_type, difficulty_level, number_of_questions, pdf_text, pdf_file,
+        user=user, source_text=source_text,
+    )
+    if resource is None:
+        raise RuntimeError("Failed to generate questions.")
+    return {
+        'object_id': resource.id,
+        'html': resource.content,
+    }
+
+
+@job_handler('summary')
+def summary_job(user, text_content=None, source_text_id=None):
+    from ai_core.views.content_summerization import SummarizationView
+
+    source_text = ExtractedText.objects.filter(pk=source_text_id).first() if source_text_id else None
+    summarized_content, summary_stats = SummarizationView().create_summary(user, text_content, source_text)
+    return {
+        'object_id': summarized_content.id,
+        'html': summarized_content.content_html,
+        'download_url': reverse('ai_core:download_summarized_content_pdf', args=[summarized_content.id]),
+        'stats': summary_stats,
+    }
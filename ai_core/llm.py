@@ -0,0 +1,974 @@
+"""
+Single entry point for LLM and embedding provider calls.
+
+Every chat completion goes through `complete` and every embedding call through
+`embed`, so client-side admission control applies to the whole AI stack:
+
+* A circuit breaker per provider fails calls fast while the provider is down or
+  too slow, instead of letting every request wait for the client timeout.
+* The rate limiter keeps a requests/min and a tokens/min token bucket per
+  provider and model and queues waiting callers in-process by priority, so
+  interactive views are admitted ahead of background jobs.
+
+Breaker and bucket state live in the Django cache, so they are shared by all
+workers when a shared cache backend is configured.
+
+With `AI_PROVIDER_BACKEND = 'stub'` the provider calls are answered by
+`ai_core.stub_provider` instead, with the rest of the stack unchanged.
+
+Every call is also recorded (`record_call`): one JSON line on the
+`ai_core.llm.calls` logger and a rolling per-feature aggregate in
+`call_recorder`. The feature is the view or job that made the call, taken
+from `current_feature`.
+"""
+import contextvars
+import functools
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = ['groq', 'gemini']
+
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BATCH = 'batch'
+PRIORITIES = [PRIORITY_INTERACTIVE, PRIORITY_BATCH]  # highest priority first
+
+_default_priority = PRIORITY_INTERACTIVE
+
+call_logger = logging.getLogger('ai_core.llm.calls')
+
+# View name or job kind that calls are attributed to; set by LLMCallContextMiddleware and run_job
+current_feature = contextvars.ContextVar('ai_feature', default='unknown')
+_collected_calls = contextvars.ContextVar('ai_collected_calls', default=None)
+
+
+class LLMUnavailable(Exception):
+    """Base class for calls turned away before reaching the provider."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitExceeded(LLMUnavailable):
+    """Raised when a call cannot be admitted within its priority's wait budget."""
+
+
+class CircuitOpen(LLMUnavailable):
+    """Raised while a provider's circuit breaker is open and no cached response is available."""
+
+
+@dataclass
+class Completion:
+    text: str
+    provider: str
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0
+    cached: bool = False
+    ttft: float = None  # seconds to first token, for streamed (hedged) calls
+    route: str = 'primary'
+    tier: str = None  # model tier picked by `choose_model`, when the call named a task
+
+
+def estimate_tokens(text):
+    """Rough token count for Llama/Gemini style tokenizers (about four characters per token)."""
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+
+def set_default_priority(priority):
+    """Set the priority class for calls made by this process (the AI worker runs as batch)."""
+    global _default_priority
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {priority}")
+    _default_priority = priority
+
+
+@contextmanager
+def cache_lock(cache, key, timeout=1):
+    """Best-effort mutex across workers; cache.add is atomic on shared backends."""
+    lock_key = f"{key}:lock"
+    deadline = time.monotonic() + timeout
+    while not cache.add(lock_key, 1, timeout=5) and time.monotonic() < deadline:
+        time.sleep(0.005)
+    try:
+        yield
+    finally:
+        cache.delete(lock_key)
+
+
+def state_cache():
+    return caches[settings.AI_RATE_LIMIT_CACHE]
+
+
+class TokenBucketLimiter:
+    """
+    Requests/min and tokens/min token buckets per provider and model, with a bounded
+    priority wait queue in front of each bucket.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._queues = defaultdict(list)
+        self._sequence = itertools.count()
+        self._metrics = defaultdict(lambda: {
+            'admitted': 0,
+            'rejected': 0,
+            'max_queue_depth': 0,
+            'total_wait_seconds': 0.0,
+            'max_wait_seconds': 0.0,
+        })
+
+    def limits_for(self, provider, model):
+        provider_limits = settings.AI_RATE_LIMITS.get(provider, {})
+        return provider_limits.get(model) or provider_limits.get('default')
+
+    def acquire(self, provider, model, tokens, priority=None):
+        """
+        Block until the call is admitted and return the seconds spent waiting.
+        Raises RateLimitExceeded if the queue is full or the wait budget would be exceeded.
+        """
+        limits = self.limits_for(provider, model)
+        if not limits:
+            return 0.0
+
+        priority = priority or _default_priority
+        max_wait = settings.AI_RATE_LIMIT_MAX_WAIT[priority]
+        key = f"{provider}:{model}"
+        ticket = (PRIORITIES.index(priority), next(self._sequence))
+        started = time.monotonic()
+
+        with self._condition:
+            queue = self._queues[key]
+            metrics = self._metrics[key]
+            if len(queue) >= settings.AI_RATE_LIMIT_MAX_QUEUE:
+                metrics['rejected'] += 1
+                raise RateLimitExceeded(f"Too many calls waiting for {key}.")
+
+            heapq.heappush(queue, ticket)
+            metrics['max_queue_depth'] = max(metrics['max_queue_depth'], len(queue))
+            try:
+                while True:
+                    remaining = max_wait - (time.monotonic() - started)
+                    if queue[0] == ticket:
+                        wait = self._take(provider, model, tokens, limits)
+                        if wait == 0:
+                            heapq.heappop(queue)
+                            break
+                        if wait > remaining:
+                            metrics['rejected'] += 1
+                            raise RateLimitExceeded(f"Rate limit reached for {key}.", retry_after=wait)
+                        self._condition.wait(wait)
+                    else:
+                        if remaining <= 0:
+                            metrics['rejected'] += 1
+                            raise RateLimitExceeded(f"Timed out waiting for {key}.")
+                        self._condition.wait(remaining)
+            except BaseException:
+                if ticket in queue:
+                    queue.remove(ticket)
+                    heapq.heapify(queue)
+                raise
+            finally:
+                # Let the next caller in line check the bucket
+                self._condition.notify_all()
+
+            waited = time.monotonic() - started
+            metrics['admitted'] += 1
+            metrics['total_wait_seconds'] += waited
+            metrics['max_wait_seconds'] = max(metrics['max_wait_seconds'], waited)
+
+        if waited > 1:
+            logger.info(f"Rate limiter held a {priority} call to {key} for {waited:.1f}s")
+        return waited
+
+    def settle(self, provider, model, token_delta):
+        """Correct the tokens/min bucket once the real token usage of a call is known."""
+        limits = self.limits_for(provider, model)
+        if not limits or not token_delta:
+            return
+        with self._condition:
+            self._update_bucket(provider, model, limits, lambda state: state.update(tokens=state['tokens'] - token_delta))
+
+    def metrics(self):
+        """Snapshot of queue depth, admissions and wait times per provider and model."""
+        with self._condition:
+            snapshot = {}
+            for key, metrics in self._metrics.items():
+                admitted = metrics['admitted']
+                snapshot[key] = dict(
+                    metrics,
+                    queue_depth=len(self._queues[key]),
+                    avg_wait_seconds=round(metrics['total_wait_seconds'] / admitted, 3) if admitted else 0.0,
+                )
+            return snapshot
+
+    def _take(self, provider, model, tokens, limits):
+        """Take one request and `tokens` tokens if available; otherwise return the seconds to wait."""
+        rpm, tpm = limits['rpm'], limits['tpm']
+        # A call larger than the whole bucket waits for a full bucket rather than forever
+        cost = min(tokens, tpm)
+        wait = 0.0
+
+        def take(state):
+            nonlocal wait
+            if state['requests'] >= 1 and state['tokens'] >= cost:
+                state['requests'] -= 1
+                state['tokens'] -= cost
+            else:
+                wait = max(
+                    (1 - state['requests']) * 60 / rpm if state['requests'] < 1 else 0,
+                    (cost - state['tokens']) * 60 / tpm if state['tokens'] < cost else 0,
+                    0.01,
+                )
+
+        self._update_bucket(provider, model, limits, take)
+        return wait
+
+    def _update_bucket(self, provider, model, limits, update):
+        """Refill the bucket stored in the cache, apply `update` and write it back under a cache lock."""
+        cache = state_cache()
+        key = f"ai_rate_limit:{provider}:{model}"
+        with cache_lock(cache, key):
+            now = time.time()
+            rpm, tpm = limits['rpm'], limits['tpm']
+            state = cache.get(key) or {'requests': rpm, 'tokens': tpm, 'updated': now}
+            elapsed = max(0.0, now - state['updated'])
+            state = {
+                'requests': min(rpm, state['requests'] + elapsed * rpm / 60),
+                'tokens': min(tpm, state['tokens'] + elapsed * tpm / 60),
+                'updated': now,
+            }
+            update(state)
+            cache.set(key, state, timeout=120)
+
+
+rate_limiter = TokenBucketLimiter()
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open breaker for one provider. It opens when the failure rate over
+    the last `AI_CIRCUIT_WINDOW` calls reaches `AI_CIRCUIT_FAILURE_RATE` (calls slower than
+    `AI_CIRCUIT_SLOW_CALL` count as failures), rejects calls for `AI_CIRCUIT_COOL_DOWN`
+    seconds, then lets one probe call through: success closes it, failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.key = f"ai_circuit:{provider}"
+
+    def allow(self):
+        """Raise CircuitOpen unless the call may go to the provider."""
+        def check(state):
+            now = time.time()
+            if state['state'] == self.OPEN:
+                retry_after = state['opened_at'] + settings.AI_CIRCUIT_COOL_DOWN - now
+                if retry_after > 0:
+                    return retry_after
+                state.update(state=self.HALF_OPEN, probe_until=0)
+                logger.info(f"Circuit for {self.provider} is half-open; sending a probe call")
+            if state['state'] == self.HALF_OPEN:
+                # One probe at a time; a probe that never reports back expires after the timeout
+                if state['probe_until'] > now:
+                    return state['probe_until'] - now
+                state['probe_until'] = now + settings.AI_LLM_TIMEOUT
+            return None
+
+        retry_after = self._update(check)
+        if retry_after is not None:
+            raise CircuitOpen(f"{self.provider} is unavailable; failing fast.", retry_after=retry_after)
+
+    def record(self, success):
+        """Record the outcome of an admitted call and open or close the circuit accordingly."""
+        def update(state):
+            if state['state'] == self.HALF_OPEN:
+                if success:
+                    state.update(state=self.CLOSED, results=[])
+                    logger.info(f"Circuit for {self.provider} closed")
+                else:
+                    self._open(state)
+                return
+
+            results = (state['results'] + [success])[-settings.AI_CIRCUIT_WINDOW:]
+            state['results'] = results
+            failures = results.count(False)
+            if (state['state'] == self.CLOSED and len(results) >= settings.AI_CIRCUIT_MIN_CALLS
+                    and failures / len(results) >= settings.AI_CIRCUIT_FAILURE_RATE):
+                self._open(state)
+
+        self._update(update)
+
+    def state(self):
+        return state_cache().get(self.key) or self._initial_state()
+
+    def _open(self, state):
+        state.update(state=self.OPEN, opened_at=time.time(), results=[])
+        logger.warning(f"Circuit for {self.provider} opened for {settings.AI_CIRCUIT_COOL_DOWN}s")
+
+    def _initial_state(self):
+        return {'state': self.CLOSED, 'results': [], 'opened_at': 0, 'probe_until': 0}
+
+    def _update(self, update):
+        cache = state_cache()
+        with cache_lock(cache, self.key):
+            state = cache.get(self.key) or self._initial_state()
+            result = update(state)
+            cache.set(self.key, state, timeout=None)
+        return result
+
+
+circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(provider):
+    with _circuit_breakers_lock:
+        if provider not in circuit_breakers:
+            circuit_breakers[provider] = CircuitBreaker(provider)
+        return circuit_breakers[provider]
+
+
+def is_provider_failure(exc):
+    """Timeouts, connection errors, 429s and 5xx count against the breaker; other client errors don't."""
+    status = getattr(exc, 'status_code', None) or getattr(exc, 'code', None)
+    if isinstance(status, int) and 400 <= status < 500 and status != 429:
+        return False
+    return True
+
+
+def call_provider(provider, model, tokens, func, priority=None, max_retries=None, stats=None):
+    """
+    Call `func()` against `provider` once the circuit breaker and the rate limiter admit it,
+    and record the outcome on the breaker. Raises CircuitOpen or RateLimitExceeded otherwise.
+
+    Provider failures are retried up to `max_retries` times (AI_LLM_MAX_RETRIES by default)
+    with exponential backoff while the breaker still admits calls; the retry count is
+    stored in `stats['retries']` when a dict is given.
+    """
+    breaker = get_circuit_breaker(provider)
+    breaker.allow()
+    rate_limiter.acquire(provider, model, tokens, priority)
+
+    max_retries = settings.AI_LLM_MAX_RETRIES if max_retries is None else max_retries
+    for retry in itertools.count():
+        started = time.monotonic()
+        try:
+            result = func()
+        except Exception as e:
+            failure = is_provider_failure(e)
+            breaker.record(not failure)
+            if not failure or retry >= max_retries:
+                raise
+            logger.warning(f"Retrying {provider}:{model} call after error: {e}")
+            time.sleep(settings.AI_LLM_RETRY_BACKOFF * 2 ** retry)
+            breaker.allow()
+            if stats is not None:
+                stats['retries'] = retry + 1
+            continue
+        breaker.record(time.monotonic() - started < settings.AI_CIRCUIT_SLOW_CALL)
+        return result
+
+
+_groq_client = None
+_genai_clients = {}
+_client_lock = threading.Lock()
+
+
+def get_groq_client():
+    """Return the shared Groq client, creating it on first use."""
+    global _groq_client
+    with _client_lock:
+        if _groq_client is None:
+            from groq import Groq
+            _groq_client = Groq(
+                api_key=settings.GROQ_API_KEY,
+                timeout=settings.AI_LLM_TIMEOUT,
+                max_retries=0,  # call_provider retries, so the retries are counted
+            )
+        return _groq_client
+
+
+def get_genai_client(timeout=None):
+    """Return the shared Google GenAI client for a timeout (text generation's by default), creating it on first use."""
+    timeout = timeout or settings.AI_LLM_TIMEOUT
+    with _client_lock:
+        if timeout not in _genai_clients:
+            from google import genai
+            from google.genai import types
+            _genai_clients[timeout] = genai.Client(
+                api_key=settings.GEMINI_API_KEY,
+                http_options=types.HttpOptions(timeout=int(timeout * 1000)),  # milliseconds
+            )
+        return _genai_clients[timeout]
+
+
+def to_chat_messages(messages):
+    """Convert LangChain messages or (role, content) tuples into chat completion dicts."""
+    roles = {'human': 'user', 'ai': 'assistant', 'system': 'system'}
+    converted = []
+    for message in messages:
+        if isinstance(message, dict):
+            converted.append(message)
+        elif isinstance(message, tuple):
+            role, content = message
+            converted.append({'role': roles.get(role, role), 'content': content})
+        else:
+            converted.append({'role': roles.get(message.type, message.type), 'content': message.content})
+    return converted
+
+
+def message_text(message):
+    """Text of a chat message dict, skipping non-text parts such as images."""
+    content = message['content']
+    if isinstance(content, str):
+        return content
+    return "".join(part.get('text', '') for part in content if isinstance(part, dict))
+
+
+class Attempt:
+    """
+    One provider call within a completion. Streaming provider calls report the first
+    token through `mark_first_token` and stop early once `cancelled` is set.
+    """
+
+    def __init__(self, provider, model, signal):
+        self.provider = provider
+        self.model = model
+        self.signal = signal
+        self.cancelled = threading.Event()
+        self.started = time.monotonic()
+        self.first_token_at = None
+        self.result = None
+        self.error = None
+        self.done = False
+
+    @property
+    def ttft(self):
+        return self.first_token_at - self.started if self.first_token_at else None
+
+    def mark_first_token(self):
+        if self.first_token_at is None:
+            with self.signal:
+                self.first_token_at = time.monotonic()
+                self.signal.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self.signal:
+            self.result = result
+            self.error = error
+            self.done = True
+            self.signal.notify_all()
+
+
+def groq_chat(model, messages, temperature, attempt=None):
+    """Run a Groq chat completion; streams when an attempt is given. Returns (text, prompt_tokens, completion_tokens)."""
+    options = {} if temperature is None else {'temperature': temperature}
+    client = get_groq_client()
+    if attempt is None:
+        response = client.chat.completions.create(model=model, messages=messages, **options)
+        usage = response.usage
+        return (
+            response.choices[0].message.content,
+            usage.prompt_tokens if usage else 0,
+            usage.completion_tokens if usage else 0,
+        )
+
+    stream = client.chat.completions.create(model=model, messages=messages, stream=True, **options)
+    parts, usage = [], None
+    try:
+        for chunk in stream:
+            if attempt.cancelled.is_set():
+                return None
+            if chunk.choices and chunk.choices[0].delta.content:
+                attempt.mark_first_token()
+                parts.append(chunk.choices[0].delta.content)
+            x_groq = getattr(chunk, 'x_groq', None)
+            if x_groq is not None and getattr(x_groq, 'usage', None):
+                usage = x_groq.usage
+    finally:
+        stream.close()
+    return "".join(parts), usage.prompt_tokens if usage else 0, usage.completion_tokens if usage else 0
+
+
+def gemini_chat(model, messages, temperature, attempt=None):
+    """Run a Gemini text generation; streams when an attempt is given. Returns (text, prompt_tokens, completion_tokens)."""
+    from google.genai import types
+
+    system = "\n\n".join(message['content'] for message in messages if message['role'] == 'system')
+    contents = [
+        {'role': 'model' if message['role'] == 'assistant' else 'user', 'parts': [{'text': message['content']}]}
+        for message in messages if message['role'] != 'system'
+    ]
+    config = types.GenerateContentConfig(system_instruction=system or None, temperature=temperature)
+    client = get_genai_client()
+    if attempt is None:
+        response = client.models.generate_content(model=model, contents=contents, config=config)
+        usage = response.usage_metadata
+        return (
+            response.text,
+            (usage.prompt_token_count or 0) if usage else 0,
+            (usage.candidates_token_count or 0) if usage else 0,
+        )
+
+    stream = client.models.generate_content_stream(model=model, contents=contents, config=config)
+    parts, usage = [], None
+    try:
+        for chunk in stream:
+            if attempt.cancelled.is_set():
+                return None
+            if chunk.text:
+                attempt.mark_first_token()
+                parts.append(chunk.text)
+            usage = chunk.usage_metadata or usage
+    finally:
+        stream.close()
+    return (
+        "".join(parts),
+        (usage.prompt_token_count or 0) if usage else 0,
+        (usage.candidates_token_count or 0) if usage else 0,
+    )
+
+
+CHAT_PROVIDERS = {
+    'groq': groq_chat,
+    'gemini': gemini_chat,
+}
+
+
+def stub_backend():
+    return settings.AI_PROVIDER_BACKEND == 'stub'
+
+
+def chat_provider(provider):
+    """The function that runs chat calls for `provider` on the configured backend."""
+    if stub_backend():
+        from ai_core.stub_provider import stub_chat
+        return functools.partial(stub_chat, provider)
+    return CHAT_PROVIDERS[provider]
+
+
+def embed(texts, model, provider='gemini'):
+    """Embed several texts in one call through the circuit breaker and rate limiter; returns one vector per text."""
+    texts = list(texts)
+    tokens = sum(estimate_tokens(text) for text in texts)
+
+    def call():
+        if stub_backend():
+            from ai_core.stub_provider import stub_embed
+            return stub_embed(provider, texts)
+        result = get_genai_client(settings.AI_EMBEDDING_TIMEOUT).models.embed_content(model=model, contents=texts)
+        return [embedding.values for embedding in result.embeddings]
+
+    stats = {'retries': 0}
+    started = time.monotonic()
+    try:
+        vectors = call_provider(provider, model, tokens, call, stats=stats)
+    except Exception as e:
+        record_call(provider, model, kind='embedding', status=call_status(e),
+                    latency=time.monotonic() - started, retries=stats['retries'], error=e)
+        raise
+    record_call(provider, model, kind='embedding', prompt_tokens=tokens, latency=time.monotonic() - started,
+                retries=stats['retries'])
+    return vectors
+
+
+class LatencyTracker:
+    """Recent time-to-first-token samples per provider and model, used to pick the hedge delay."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=settings.AI_HEDGE_SAMPLES))
+
+    def record(self, provider, model, seconds):
+        with self._lock:
+            self._samples[f"{provider}:{model}"].append(seconds)
+
+    def hedge_delay(self, provider, model):
+        """The configured percentile of recent first-token latency, or the default until there are enough samples."""
+        with self._lock:
+            samples = sorted(self._samples[f"{provider}:{model}"])
+        if len(samples) < settings.AI_HEDGE_MIN_SAMPLES:
+            return settings.AI_HEDGE_DEFAULT_DELAY
+        percentile = samples[int(settings.AI_HEDGE_PERCENTILE * (len(samples) - 1))]
+        return max(settings.AI_HEDGE_MIN_DELAY, percentile)
+
+
+latency_tracker = LatencyTracker()
+routing_metrics = defaultdict(int)
+_routing_metrics_lock = threading.Lock()
+_hedge_executor = None
+
+
+def get_hedge_executor():
+    global _hedge_executor
+    with _client_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(
+                max_workers=settings.AI_HEDGE_MAX_WORKERS, thread_name_prefix='ai-hedge'
+            )
+        return _hedge_executor
+
+
+def run_attempt(attempt, messages, temperature, reserved, priority):
+    """Run one attempt through the circuit breaker and rate limiter and store its outcome on it."""
+    def call():
+        # The other attempt may have won while this one waited for the rate limiter
+        if attempt.cancelled.is_set():
+            return None
+        return chat_provider(attempt.provider)(attempt.model, messages, temperature, attempt)
+
+    try:
+        # No retries inside a hedge: the other attempt is the retry
+        result = call_provider(attempt.provider, attempt.model, reserved, call, priority, max_retries=0)
+        attempt.finish(result=result)
+    except Exception as e:
+        attempt.finish(error=e)
+
+
+def hedged_chat(provider, model, messages, temperature, reserved, priority):
+    """
+    Stream from the primary and, if it has not produced a first token within the hedge
+    delay (or fails first), send the same prompt to the secondary provider. The first
+    attempt to produce a token wins and the other one is cancelled.
+    Returns (result, winning attempt, route).
+    """
+    signal = threading.Condition()
+    secondary = settings.AI_HEDGE_SECONDARY
+    executor = get_hedge_executor()
+
+    primary = Attempt(provider, model, signal)
+    attempts = [primary]
+    executor.submit(with_call_context(run_attempt), primary, messages, temperature, reserved, priority)
+    hedge_at = primary.started + latency_tracker.hedge_delay(provider, model)
+    route = 'primary'
+
+    with signal:
+        while True:
+            winner = next((attempt for attempt in attempts if attempt.first_token_at or (attempt.done and not attempt.error)), None)
+            if winner is not None:
+                break
+            if len(attempts) == 1 and (primary.done or time.monotonic() >= hedge_at):
+                route = 'failover' if primary.done else 'hedged'
+                hedge = Attempt(secondary['provider'], secondary['model'], signal)
+                attempts.append(hedge)
+                executor.submit(with_call_context(run_attempt), hedge, messages, temperature, reserved, priority)
+                continue
+            if all(attempt.done for attempt in attempts):
+                raise primary.error
+            signal.wait(max(0.0, hedge_at - time.monotonic()) if len(attempts) == 1 else None)
+
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.cancelled.set()
+        while not winner.done:
+            signal.wait()
+
+    if primary.ttft is not None:
+        latency_tracker.record(provider, model, primary.ttft)
+    if winner.error:
+        raise winner.error
+    if route == 'hedged':
+        route = 'hedged_primary' if winner is primary else 'hedged_secondary'
+    return winner.result, winner, route
+
+
+model_route_metrics = defaultdict(lambda: {'calls': 0, 'total_latency': 0.0})
+
+
+def choose_model(task, prompt_tokens, expected_output_tokens=None):
+    """
+    Pick a (tier, model) for a task from `AI_TASK_ROUTES`. A task goes to the fast tier
+    when both its prompt and its expected output are within the task's small-call limits,
+    and to the task's default tier otherwise.
+    """
+    route = settings.AI_TASK_ROUTES.get(task)
+    if route is None:
+        raise ValueError(f"No model route configured for task '{task}'")
+
+    expected_output_tokens = expected_output_tokens or route.get('expected_output_tokens') or settings.AI_EXPECTED_OUTPUT_TOKENS
+    small = (
+        'small_prompt_tokens' in route
+        and prompt_tokens <= route['small_prompt_tokens']
+        and expected_output_tokens <= route.get('small_output_tokens', 0)
+    )
+    tier = 'fast' if small else route['tier']
+    return tier, settings.AI_MODEL_TIERS[tier]
+
+
+def complete(messages, model=None, temperature=0.7, provider='groq', priority=None, expected_output_tokens=None,
+             task=None):
+    """
+    Run a chat completion after admission by the circuit breaker and rate limiter and
+    return a Completion. `messages` may be a prompt string, chat message dicts, or
+    LangChain messages. A `temperature` of None leaves the provider default.
+
+    Pass either a `model`, or a `task` to let `choose_model` pick the model tier from the
+    prompt size and expected output length.
+
+    With `AI_ROUTING_MODE = 'hedged'`, text-only prompts are hedged against the
+    `AI_HEDGE_SECONDARY` provider (see `hedged_chat`).
+
+    Successful text-only completions are kept for `AI_FALLBACK_CACHE_TIMEOUT` seconds and
+    served (with `cached=True`) for the same prompt while the provider's circuit is open.
+
+    Calls are streamed so the time to first token can be recorded with the rest of the
+    call's metrics (see `record_call`).
+    """
+    if isinstance(messages, str):
+        messages = [{'role': 'user', 'content': messages}]
+    else:
+        messages = to_chat_messages(messages)
+
+    if provider not in CHAT_PROVIDERS:
+        raise ValueError(f"Unsupported chat provider: {provider}")
+
+    prompt_estimate = estimate_tokens("".join(message_text(message) for message in messages))
+    tier = None
+    if model is None:
+        if task is None:
+            raise ValueError("complete() needs a model or a task")
+        tier, model = choose_model(task, prompt_estimate, expected_output_tokens)
+        expected_output_tokens = expected_output_tokens or settings.AI_TASK_ROUTES[task].get('expected_output_tokens')
+
+    reserved = prompt_estimate + (expected_output_tokens or settings.AI_EXPECTED_OUTPUT_TOKENS)
+    fallback_key = fallback_cache_key(messages, model, temperature)
+    hedge = (
+        settings.AI_ROUTING_MODE == 'hedged' and fallback_key is not None
+        and settings.AI_HEDGE_SECONDARY['provider'] != provider
+    )
+    stats = {'retries': 0}
+    started = time.monotonic()
+    try:
+        if hedge:
+            (text, prompt_tokens, completion_tokens), attempt, route = hedged_chat(
+                provider, model, messages, temperature, reserved, priority
+            )
+        else:
+            def call():
+                attempt.started, attempt.first_token_at = time.monotonic(), None
+                return chat_provider(provider)(model, messages, temperature, attempt)
+
+            attempt = Attempt(provider, model, threading.Condition())
+            text, prompt_tokens, completion_tokens = call_provider(
+                provider, model, reserved, call, priority, stats=stats,
+            )
+            route = 'primary'
+        used_provider, used_model, ttft = attempt.provider, attempt.model, attempt.ttft
+    except CircuitOpen as e:
+        text = caches['default'].get(fallback_key) if fallback_key else None
+        if text is None:
+            record_call(provider, model, status=call_status(e),
+                        latency=time.monotonic() - started, retries=stats['retries'], tier=tier, error=e)
+            raise
+        logger.warning(f"Serving cached {model} completion while the {provider} circuit is open")
+        record_call(provider, model, cache='hit', latency=time.monotonic() - started, route='cached', tier=tier)
+        return Completion(text=text, provider=provider, model=model, cached=True, route='cached', tier=tier)
+    except Exception as e:
+        record_call(provider, model, status=call_status(e),
+                    latency=time.monotonic() - started, retries=stats['retries'], tier=tier, error=e)
+        raise
+    latency = time.monotonic() - started
+
+    if prompt_tokens or completion_tokens:
+        rate_limiter.settle(used_provider, used_model, prompt_tokens + completion_tokens - reserved)
+    if fallback_key:
+        caches['default'].set(fallback_key, text, timeout=settings.AI_FALLBACK_CACHE_TIMEOUT)
+
+    record_call(
+        used_provider, used_model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+        ttft=ttft, latency=latency, retries=stats['retries'], route=route, tier=tier,
+    )
+    with _routing_metrics_lock:
+        routing_metrics[route] += 1
+    if hedge:
+        ttft_note = f", first token {ttft:.2f}s" if ttft is not None else ""
+        logger.info(f"Routed {provider}:{model} call via {used_provider}:{used_model} ({route}) in {latency:.2f}s{ttft_note}")
+    if task is not None:
+        with _routing_metrics_lock:
+            metrics = model_route_metrics[f"{task}:{tier}"]
+            metrics['calls'] += 1
+            metrics['total_latency'] += latency
+        logger.info(
+            f"Model route for {task}: {tier} tier ({used_model}) for ~{prompt_estimate} prompt tokens "
+            f"and {expected_output_tokens or settings.AI_EXPECTED_OUTPUT_TOKENS} expected output tokens, "
+            f"answered in {latency:.2f}s with {completion_tokens} output tokens"
+        )
+
+    return Completion(
+        text=text,
+        provider=used_provider,
+        model=used_model,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        latency=latency,
+        ttft=ttft,
+        route=route,
+        tier=tier,
+    )
+
+
+def fallback_cache_key(messages, model, temperature):
+    """Cache key for the last good completion of a text-only prompt, or None for multimodal prompts."""
+    if any(not isinstance(message['content'], str) for message in messages):
+        return None
+    payload = json.dumps([model, temperature, messages], sort_keys=True)
+    return f"ai_completion:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+def with_call_context(func):
+    """
+    Wrap `func` to run in a copy of the caller's context, so calls made from executor
+    threads are attributed to the caller's feature.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+
+def call_status(exc):
+    """Outcome label for a failed call: 'rejected' when turned away before the provider, 'error' otherwise."""
+    return 'rejected' if isinstance(exc, LLMUnavailable) else 'error'
+
+
+def call_cost(model, prompt_tokens, completion_tokens):
+    """Estimated USD cost of a call from `AI_MODEL_PRICES`, or None for a model without a price."""
+    prices = settings.AI_MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices['input'] + completion_tokens * prices['output']) / 1_000_000
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers, or None if it is empty."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class CallRecorder:
+    """Rolling window of recent call records per feature, summarised for the LLM dashboard."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = defaultdict(lambda: deque(maxlen=settings.AI_CALL_STATS_WINDOW))
+        self._totals = defaultdict(lambda: {'calls': 0, 'tokens': 0, 'cost': 0.0})
+        self.started = time.time()
+
+    def add(self, record):
+        with self._lock:
+            self._records[record['feature']].append(record)
+            totals = self._totals[record['feature']]
+            totals['calls'] += 1
+            totals['tokens'] += record['prompt_tokens'] + record['completion_tokens']
+            totals['cost'] += record['cost'] or 0.0
+
+    def summary(self):
+        """Per-feature and per-model latency percentiles, token spend and outcome counts over the window."""
+        with self._lock:
+            records = {feature: list(window) for feature, window in self._records.items()}
+            totals = {feature: dict(totals) for feature, totals in self._totals.items()}
+
+        by_model = defaultdict(list)
+        for window in records.values():
+            for record in window:
+                if record['model']:
+                    by_model[f"{record['provider']}:{record['model']}"].append(record)
+
+        return {
+            'since': self.started,
+            'features': {
+                feature: dict(self.summarise(window), total=totals[feature])
+                for feature, window in sorted(records.items())
+            },
+            'models': {key: self.summarise(window) for key, window in sorted(by_model.items())},
+        }
+
+    @staticmethod
+    def summarise(records):
+        provider_calls = [record for record in records if record['cache'] == 'miss']
+        latencies = [record['latency'] for record in provider_calls if record['status'] == 'ok']
+        ttfts = [record['ttft'] for record in provider_calls if record['ttft'] is not None]
+        return {
+            'calls': len(records),
+            'errors': sum(1 for record in records if record['status'] == 'error'),
+            'rejected': sum(1 for record in records if record['status'] == 'rejected'),
+            'retries': sum(record['retries'] for record in records),
+            'cache_hits': len(records) - len(provider_calls),
+            'latency_p50': percentile(latencies, 0.5),
+            'latency_p95': percentile(latencies, 0.95),
+            'ttft_p50': percentile(ttfts, 0.5),
+            'ttft_p95': percentile(ttfts, 0.95),
+            'prompt_tokens': sum(record['prompt_tokens'] for record in records),
+            'completion_tokens': sum(record['completion_tokens'] for record in records),
+            'cost': sum(record['cost'] or 0.0 for record in records),
+        }
+
+
+call_recorder = CallRecorder()
+
+
+def record_call(provider, model, kind='chat', status='ok', cache='miss', prompt_tokens=0, completion_tokens=0,
+                ttft=None, latency=0.0, retries=0, route=None, tier=None, error=None):
+    """Log one LLM or embedding call as a JSON line and add it to `call_recorder`."""
+    record = {
+        'feature': current_feature.get(),
+        'kind': kind,
+        'provider': provider,
+        'model': model,
+        'tier': tier,
+        'route': route,
+        'status': status,
+        'cache': cache,
+        'prompt_tokens': prompt_tokens or 0,
+        'completion_tokens': completion_tokens or 0,
+        'ttft': round(ttft, 4) if ttft is not None else None,
+        'latency': round(latency, 4),
+        'retries': retries,
+        'cost': call_cost(model, prompt_tokens or 0, completion_tokens or 0) if cache == 'miss' else 0.0,
+    }
+    if error is not None:
+        record['error'] = str(error)[:200]
+    call_recorder.add(record)
+    collected = _collected_calls.get()
+    if collected is not None:
+        collected.append(record)
+    call_logger.info(json.dumps(record))
+
+
+@contextmanager
+def collect_calls():
+    """
+    Collect the records of the calls made inside the block into the yielded list, including
+    calls from executor threads started with `with_call_context`.
+    """
+    records = []
+    token = _collected_calls.set(records)
+    try:
+        yield records
+    finally:
+        _collected_calls.reset(token)
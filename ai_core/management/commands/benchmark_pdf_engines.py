@@ -0,0 +1,113 @@
+import multiprocessing
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_core.pdf_text import PDF_ENGINES, available_engines, open_pdf, page_text
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if os.uname().sysname == 'Darwin' else peak / 1024
+
+
+def measure_engine(engine, paths, repeat):
+    """Extract every file `repeat` times with one engine. Runs in a fresh process per engine."""
+    baseline = peak_rss_mb()
+    result = {'engine': engine, 'files': 0, 'failed': 0, 'pages': 0, 'chars': 0, 'seconds': 0.0}
+    for _ in range(repeat):
+        result.update(files=0, failed=0, pages=0, chars=0)
+        for path in paths:
+            started = time.perf_counter()
+            try:
+                document = open_pdf(path, engine)
+                try:
+                    for number in range(len(document)):
+                        result['chars'] += len(page_text(document, number))
+                        result['pages'] += 1
+                finally:
+                    document.close()
+                result['files'] += 1
+            except Exception:
+                result['failed'] += 1
+            result['seconds'] += time.perf_counter() - started
+    result['seconds'] /= repeat
+    result['memory_mb'] = round(peak_rss_mb() - baseline, 1)
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        "Extract every PDF in a directory with each installed text engine and report throughput, "
+        "peak memory and characters extracted, to choose AI_PDF_TEXT_ENGINE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="Directory of PDFs to extract, e.g. the handbooks.")
+        parser.add_argument(
+            "--engines",
+            help=f"Comma-separated engines to compare (default: all installed of {', '.join(PDF_ENGINES)}).",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=1,
+            help="Extract the files this many times per engine and report the average time.",
+        )
+        parser.add_argument(
+            "--min-chars-ratio",
+            type=float,
+            default=0.9,
+            help="An engine's output is acceptable when it extracts at least this share of the most characters "
+                 "any engine found.",
+        )
+
+    def handle(self, *args, **options):
+        directory = options["directory"]
+        if not os.path.isdir(directory):
+            raise CommandError(f"{directory} is not a directory.")
+        paths = sorted(
+            os.path.join(directory, name) for name in os.listdir(directory) if name.lower().endswith(".pdf")
+        )
+        if not paths:
+            raise CommandError(f"No PDFs in {directory}.")
+
+        installed = available_engines()
+        engines = [name.strip() for name in options["engines"].split(",")] if options["engines"] else installed
+        missing = [name for name in engines if name not in installed]
+        if missing:
+            raise CommandError(f"Not installed or unknown engines: {', '.join(missing)}")
+
+        self.stdout.write(f"Extracting {len(paths)} PDFs from {directory} with {', '.join(engines)}")
+        results = []
+        for engine in engines:
+            # A fresh process per engine, so peak memory is that engine's alone
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                result = pool.submit(measure_engine, engine, paths, options["repeat"]).result()
+            result['pages_per_second'] = round(result['pages'] / result['seconds'], 1) if result['seconds'] else None
+            results.append(result)
+            self.stdout.write(
+                f"{engine:<11} {result['files']} files ({result['failed']} failed), {result['pages']} pages, "
+                f"{result['chars']} chars in {result['seconds']:.2f}s: {result['pages_per_second']} pages/s, "
+                f"peak memory +{result['memory_mb']} MB"
+            )
+
+        most_chars = max(result['chars'] for result in results)
+        fewest_failed = min(result['failed'] for result in results)
+        acceptable = [
+            result for result in results
+            if result['failed'] == fewest_failed and result['chars'] >= options["min_chars_ratio"] * most_chars
+        ]
+        if not acceptable or not most_chars:
+            self.stdout.write(self.style.WARNING("No engine extracted acceptable text from these files."))
+            return
+        fastest = max(acceptable, key=lambda result: result['pages_per_second'] or 0)
+        self.stdout.write(self.style.SUCCESS(
+            f"Fastest engine with acceptable output: {fastest['engine']}. "
+            f"Set AI_PDF_TEXT_ENGINE={fastest['engine']} (currently {settings.AI_PDF_TEXT_ENGINE})."
+        ))
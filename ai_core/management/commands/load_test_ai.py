@@ -0,0 +1,392 @@
+import datetime
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from wsgiref.simple_server import WSGIRequestHandler
+
+import requests
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer
+from django.urls import reverse
+
+from ai_core import llm
+from ai_core.models import ClassLevel, DifficultyLevel, ExtractedText, GenerationJob, GenerationRecord, \
+    ResourceModel, ResourceType, SubjectChoices
+from core.models import LessonPlan, SummarizedContent
+
+SAMPLE_TEXT = (
+    "The Sierra Leone Company founded Freetown in 1792 as a settlement for freed slaves from Nova Scotia. "
+    "The colony became a centre for missionary education, and Fourah Bay College opened in 1827. "
+) * 40
+
+
+def seconds(value):
+    return "n/a" if value is None else f"{value}s"
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+class WorkerPoolApp:
+    """
+    WSGI wrapper that lets at most `workers` requests run at once, like a fixed pool of
+    gunicorn workers, and records how busy the pool was and how long requests queued for it.
+    """
+
+    def __init__(self, app, workers):
+        self.app = app
+        self.workers = workers
+        self.slots = threading.BoundedSemaphore(workers)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.busy_seconds = 0.0
+            self.queue_seconds = 0.0
+            self.requests = 0
+            self.busy = 0
+            self.peak_busy = 0
+
+    def __call__(self, environ, start_response):
+        queued = time.monotonic()
+        with self.slots:
+            started = time.monotonic()
+            with self.lock:
+                self.busy += 1
+                self.peak_busy = max(self.peak_busy, self.busy)
+            try:
+                response = self.app(environ, start_response)
+                try:
+                    # Render the body inside the slot so the pool covers the whole request
+                    return [b"".join(response)]
+                finally:
+                    if hasattr(response, 'close'):
+                        response.close()
+            finally:
+                finished = time.monotonic()
+                with self.lock:
+                    self.busy -= 1
+                    self.requests += 1
+                    self.busy_seconds += finished - started
+                    self.queue_seconds += started - queued
+
+    def snapshot(self, elapsed):
+        with self.lock:
+            return {
+                'workers': self.workers,
+                'saturation': round(self.busy_seconds / (elapsed * self.workers), 3) if elapsed else None,
+                'peak_busy_workers': self.peak_busy,
+                'avg_queue_wait': round(self.queue_seconds / self.requests, 3) if self.requests else None,
+            }
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the AI endpoints with a concurrency ramp and save the results as JSON. "
+        "By default it serves the app in-process with a fixed worker pool; run it with "
+        "AI_PROVIDER_BACKEND=stub to avoid spending API quota."
+    )
+
+    SCENARIOS = ['lesson_plan', 'query', 'questions', 'summary', 'lesson_plan_pdf', 'summary_pdf']
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            default="1,2,4,8",
+            help="Comma-separated concurrency steps of the ramp (virtual users per step).",
+        )
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=30.0,
+            help="Seconds to run each concurrency step.",
+        )
+        parser.add_argument(
+            "--scenarios",
+            default=",".join(self.SCENARIOS),
+            help=f"Comma-separated endpoints to drive: {', '.join(self.SCENARIOS)}.",
+        )
+        parser.add_argument(
+            "--base-url",
+            help="Target an already running server (sharing this database) instead of serving in-process.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Size of the in-process server's worker pool.",
+        )
+        parser.add_argument(
+            "--user-email",
+            default="loadtest@smartpikin.local",
+            help="User the virtual users log in as; created if it does not exist.",
+        )
+        parser.add_argument(
+            "--output",
+            help="Where to write the JSON results (default: load_test_results/ai_<timestamp>.json).",
+        )
+        parser.add_argument(
+            "--baseline",
+            help="A previous JSON result to compare throughput and p95 latency against.",
+        )
+        parser.add_argument(
+            "--allow-live",
+            action="store_true",
+            help="Allow running against the live Groq/GenAI providers.",
+        )
+
+    def handle(self, *args, **options):
+        if settings.AI_PROVIDER_BACKEND != 'stub' and not options["allow_live"]:
+            raise CommandError("Set AI_PROVIDER_BACKEND=stub, or pass --allow-live to spend real API quota.")
+
+        steps = [int(step) for step in options["concurrency"].split(",")]
+        scenarios = [name.strip() for name in options["scenarios"].split(",")]
+        unknown = set(scenarios) - set(self.SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        user = self.get_user(options["user_email"])
+        self.requests_plan = self.build_requests(user)
+        last_ids = self.last_generated_ids(user)
+
+        server = pool = None
+        base_url = options["base_url"]
+        if not base_url:
+            pool = WorkerPoolApp(WSGIHandler(), options["workers"])
+            server = ThreadedWSGIServer(("127.0.0.1", 0), QuietRequestHandler, allow_reuse_address=False)
+            server.set_app(pool)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f"http://127.0.0.1:{server.server_port}"
+        base_url = base_url.rstrip("/")
+        self.stdout.write(f"Load testing {base_url} ({settings.AI_PROVIDER_BACKEND} provider backend)")
+
+        results = {
+            'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'base_url': base_url,
+            'provider_backend': settings.AI_PROVIDER_BACKEND,
+            'routing_mode': settings.AI_ROUTING_MODE,
+            'duration_per_step': options["duration"],
+            'scenarios': scenarios,
+            'steps': [],
+        }
+        try:
+            for concurrency in steps:
+                if pool:
+                    pool.reset()
+                step = self.run_step(base_url, user, scenarios, concurrency, options["duration"])
+                if pool:
+                    step['server'] = pool.snapshot(step['elapsed'])
+                    step['rate_limits'] = llm.rate_limiter.metrics()
+                results['steps'].append(step)
+                self.report_step(step)
+        finally:
+            if server:
+                server.shutdown()
+                server.server_close()
+            self.delete_generated(user, last_ids)
+
+        output = options["output"] or os.path.join(
+            settings.BASE_DIR, "load_test_results", f"ai_{datetime.datetime.now():%Y%m%d_%H%M%S}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+
+        if options["baseline"]:
+            self.compare(results, options["baseline"])
+
+    def get_user(self, email):
+        user, _ = get_user_model().objects.get_or_create(
+            email=email, defaults={'first_name': 'Load', 'last_name': 'Test', 'role': 'admin'}
+        )
+        return user
+
+    def build_requests(self, user):
+        """(method, url name, url args, form data) for each scenario; the PDF downloads need a saved row."""
+        # Reused across runs, so each run does not leave (and pre-render) another pair of rows
+        lesson_plan, _ = LessonPlan.objects.get_or_create(
+            user=user, topic="Load test", level="JSS1", area="Urban",
+            defaults={'content': "<h1>Load test lesson plan</h1>"},
+        )
+        summary, _ = SummarizedContent.objects.get_or_create(
+            user=user, summarized_content="Load test summary",
+            defaults={'original_content': SAMPLE_TEXT, 'content_html': "<p>Load test summary</p>"},
+        )
+        return {
+            'lesson_plan': ('post', 'ai_core:lesson_plan_generator', [], {
+                'topic': "Fractions", 'level': "JSS1", 'area': "Urban",
+            }),
+            'query': ('post', 'ai_core:query', [], {
+                'query[]': ["Who led the Hut Tax War of 1898?", "Why was Freetown founded?"],
+            }),
+            'questions': ('post', 'ai_core:question_generator', [], {
+                'class_level': ClassLevel.choices[0][0], 'topic': "Fractions",
+                'subject': SubjectChoices.choices[0][0], 'resource_type': ResourceType.choices[0][0],
+                'difficulty_level': DifficultyLevel.choices[0][0], 'number_of_questions': 5,
+            }),
+            'summary': ('post', 'ai_core:teacher_summarization_form', [], {'content': SAMPLE_TEXT}),
+            'lesson_plan_pdf': ('get', 'ai_core:download_lesson_plan', [lesson_plan.id], None),
+            'summary_pdf': ('get', 'ai_core:download_summarized_content_pdf', [summary.id], None),
+        }
+
+    # Rows the scenarios save for the load-test user: generations and, with the job queue on, their jobs
+    GENERATED_MODELS = [LessonPlan, SummarizedContent, ResourceModel, GenerationJob]
+
+    def last_generated_ids(self, user):
+        """The newest id of each generated model before the run, to find the rows the run creates."""
+        last_ids = {
+            model: model.objects.filter(user=user).order_by('-pk').values_list('pk', flat=True).first() or 0
+            for model in self.GENERATED_MODELS
+        }
+        last_ids[ExtractedText] = ExtractedText.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        return last_ids
+
+    def delete_generated(self, user, last_ids):
+        """
+        Delete the rows the run's requests saved for `user`, with their generation records, and
+        the extracted texts created during the run that nothing references any more.
+        """
+        for model in self.GENERATED_MODELS:
+            generated = model.objects.filter(user=user, pk__gt=last_ids[model])
+            GenerationRecord.objects.filter(
+                content_type=ContentType.objects.get_for_model(model), object_id__in=generated.values('pk')
+            ).delete()
+            self.report_deleted(model, generated.delete())
+
+        unused_texts = ExtractedText.objects.filter(
+            pk__gt=last_ids[ExtractedText], resources__isnull=True, summaries__isnull=True
+        )
+        self.report_deleted(ExtractedText, unused_texts.delete())
+
+    def report_deleted(self, model, result):
+        deleted = result[1].get(model._meta.label, 0)
+        if deleted:
+            self.stdout.write(f"Deleted {deleted} {model._meta.verbose_name_plural} generated by the run")
+
+    def open_session(self, base_url, user):
+        """A requests session logged in as `user` with a CSRF token for POSTs."""
+        store = SessionStore()
+        store[SESSION_KEY] = str(user.pk)
+        store[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        store.save()
+
+        session = requests.Session()
+        session.cookies.set(settings.SESSION_COOKIE_NAME, store.session_key)
+        session.get(base_url + reverse('ai_core:lesson_plan_generator'), timeout=30)
+        session.headers['X-CSRFToken'] = session.cookies.get(settings.CSRF_COOKIE_NAME, '')
+        session.headers['Referer'] = base_url + "/"
+        return session
+
+    def run_step(self, base_url, user, scenarios, concurrency, duration):
+        """Run `concurrency` virtual users for `duration` seconds and summarise their requests."""
+        samples = []
+        samples_lock = threading.Lock()
+        sessions = [self.open_session(base_url, user) for _ in range(concurrency)]
+        started = time.monotonic()
+        deadline = started + duration
+
+        def virtual_user(index):
+            session = sessions[index]
+            sent = 0
+            while time.monotonic() < deadline:
+                scenario = scenarios[(index + sent) % len(scenarios)]
+                sent += 1
+                method, url_name, url_args, data = self.requests_plan[scenario]
+                request_started = time.monotonic()
+                try:
+                    response = session.request(
+                        method, base_url + reverse(url_name, args=url_args), data=data,
+                        allow_redirects=False, timeout=settings.AI_LLM_TIMEOUT * 4,
+                    )
+                    outcome = self.classify(response)
+                except requests.RequestException:
+                    outcome = 'error'
+                with samples_lock:
+                    samples.append((scenario, outcome, time.monotonic() - request_started))
+
+        threads = [threading.Thread(target=virtual_user, args=(index,)) for index in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        by_scenario = defaultdict(list)
+        for sample in samples:
+            by_scenario[sample[0]].append(sample)
+        return {
+            'concurrency': concurrency,
+            'elapsed': round(elapsed, 2),
+            **self.summarise(samples, elapsed),
+            'endpoints': {scenario: self.summarise(items, elapsed) for scenario, items in sorted(by_scenario.items())},
+        }
+
+    def classify(self, response):
+        """'ok', 'rejected' (shed by the rate limiter or circuit breaker) or 'error'."""
+        if response.status_code == 503:
+            return 'rejected'
+        if response.status_code in (301, 302):
+            # The AI middleware redirects back to the form; anything else (e.g. the login page) is a failure
+            location = response.headers.get('Location', '')
+            return 'error' if settings.LOGIN_URL in location else 'rejected'
+        return 'ok' if response.status_code < 400 else 'error'
+
+    def summarise(self, samples, elapsed):
+        latencies = sorted(latency for _, outcome, latency in samples if outcome == 'ok')
+        count = len(samples)
+        return {
+            'requests': count,
+            'throughput': round(len(latencies) / elapsed, 3) if elapsed else None,
+            'p50': round(percentile(latencies, 0.50), 3) if latencies else None,
+            'p95': round(percentile(latencies, 0.95), 3) if latencies else None,
+            'p99': round(percentile(latencies, 0.99), 3) if latencies else None,
+            'error_rate': round(sum(1 for sample in samples if sample[1] == 'error') / count, 3) if count else None,
+            'rejected_rate': round(sum(1 for sample in samples if sample[1] == 'rejected') / count, 3) if count else None,
+        }
+
+    def report_step(self, step):
+        server = step.get('server', {})
+        self.stdout.write(
+            f"concurrency {step['concurrency']:>3}: {step['requests']} requests, "
+            f"{step['throughput']} ok/s, p50 {seconds(step['p50'])}, p95 {seconds(step['p95'])}, "
+            f"p99 {seconds(step['p99'])}, errors {step['error_rate']}, rejected {step['rejected_rate']}"
+            + (f", saturation {server['saturation']}, avg queue wait {seconds(server['avg_queue_wait'])}" if server else "")
+        )
+        for scenario, summary in step['endpoints'].items():
+            self.stdout.write(
+                f"    {scenario:<16} {summary['requests']:>5} requests, p95 {seconds(summary['p95'])}, "
+                f"errors {summary['error_rate']}"
+            )
+
+    def compare(self, results, baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        baseline_steps = {step['concurrency']: step for step in baseline['steps']}
+        self.stdout.write(f"Compared with {baseline_path} ({baseline['started_at']}):")
+        for step in results['steps']:
+            previous = baseline_steps.get(step['concurrency'])
+            if not previous:
+                continue
+            self.stdout.write(
+                f"concurrency {step['concurrency']:>3}: throughput {previous['throughput']} -> {step['throughput']} ok/s, "
+                f"p95 {seconds(previous['p95'])} -> {seconds(step['p95'])}, errors {previous['error_rate']} -> {step['error_rate']}"
+            )
@@ -1,8 +1,8 @@
 import os
-from PyPDF2 import PdfReader
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from ai_core.models import DocumentChunk
+from ai_core.pdf_text import extract_pdf_text
 from ai_core.utils import get_embedding, embedding_to_bytes
 
 BATCH_SIZE = 100
@@ -39,8 +39,7 @@ class Command(BaseCommand):
         """
         Process a PDF file, extract text, split into chunks, generate embeddings, and store in the database.
         """
-        reader = PdfReader(pdf_path)
-        text = "".join([page.extract_text() for page in reader.pages])
+        text = extract_pdf_text(pdf_path)
 
         chunks = [text[i:i + 300] for i in range(0, len(text), 300)]
 
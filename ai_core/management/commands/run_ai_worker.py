@@ -0,0 +1,77 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ai_core import llm
+from ai_core.jobs import claim_next_job, requeue_stale_jobs, run_job
+from ai_core.models import JobStatus
+
+
+class Command(BaseCommand):
+    help = "Process queued AI generation jobs (lesson plans, lesson notes, question banks and summaries)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Process the jobs currently in the queue and exit instead of polling forever.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=settings.AI_WORKER_POLL_INTERVAL,
+            help="Seconds to wait between polls when the queue is empty.",
+        )
+        parser.add_argument(
+            "--max-jobs",
+            type=int,
+            default=0,
+            help="Exit after processing this many jobs (0 means no limit).",
+        )
+
+    def handle(self, *args, **options):
+        processed = 0
+        # Interactive requests from the web processes are admitted ahead of queued jobs
+        llm.set_default_priority(llm.PRIORITY_BATCH)
+        self.stdout.write("AI worker started. Waiting for jobs...")
+
+        try:
+            while True:
+                close_old_connections()
+
+                requeued, failed = requeue_stale_jobs(settings.AI_JOB_STALE_AFTER, settings.AI_JOB_MAX_ATTEMPTS)
+                if requeued or failed:
+                    self.stdout.write(self.style.WARNING(
+                        f"Recovered stale jobs: {requeued} requeued, {failed} failed."
+                    ))
+
+                job = claim_next_job()
+                if job is None:
+                    if options["once"]:
+                        break
+                    time.sleep(options["sleep"])
+                    continue
+
+                self.stdout.write(f"Running {job.kind} job #{job.pk}...")
+                job = run_job(job)
+                processed += 1
+                if job.status == JobStatus.PENDING:
+                    backoff = min(job.retry_after or options["sleep"], settings.AI_WORKER_MAX_BACKOFF)
+                    self.stdout.write(self.style.WARNING(
+                        f"Job #{job.pk} could not reach the AI provider and has been requeued; "
+                        f"backing off for {backoff:.0f}s."
+                    ))
+                    time.sleep(backoff)
+                elif job.error:
+                    self.stdout.write(self.style.ERROR(f"Job #{job.pk} failed: {job.error}"))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f"Job #{job.pk} completed."))
+
+                if options["max_jobs"] and processed >= options["max_jobs"]:
+                    break
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"AI worker stopped after {processed} job(s)."))
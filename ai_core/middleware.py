@@ -0,0 +1,57 @@
+import math
+
+from django.contrib import messages
+from django.http import JsonResponse
+from django.shortcuts import redirect
+
+from ai_core.llm import CircuitOpen, LLMUnavailable, current_feature
+
+
+class LLMUnavailableMiddleware:
+    """
+    Turn an LLMUnavailable (rate limited or circuit open) raised by an AI view into a 503
+    for JSON/AJAX callers, or a "try again" message and a redirect back to the form for browsers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, LLMUnavailable):
+            return None
+
+        retry_after = math.ceil(exception.retry_after or 30)
+        if isinstance(exception, CircuitOpen):
+            message = "The AI service is temporarily unavailable. Please try again in a few minutes."
+        else:
+            message = "The AI service is busy right now. Please try again in a little while."
+
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest' or 'application/json' in request.headers.get('accept', ''):
+            response = JsonResponse({'error': message}, status=503)
+        else:
+            messages.warning(request, message)
+            response = redirect(request.get_full_path())
+        response['Retry-After'] = str(retry_after)
+        return response
+
+
+class LLMCallContextMiddleware:
+    """Attribute the LLM calls made while handling a request to the view's URL name (see ai_core.llm.record_call)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = current_feature.set('unknown')
+        try:
+            return self.get_response(request)
+        finally:
+            current_feature.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        current_feature.set(match.view_name if match else view_func.__name__)
+        return None
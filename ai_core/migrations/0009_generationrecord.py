@@ -0,0 +1,41 @@
+# Generated by Django 5.1.15 on 2026-10-19 07:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_core', '0008_generationjob'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('feature', models.CharField(max_length=50)),
+                ('prompt_hash', models.CharField(max_length=64)),
+                ('parameters', models.JSONField(default=dict)),
+                ('provider', models.CharField(blank=True, max_length=20)),
+                ('model', models.CharField(blank=True, max_length=100)),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('calls', models.PositiveIntegerField(default=0)),
+                ('cache_hits', models.PositiveIntegerField(default=0)),
+                ('retries', models.PositiveIntegerField(default=0)),
+                ('routes', models.JSONField(default=dict)),
+                ('latency', models.FloatField(default=0.0)),
+                ('ttft', models.FloatField(blank=True, null=True)),
+                ('cost', models.FloatField(default=0.0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['prompt_hash', '-created_at'], name='ai_core_gen_prompt__60807f_idx'), models.Index(fields=['content_type', 'object_id'], name='ai_core_gen_content_649f2b_idx'), models.Index(fields=['feature', 'created_at'], name='ai_core_gen_feature_91a585_idx')],
+            },
+        ),
+    ]
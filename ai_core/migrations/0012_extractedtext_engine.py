@@ -0,0 +1,28 @@
+# Generated by Django 5.1.15 on 2026-10-19 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_core', '0011_extractedtext'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractedtext',
+            name='engine',
+            field=models.CharField(default='pypdf2', max_length=20),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='extractedtext',
+            name='sha256',
+            field=models.CharField(max_length=64),
+        ),
+        migrations.AlterUniqueTogether(
+            name='extractedtext',
+            unique_together={('sha256', 'engine')},
+        ),
+    ]
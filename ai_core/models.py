@@ -1,4 +1,6 @@
 from django.conf import settings
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from core.models import ClassLevel
 from django.utils.translation import gettext_lazy as _
@@ -73,7 +75,35 @@ class SubjectChoices(models.TextChoices):
     MATHEMATICS = "Mathematics", "Mathematics"
 
 
+class ExtractedText(models.Model):
+    """
+    Text extracted from an uploaded PDF, stored once per distinct file and extraction
+    engine and shared by every question bank and summary made from it. Written by
+    `ai_core.uploads.extracted_text`.
+    """
+    sha256 = models.CharField(max_length=64)  # SHA-256 of the uploaded bytes
+    engine = models.CharField(max_length=20)  # AI_PDF_TEXT_ENGINE library that extracted the text
+    text = models.TextField()
+    size = models.PositiveBigIntegerField(default=0)  # Upload size in bytes
+    uploads = models.PositiveIntegerField(default=1)  # Times this file has been uploaded
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('sha256', 'engine')]
+
+    def __str__(self):
+        return f"Extracted text {self.sha256[:12]} ({self.engine}, {self.size} bytes)"
+
+
 class ResourceModel(models.Model):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='resources',
+        null=True,
+        blank=True
+    )
     class_level = models.CharField(max_length=10, choices=ClassLevel.choices)
     topic = models.CharField(max_length=255)
     resource_type = models.CharField(max_length=30, choices=ResourceType.choices)
@@ -82,8 +112,87 @@ class ResourceModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     number_of_questions = models.PositiveIntegerField(default=5)
     pdf_file = models.FileField(upload_to='pdfs/', null=True, blank=True)  # Add this field
+    source_text = models.ForeignKey(
+        ExtractedText,
+        on_delete=models.SET_NULL,
+        related_name='resources',
+        null=True,
+        blank=True
+    )  # Text of the uploaded PDF the questions were grounded in
     subject = models.CharField(max_length=20, choices=SubjectChoices.choices,
                                default=SubjectChoices.ENGLISH)  # Added subject field
 
     def __str__(self):
         return f"{self.class_level} - {self.topic} ({self.resource_type} - {self.difficulty_level})"
+
+
+class JobStatus(models.TextChoices):
+    PENDING = 'Pending', _('Pending')
+    RUNNING = 'Running', _('Running')
+    COMPLETED = 'Completed', _('Completed')
+    FAILED = 'Failed', _('Failed')
+
+
+class GenerationJob(models.Model):
+    """A queued AI generation, picked up by the `run_ai_worker` management command."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='generation_jobs'
+    )
+    kind = models.CharField(max_length=50)  # e.g. "lesson_plan", "summary"
+    payload = models.JSONField(default=dict)  # Keyword arguments for the job handler
+    status = models.CharField(max_length=10, choices=JobStatus.choices, default=JobStatus.PENDING)
+    result = models.JSONField(blank=True, null=True)  # e.g. {"object_id": 1, "html": "..."}
+    error = models.TextField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.kind} job #{self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (JobStatus.COMPLETED, JobStatus.FAILED)
+
+
+class GenerationRecord(models.Model):
+    """
+    How a saved generation (lesson plan, question bank, summary, ...) was produced: the
+    model, the inputs and the token, latency and routing outcome of its LLM calls.
+    Written by `ai_core.generations.record_generation`.
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveBigIntegerField()
+    generated_object = GenericForeignKey('content_type', 'object_id')
+
+    feature = models.CharField(max_length=50)  # e.g. "lesson_plan", "question_bank", "summary"
+    prompt_hash = models.CharField(max_length=64)  # SHA-256 of the feature and parameters
+    parameters = models.JSONField(default=dict)  # Inputs of the generation; long texts are stored as hashes
+    provider = models.CharField(max_length=20, blank=True)
+    model = models.CharField(max_length=100, blank=True)  # Model that answered most of the calls
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    calls = models.PositiveIntegerField(default=0)  # LLM and embedding calls, cache hits included
+    cache_hits = models.PositiveIntegerField(default=0)
+    retries = models.PositiveIntegerField(default=0)
+    routes = models.JSONField(default=dict)  # Calls per route, e.g. {"primary": 6, "hedged_secondary": 1}
+    latency = models.FloatField(default=0.0)  # Seconds for the whole generation
+    ttft = models.FloatField(blank=True, null=True)  # Seconds to the first token of the first call
+    cost = models.FloatField(default=0.0)  # Estimated USD, from AI_MODEL_PRICES
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['prompt_hash', '-created_at']),
+            models.Index(fields=['content_type', 'object_id']),
+            models.Index(fields=['feature', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.feature} generation #{self.pk} ({self.model})"
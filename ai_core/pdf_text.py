@@ -0,0 +1,292 @@
+"""
+Text extraction for uploaded and local PDFs.
+
+`iter_pdf_pages` yields the text of each page in order, using the library named by
+`AI_PDF_TEXT_ENGINE` (see `PDF_ENGINES`; the `benchmark_pdf_engines` command
+compares them on real files). Files with more than
+`AI_PDF_EXTRACT_PARALLEL_PAGES` pages are split into ranges of
+`AI_PDF_EXTRACT_RANGE_PAGES` pages that are extracted in a process pool, since
+the pure Python engines would serialise on the GIL in a thread pool.
+`extract_uploaded_pdf_text` applies the upload size and page limits, and
+`pdf_text_metrics` reports pages per second for the metrics view.
+
+This module imports no models, so pool workers start without setting up Django.
+"""
+import importlib.util
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from PyPDF2 import PdfReader
+
+logger = logging.getLogger(__name__)
+
+
+class PDFLimitExceeded(ValueError):
+    """Raised when an uploaded PDF is larger or longer than the upload limits allow."""
+
+
+class PyPDF2Document:
+    module = 'PyPDF2'
+
+    def __init__(self, source):
+        self.reader = PdfReader(source)
+
+    def __len__(self):
+        return len(self.reader.pages)
+
+    def page_text(self, number):
+        return self.reader.pages[number].extract_text()
+
+    def close(self):
+        pass
+
+
+class PdfPlumberDocument:
+    module = 'pdfplumber'
+
+    def __init__(self, source):
+        import pdfplumber
+        self.pdf = pdfplumber.open(source)
+
+    def __len__(self):
+        return len(self.pdf.pages)
+
+    def page_text(self, number):
+        page = self.pdf.pages[number]
+        try:
+            return page.extract_text()
+        finally:
+            page.close()  # drop the page's parsed layout, which pdfplumber otherwise keeps
+
+    def close(self):
+        self.pdf.close()
+
+
+class PyMuPDFDocument:
+    module = 'fitz'
+
+    def __init__(self, source):
+        import fitz
+        if isinstance(source, (str, os.PathLike)):
+            self.document = fitz.open(source)
+        else:
+            self.document = fitz.open(stream=source.read(), filetype='pdf')
+
+    def __len__(self):
+        return self.document.page_count
+
+    def page_text(self, number):
+        return self.document[number].get_text()
+
+    def close(self):
+        self.document.close()
+
+
+# Text extraction libraries by AI_PDF_TEXT_ENGINE name, fastest first for "auto"
+PDF_ENGINES = {
+    'pymupdf': PyMuPDFDocument,
+    'pypdf2': PyPDF2Document,
+    'pdfplumber': PdfPlumberDocument,
+}
+
+
+def available_engines():
+    return [name for name, document in PDF_ENGINES.items() if importlib.util.find_spec(document.module)]
+
+
+def pdf_engine():
+    """The engine named by AI_PDF_TEXT_ENGINE; "auto" picks the fastest one installed."""
+    engine = settings.AI_PDF_TEXT_ENGINE
+    if engine == 'auto':
+        return available_engines()[0]
+    if engine not in PDF_ENGINES:
+        raise ValueError(f"Unknown AI_PDF_TEXT_ENGINE {engine!r}; choose one of {', '.join(PDF_ENGINES)} or auto.")
+    return engine
+
+
+def open_pdf(source, engine):
+    return PDF_ENGINES[engine](source)
+
+
+_metrics_lock = threading.Lock()
+extraction_metrics = {'documents': 0, 'parallel': 0, 'rejected': 0, 'pages': 0, 'seconds': 0.0}
+
+_pool_lock = threading.Lock()
+_pool = None
+
+
+def get_extraction_pool():
+    """Process pool shared by all extractions in this process, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn rather than fork: the web process runs thread pools that must not be forked mid-flight
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.AI_PDF_EXTRACT_WORKERS, mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+
+def reset_extraction_pool(broken_pool):
+    """Drop a broken pool so the next extraction starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is broken_pool:
+            _pool = None
+    broken_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def pdf_text_metrics():
+    with _metrics_lock:
+        metrics = dict(extraction_metrics)
+    metrics['pages_per_second'] = round(metrics['pages'] / metrics['seconds'], 1) if metrics['seconds'] else None
+    return metrics
+
+
+def page_text(document, number):
+    try:
+        return document.page_text(number) or ""
+    except Exception as e:  # one broken page should not lose the rest of the document
+        logger.warning(f"Skipping a PDF page whose text could not be extracted: {e}")
+        return ""
+
+
+def extract_page_range(path, start, stop, engine):
+    """Text of pages `start` to `stop - 1` of the PDF at `path`. Runs in the extraction pool."""
+    document = open_pdf(path, engine)
+    try:
+        return [page_text(document, number) for number in range(start, stop)]
+    finally:
+        document.close()
+
+
+def file_size(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    if getattr(source, 'size', None) is not None:
+        return source.size
+    position = source.tell()
+    size = source.seek(0, os.SEEK_END)
+    source.seek(position)
+    return size
+
+
+def _local_path(source):
+    """(path, is_temporary) of a file the pool workers can open themselves."""
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source), False
+    if hasattr(source, 'temporary_file_path'):
+        return source.temporary_file_path(), False
+    source.seek(0)
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as copy:
+        shutil.copyfileobj(source, copy)
+    return copy.name, True
+
+
+def _iter_serial(document):
+    try:
+        for number in range(len(document)):
+            yield page_text(document, number)
+    finally:
+        document.close()
+
+
+def _iter_parallel(source, page_count, engine):
+    path, is_temporary = _local_path(source)
+    pool = get_extraction_pool()
+    range_pages = settings.AI_PDF_EXTRACT_RANGE_PAGES
+    ranges = deque((start, min(start + range_pages, page_count)) for start in range(0, page_count, range_pages))
+    pending = deque()
+    try:
+        while ranges or pending:
+            # Keep a couple of ranges per worker queued, so memory stays flat on very long books
+            while ranges and len(pending) < settings.AI_PDF_EXTRACT_WORKERS * 2:
+                pending.append((ranges[0], pool.submit(extract_page_range, path, *ranges.popleft(), engine)))
+            page_range, future = pending.popleft()
+            try:
+                yield from future.result()
+            except BrokenProcessPool:
+                logger.error("The PDF extraction pool died; extracting the rest of the document in-process")
+                reset_extraction_pool(pool)
+                ranges.extendleft(reversed([page_range] + [queued for queued, _ in pending]))
+                pending.clear()
+                for start, stop in ranges:
+                    yield from extract_page_range(path, start, stop, engine)
+                ranges.clear()
+    finally:
+        for _, future in pending:
+            future.cancel()
+        if is_temporary:
+            os.unlink(path)
+
+
+def iter_pdf_pages(source, max_pages=None, max_bytes=None, engine=None):
+    """
+    Yield the text of each page of a PDF (a path or a file object) in order, with
+    `engine` or the configured one. Raises PDFLimitExceeded before extracting anything
+    when the file is over `max_bytes` or has more than `max_pages` pages.
+    """
+    engine = engine or pdf_engine()
+    if max_bytes and file_size(source) > max_bytes:
+        with _metrics_lock:
+            extraction_metrics['rejected'] += 1
+        raise PDFLimitExceeded(f"The PDF is larger than {max_bytes // (1024 * 1024)} MB.")
+
+    if not isinstance(source, (str, os.PathLike)):
+        source.seek(0)
+    document = open_pdf(source, engine)
+    page_count = len(document)
+    if max_pages and page_count > max_pages:
+        document.close()
+        with _metrics_lock:
+            extraction_metrics['rejected'] += 1
+        raise PDFLimitExceeded(f"The PDF has {page_count} pages; the limit is {max_pages}.")
+
+    parallel = page_count > settings.AI_PDF_EXTRACT_PARALLEL_PAGES and settings.AI_PDF_EXTRACT_WORKERS > 1
+    if parallel:
+        document.close()
+        if not isinstance(source, (str, os.PathLike)):
+            source.seek(0)
+        pages = _iter_parallel(source, page_count, engine)
+    else:
+        pages = _iter_serial(document)
+
+    started = time.monotonic()
+    extracted = 0
+    try:
+        for text in pages:
+            extracted += 1
+            yield text
+    finally:
+        elapsed = time.monotonic() - started
+        with _metrics_lock:
+            extraction_metrics['documents'] += 1
+            extraction_metrics['parallel'] += int(parallel)
+            extraction_metrics['pages'] += extracted
+            extraction_metrics['seconds'] += elapsed
+        logger.info(
+            f"Extracted {extracted} of {page_count} PDF pages with {engine} in {elapsed:.2f}s "
+            f"({extracted / elapsed if elapsed else 0:.1f} pages/s{', parallel' if parallel else ''})"
+        )
+
+
+def extract_pdf_text(source, max_pages=None, max_bytes=None, engine=None):
+    """All of a PDF's text, one page per line block."""
+    return "\n".join(text for text in iter_pdf_pages(source, max_pages, max_bytes, engine) if text)
+
+
+def extract_uploaded_pdf_text(uploaded_file, engine=None):
+    """Text of a user's PDF upload, within `AI_PDF_UPLOAD_MAX_BYTES` and `AI_PDF_UPLOAD_MAX_PAGES`."""
+    return extract_pdf_text(
+        uploaded_file, max_pages=settings.AI_PDF_UPLOAD_MAX_PAGES, max_bytes=settings.AI_PDF_UPLOAD_MAX_BYTES,
+        engine=engine,
+    )
@@ -0,0 +1,7 @@
+from django.db.models.signals import post_save
+
+from ai_core.documents import PDF_DOCUMENTS, schedule_prerender
+from django.apps import apps
+
+for label in PDF_DOCUMENTS:
+    post_save.connect(schedule_prerender, sender=apps.get_model(label), dispatch_uid=f"prerender_pdf:{label}")
@@ -0,0 +1,164 @@
+"""
+Deterministic local stand-in for the Groq/Gemini chat and GenAI embedding APIs.
+
+Selected with `AI_PROVIDER_BACKEND = 'stub'`, it lets the whole AI stack (rate
+limiter, circuit breakers, hedging, job queue, views) run and be benchmarked with
+no network and no API quota. Behaviour is configured by `AI_STUB`:
+
+* `chat.ttft` and `embedding.latency` are latency distributions:
+  `{'distribution': 'lognormal', 'median': .., 'sigma': ..}`,
+  `{'distribution': 'uniform', 'min': .., 'max': ..}` or `{'distribution': 'fixed', 'value': ..}`.
+* `chat.tokens_per_second` and `chat.output_tokens` set the generation speed and length.
+* `error_rate`, `rate_limit_rate` and `timeout_rate` inject 503s, 429s and timeouts.
+* `providers` overrides any of the above per provider, e.g. a slower Groq to exercise hedging.
+
+Response text and embeddings depend only on the input, so repeated runs are comparable;
+latency and error draws come from one random stream seeded by `seed`.
+"""
+import copy
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+
+from django.conf import settings
+
+EMBEDDING_DIMENSIONS = 768
+
+FILLER_WORDS = (
+    "learners explore the idea through examples drawn from daily life in Sierra Leone and West Africa "
+    "teachers guide discussion check understanding and connect each step to the syllabus and WAEC standards"
+).split()
+
+_random = None
+_random_lock = threading.Lock()
+
+
+class StubProviderError(Exception):
+    """Injected provider failure; `status_code` mirrors the HTTP status a real client would report."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def draw():
+    """Next value in [0, 1) from the shared, seeded random stream."""
+    global _random
+    with _random_lock:
+        if _random is None:
+            _random = random.Random(settings.AI_STUB.get('seed', 0))
+        return _random.random()
+
+
+def sample_latency(spec):
+    """Sample seconds from a latency distribution spec."""
+    distribution = spec.get('distribution', 'lognormal')
+    if distribution == 'fixed':
+        return spec['value']
+    if distribution == 'uniform':
+        return spec['min'] + draw() * (spec['max'] - spec['min'])
+    # Box-Muller from the shared stream keeps the draws reproducible
+    gauss = math.sqrt(-2 * math.log(1 - draw())) * math.cos(2 * math.pi * draw())
+    return spec['median'] * math.exp(spec.get('sigma', 0.5) * gauss)
+
+
+def stub_config(provider, kind):
+    """The `chat` or `embedding` settings for a provider, with its overrides applied."""
+    config = copy.deepcopy(settings.AI_STUB.get(kind, {}))
+    config.update(settings.AI_STUB.get('providers', {}).get(provider, {}).get(kind, {}))
+    return config
+
+
+def inject_failures(provider, config):
+    """Raise an injected timeout, rate limit or server error according to the configured rates."""
+    roll = draw()
+    timeout_rate = config.get('timeout_rate', 0.0)
+    rate_limit_rate = config.get('rate_limit_rate', 0.0)
+    error_rate = config.get('error_rate', 0.0)
+    if roll < timeout_rate:
+        time.sleep(settings.AI_LLM_TIMEOUT)
+        raise StubProviderError(f"Stub {provider} request timed out.")
+    if roll < timeout_rate + rate_limit_rate:
+        raise StubProviderError(f"Stub {provider} rate limit reached.", status_code=429)
+    if roll < timeout_rate + rate_limit_rate + error_rate:
+        raise StubProviderError(f"Stub {provider} internal server error.", status_code=503)
+
+
+def stub_text(messages, model, output_tokens):
+    """Markdown answer of about `output_tokens` tokens, determined by the prompt and model."""
+    from ai_core.llm import message_text
+
+    payload = json.dumps([model, messages], sort_keys=True)
+    rng = random.Random(hashlib.sha256(payload.encode('utf-8')).hexdigest())
+    # Multimodal messages (image_card) carry a list of parts; only their text feeds the answer
+    prompt_words = re.findall(r"[A-Za-z]{4,}", message_text(messages[-1]))[:40] if messages else []
+    vocabulary = prompt_words + list(FILLER_WORDS)
+
+    lines = [f"# Response from {model} (stub)", ""]
+    length = sum(len(line) for line in lines)
+    section = 0
+    while length < output_tokens * 4:
+        section += 1
+        lines += [f"## {section}. {rng.choice(vocabulary).capitalize()}", ""]
+        for _ in range(3):
+            sentence = " ".join(rng.choice(vocabulary) for _ in range(12))
+            lines.append(f"- {sentence.capitalize()}.")
+        lines.append("")
+        length = sum(len(line) for line in lines)
+    return "\n".join(lines)
+
+
+def stub_chat(provider, model, messages, temperature, attempt=None):
+    """
+    Chat provider with the same contract as `llm.groq_chat`: returns
+    (text, prompt_tokens, completion_tokens) and streams when an attempt is given.
+    """
+    from ai_core.llm import estimate_tokens, message_text
+
+    config = stub_config(provider, 'chat')
+    inject_failures(provider, config)
+
+    text = stub_text(messages, model, config.get('output_tokens', 600))
+    prompt_tokens = estimate_tokens("".join(message_text(message) for message in messages))
+    completion_tokens = estimate_tokens(text)
+    seconds_per_token = 1 / config.get('tokens_per_second', 250)
+
+    time.sleep(sample_latency(config.get('ttft', {'median': 0.4})))
+    if attempt is None:
+        time.sleep(completion_tokens * seconds_per_token)
+        return text, prompt_tokens, completion_tokens
+
+    # Stream in slices of about 20 tokens, as a real stream would arrive
+    step = 80
+    for start in range(0, len(text), step):
+        if attempt.cancelled.is_set():
+            return None
+        attempt.mark_first_token()
+        time.sleep(estimate_tokens(text[start:start + step]) * seconds_per_token)
+    return text, prompt_tokens, completion_tokens
+
+
+def stub_embedding(text):
+    """
+    Unit vector built by hashing words into buckets, so texts sharing words get similar
+    embeddings and cosine-similarity retrieval still ranks sensibly.
+    """
+    vector = [0.0] * EMBEDDING_DIMENSIONS
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.md5(word.encode('utf-8')).digest()
+        bucket = int.from_bytes(digest[:4], 'little') % EMBEDDING_DIMENSIONS
+        vector[bucket] += 1.0 if digest[4] % 2 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def stub_embed(provider, texts):
+    """Embed several texts with one simulated call; returns one vector per text."""
+    config = stub_config(provider, 'embedding')
+    inject_failures(provider, config)
+    time.sleep(sample_latency(config.get('latency', {'median': 0.05})))
+    return [stub_embedding(text) for text in texts]
@@ -1,3 +1,30 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from ai_core import llm
+from ai_core.stub_provider import stub_text
+
+STUB = {
+    'seed': 1,
+    'chat': {'ttft': {'distribution': 'fixed', 'value': 0}, 'tokens_per_second': 1000000, 'output_tokens': 50},
+    'embedding': {'latency': {'distribution': 'fixed', 'value': 0}},
+    'providers': {},
+}
+
+MULTIMODAL_MESSAGES = [{
+    'role': 'user',
+    'content': [
+        {'type': 'text', 'text': "Describe this report card for the parents"},
+        {'type': 'image_url', 'image_url': {'url': "data:image/png;base64,iVBORw0KGgo="}},
+    ],
+}]
+
+
+@override_settings(AI_PROVIDER_BACKEND='stub', AI_STUB=STUB, AI_ROUTING_MODE='single')
+class StubProviderTests(TestCase):
+    def test_stub_text_uses_the_text_parts_of_multimodal_messages(self):
+        text = stub_text(MULTIMODAL_MESSAGES, 'llama-3.2-11b-vision-preview', 50)
+        self.assertIn("(stub)", text)
+
+    def test_multimodal_completion_through_the_stub(self):
+        completion = llm.complete(MULTIMODAL_MESSAGES, model="llama-3.2-11b-vision-preview", temperature=None)
+        self.assertIn("Response from llama-3.2-11b-vision-preview (stub)", completion.text)
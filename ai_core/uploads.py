@@ -0,0 +1,94 @@
+"""
+Upload handlers that hash files while they stream in, and the extracted-text cache
+keyed by that hash.
+
+`FILE_UPLOAD_HANDLERS` uses the hashing variants of Django's memory and temporary
+file handlers, so every uploaded file carries a `sha256` attribute computed chunk by
+chunk as it is received. `extracted_text` looks that hash up in ExtractedText and only
+parses the PDF when the same bytes have not been extracted with the configured
+AI_PDF_TEXT_ENGINE before, so changing the engine re-extracts files on their next upload.
+"""
+import hashlib
+import logging
+import threading
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ai_core.models import ExtractedText
+from ai_core.pdf_text import extract_uploaded_pdf_text, pdf_engine
+
+logger = logging.getLogger(__name__)
+
+_metrics_lock = threading.Lock()
+extraction_cache_metrics = {'hits': 0, 'misses': 0}
+
+
+class SHA256UploadMixin:
+    """Hash the chunks the wrapped handler keeps and set `sha256` on the file it returns."""
+
+    def new_file(self, *args, **kwargs):
+        # Set before super(), which raises StopFutureHandlers once the handler takes the file
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        passed_on = super().receive_data_chunk(raw_data, start)
+        if passed_on is None:
+            self.sha256.update(raw_data)
+        return passed_on
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class SHA256MemoryFileUploadHandler(SHA256UploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class SHA256TemporaryFileUploadHandler(SHA256UploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def upload_sha256(uploaded_file):
+    """SHA-256 of an upload: the one computed while it streamed in, or computed now."""
+    digest = getattr(uploaded_file, 'sha256', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        sha256.update(chunk)
+    uploaded_file.sha256 = sha256.hexdigest()
+    return uploaded_file.sha256
+
+
+def extracted_text(uploaded_file):
+    """
+    The ExtractedText row for an uploaded PDF. A file uploaded before is not parsed
+    again by the same engine; a new one is extracted within the upload limits
+    (PDFLimitExceeded propagates) and stored once.
+    """
+    digest = upload_sha256(uploaded_file)
+    engine = pdf_engine()
+    updated = ExtractedText.objects.filter(sha256=digest, engine=engine).update(
+        uploads=F('uploads') + 1, last_used_at=timezone.now()
+    )
+    if updated:
+        with _metrics_lock:
+            extraction_cache_metrics['hits'] += 1
+        return ExtractedText.objects.get(sha256=digest, engine=engine)
+
+    with _metrics_lock:
+        extraction_cache_metrics['misses'] += 1
+    text = extract_uploaded_pdf_text(uploaded_file, engine)
+    try:
+        with transaction.atomic():
+            return ExtractedText.objects.create(sha256=digest, engine=engine, text=text, size=uploaded_file.size)
+    except IntegrityError:
+        # Another request extracted the same file at the same time
+        return ExtractedText.objects.get(sha256=digest, engine=engine)
@@ -9,8 +9,11 @@ from ai_core.views.content_creation import LessonPlanGeneratorView, download_les
     LessonPlanListView
 from ai_core.views.creative_writings import CreativeWritingAssistantView, download_writing_prompt_pdf, \
     CreativeWritingPromptListView
+from ai_core.views.export import export_content
 from ai_core.views.image_card import ReportCardUploadView
+from ai_core.views.jobs import job_status
 from ai_core.views.maths_assistant import MathLessonNoteGeneratorView, download_math_lesson, MathLessonNoteListView
+from ai_core.views.metrics import llm_dashboard, rate_limit_metrics
 
 app_name = 'ai_core'
 
@@ -34,5 +37,9 @@ urlpatterns = [
     path('report-card/', ReportCardWizardView.as_view(), name='report_card_wizard'),
     path('upload/', ReportCardUploadView.as_view(), name='upload_image'),
     path('generate-questions/', QuestionBankGeneratorView.as_view(), name='question_generator'),
+    path('jobs/<int:job_id>/', job_status, name='job_status'),
+    path('export/', export_content, name='export_content'),
+    path('metrics/', llm_dashboard, name='llm_dashboard'),
+    path('metrics/rate-limits/', rate_limit_metrics, name='rate_limit_metrics'),
 
 ]
@@ -1,5 +1,9 @@
 import pdfkit
-from django.http import HttpResponse
+import functools
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from django.core.cache import cache
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
 from django.template.loader import render_to_string
 from django.contrib import messages
 import datetime
@@ -7,35 +11,168 @@ import os
 import json
 import math
 import logging
-from PyPDF2 import PdfReader
+import re
+import threading
+import time
+from collections import defaultdict
 from django.conf import settings
+from django.db import connections
+from django.db.models import Q
 
-from google import genai
+from ai_core import llm
+from ai_core.llm import estimate_tokens
+from ai_core.pdf_text import PDFLimitExceeded, extract_pdf_text, extract_uploaded_pdf_text
 
 logger = logging.getLogger(__name__)
 
-# Configure Google GenAI client
-genai_client = genai.Client(api_key=settings.GEMINI_API_KEY)
-
 EMBEDDING_MODEL = "text-embedding-004"
 
 
 def get_embedding(text):
     """Get embedding vector from Google GenAI."""
-    result = genai_client.models.embed_content(
-        model=EMBEDDING_MODEL,
-        contents=text,
-    )
-    return result.embeddings[0].values
+    return llm.embed([text], EMBEDDING_MODEL)[0]
 
 
 def get_query_embedding(text):
     """Get embedding vector for a query from Google GenAI."""
-    result = genai_client.models.embed_content(
-        model=EMBEDDING_MODEL,
-        contents=text,
-    )
-    return result.embeddings[0].values
+    return llm.embed([text], EMBEDDING_MODEL)[0]
+
+
+def get_query_embeddings(texts):
+    """Get embedding vectors for several queries with a single Google GenAI call."""
+    return llm.embed(texts, EMBEDDING_MODEL)
+
+
+def split_text_by_tokens(text, max_tokens):
+    """
+    Split text into sections of at most max_tokens (estimated), breaking on paragraph
+    boundaries where possible and falling back to lines, then hard cuts for very long runs.
+    """
+    max_chars = max_tokens * 4
+    pieces = []
+    for paragraph in text.split("\n\n"):
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for line in paragraph.split("\n"):
+            pieces.extend(line[i:i + max_chars] for i in range(0, len(line), max_chars))
+
+    sections = []
+    current = ""
+    for piece in pieces:
+        if not piece.strip():
+            continue
+        if current and len(current) + len(piece) + 2 > max_chars:
+            sections.append(current)
+            current = piece
+        else:
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        sections.append(current)
+    return sections
+
+
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'how', 'in', 'is', 'it', 'of', 'on', 'or',
+    'that', 'the', 'this', 'to', 'was', 'what', 'when', 'where', 'which', 'who', 'why', 'with',
+}
+
+
+def text_terms(text):
+    """Lower-cased words of a text without stop words."""
+    return [word for word in re.findall(r"\w+", text.lower()) if word not in STOP_WORDS]
+
+
+def shingles(text, size=3):
+    """Set of word n-grams used to spot overlapping or near-duplicate chunks."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def drop_near_duplicates(texts, threshold):
+    """
+    Keep texts in order, dropping any whose word shingles overlap an already kept text by
+    at least `threshold` of the smaller shingle set (which also catches a chunk contained
+    in another). Returns (kept texts, number dropped).
+    """
+    kept, kept_shingles = [], []
+    for text in texts:
+        current = shingles(text)
+        if not current:
+            continue
+        duplicate = any(
+            len(current & other) / min(len(current), len(other)) >= threshold
+            for other in kept_shingles
+        )
+        if not duplicate:
+            kept.append(text)
+            kept_shingles.append(current)
+    return kept, len(texts) - len(kept)
+
+
+def select_relevant_passages(text, query, max_tokens):
+    """
+    Trim `text` to about `max_tokens` by splitting it into passages, scoring each against
+    the query terms (BM25-style term frequency and rarity), and keeping the best passages
+    in their original order.
+    """
+    passages = split_text_by_tokens(text, settings.AI_CONTEXT_PASSAGE_TOKENS)
+    query_terms = set(text_terms(query))
+    passage_terms = [text_terms(passage) for passage in passages]
+    document_frequency = {
+        term: sum(1 for terms in passage_terms if term in terms) for term in query_terms
+    }
+
+    def score(index):
+        terms = passage_terms[index]
+        return sum(
+            math.log(1 + terms.count(term)) * math.log((len(passages) + 1) / (document_frequency[term] + 0.5))
+            for term in query_terms if document_frequency[term]
+        )
+
+    selected, used = [], 0
+    # Ties keep the earlier passage, so text with no matching terms is trimmed from the end
+    for index in sorted(range(len(passages)), key=lambda index: (-score(index), index)):
+        tokens = estimate_tokens(passages[index])
+        if used + tokens > max_tokens:
+            continue
+        selected.append(index)
+        used += tokens
+    return "\n\n...\n\n".join(passages[index] for index in sorted(selected))
+
+
+def assemble_context(feature, query, chunks=(), document_text=None):
+    """
+    Fit retrieved chunks (most relevant first) and an optional uploaded document into the
+    token budget for `feature` in AI_CONTEXT_BUDGETS. Near-duplicate chunks are dropped,
+    chunks are kept in rank order until the chunk budget is spent, and a document over its
+    budget is cut down to its most relevant passages. Returns (chunk texts, document text).
+    """
+    budget = settings.AI_CONTEXT_BUDGETS[feature]
+    original_tokens = sum(estimate_tokens(chunk) for chunk in chunks) + estimate_tokens(document_text)
+
+    unique_chunks, duplicates = drop_near_duplicates(list(chunks), settings.AI_CONTEXT_DUPLICATE_THRESHOLD)
+    selected_chunks, chunk_tokens = [], 0
+    for chunk in unique_chunks:
+        tokens = estimate_tokens(chunk)
+        if chunk_tokens + tokens > budget.get('chunks', 0):
+            break
+        selected_chunks.append(chunk)
+        chunk_tokens += tokens
+
+    if document_text and estimate_tokens(document_text) > budget.get('document', 0):
+        document_text = select_relevant_passages(document_text, query, budget.get('document', 0))
+
+    used_tokens = chunk_tokens + estimate_tokens(document_text)
+    if used_tokens < original_tokens:
+        logger.info(
+            f"Context for {feature}: {used_tokens} of {original_tokens} tokens used, "
+            f"{original_tokens - used_tokens} saved ({duplicates} duplicate chunks, "
+            f"{len(unique_chunks) - len(selected_chunks)} chunks over budget)"
+        )
+    return selected_chunks, document_text
 
 
 def cosine_similarity(vec_a, vec_b):
@@ -61,8 +198,7 @@ def embedding_from_bytes(data):
 def process_pdf_in_batches(pdf_path, document_type, batch_size=100):
     from .models import DocumentChunk
 
-    reader = PdfReader(pdf_path)
-    text = "".join([page.extract_text() for page in reader.pages])
+    text = extract_pdf_text(pdf_path)
     chunks = [text[i:i + 300] for i in range(0, len(text), 300)]
 
     for i in range(0, len(chunks), batch_size):
@@ -83,8 +219,7 @@ def process_pdf_in_batches(pdf_path, document_type, batch_size=100):
 def update_pdf_data(pdf_path, document_type):
     from .models import DocumentChunk
 
-    reader = PdfReader(pdf_path)
-    text = "".join([page.extract_text() for page in reader.pages])
+    text = extract_pdf_text(pdf_path)
     chunks = [text[i:i + 300] for i in range(0, len(text), 300)]
 
     for chunk in chunks:
@@ -120,31 +255,609 @@ def search_similar_chunks(query, chunks=None, top_k=5):
     return [chunk for _, chunk in scored_chunks[:top_k]]
 
 
-def generate_pdf(html_content, output_filename='document.pdf', options=None):
+def search_similar_chunks_batch(query_embeddings, chunks=None, top_k=5):
+    """
+    Search for the top_k chunks for each query embedding in one pass over the chunks,
+    so each stored embedding is loaded and decoded once however many queries there are.
+    Returns one list of chunks per query embedding, in the same order.
+    """
+    from .models import DocumentChunk
+
+    if chunks is None:
+        chunks = DocumentChunk.objects.all()
+
+    scored_chunks = [[] for _ in query_embeddings]
+    for chunk in chunks:
+        try:
+            chunk_embedding = embedding_from_bytes(chunk.embedding)
+        except Exception:
+            continue
+        for scored, query_embedding in zip(scored_chunks, query_embeddings):
+            scored.append((cosine_similarity(query_embedding, chunk_embedding), chunk))
+
+    results = []
+    for scored in scored_chunks:
+        scored.sort(key=lambda x: x[0], reverse=True)
+        results.append([chunk for _, chunk in scored[:top_k]])
+    return results
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+rerank_metrics = defaultdict(float)
+
+
+def get_reranker():
+    """
+    Load the local cross-encoder on first use. Returns None when reranking is disabled or
+    sentence-transformers (requirements-ml.txt) is not installed.
+    """
+    global _reranker
+    if not settings.AI_RERANK_ENABLED:
+        return None
+    with _reranker_lock:
+        if _reranker is None:
+            try:
+                from sentence_transformers import CrossEncoder
+            except ImportError:
+                logger.warning("AI_RERANK_ENABLED is set but sentence-transformers is not installed; skipping rerank")
+                _reranker = False
+            else:
+                _reranker = CrossEncoder(settings.AI_RERANK_MODEL, device='cpu')
+        return _reranker or None
+
+
+def rerank_candidates(top_k):
+    """How many chunks to retrieve by cosine similarity before reranking down to `top_k`."""
+    return max(top_k, settings.AI_RERANK_CANDIDATES) if get_reranker() else top_k
+
+
+def rerank_chunks_batch(queries, candidate_lists, top_k):
+    """
+    Rerank each query's candidate chunks with the cross-encoder, scoring all (query, chunk)
+    pairs in one batched pass, and keep the best `top_k` per query. Without a reranker the
+    candidates are cut to `top_k` in their cosine order.
+    """
+    reranker = get_reranker()
+    if reranker is None:
+        return [candidates[:top_k] for candidates in candidate_lists]
+
+    pairs = [(query, chunk.chunk_text) for query, candidates in zip(queries, candidate_lists) for chunk in candidates]
+    if not pairs:
+        return [[] for _ in candidate_lists]
+
+    started = time.monotonic()
+    scores = iter(reranker.predict(pairs, batch_size=settings.AI_RERANK_BATCH_SIZE, show_progress_bar=False))
+    elapsed = time.monotonic() - started
+
+    results, dropped_tokens = [], 0
+    for candidates in candidate_lists:
+        candidate_scores = [next(scores) for _ in candidates]
+        # Ties keep the cosine order
+        ranked = sorted(range(len(candidates)), key=lambda index: (-candidate_scores[index], index))
+        results.append([candidates[index] for index in ranked[:top_k]])
+        dropped_tokens += sum(estimate_tokens(candidates[index].chunk_text) for index in ranked[top_k:])
+
+    # Compare the rerank cost with the prefill time of the candidates it kept out of the prompt
+    saved_seconds = dropped_tokens / settings.AI_LLM_PREFILL_TOKENS_PER_SECOND
+    with _reranker_lock:
+        rerank_metrics['calls'] += 1
+        rerank_metrics['pairs'] += len(pairs)
+        rerank_metrics['rerank_seconds'] += elapsed
+        rerank_metrics['dropped_tokens'] += dropped_tokens
+        rerank_metrics['estimated_llm_seconds_saved'] += saved_seconds
+    logger.info(
+        f"Reranked {len(pairs)} candidates for {len(queries)} queries in {elapsed * 1000:.0f}ms; "
+        f"{dropped_tokens} candidate tokens kept out of the prompt (~{saved_seconds * 1000:.0f}ms of LLM prefill)"
+    )
+    return results
+
+
+def rerank_chunks(query, candidates, top_k):
+    return rerank_chunks_batch([query], [candidates], top_k)[0]
+
+
+_retrieval_executor = None
+_lexical_executor = None
+_retrieval_lock = threading.Lock()
+retrieval_metrics = defaultdict(int)
+_retrieval_metrics_lock = threading.Lock()
+
+
+def get_retrieval_executor():
+    global _retrieval_executor
+    with _retrieval_lock:
+        if _retrieval_executor is None:
+            _retrieval_executor = ThreadPoolExecutor(
+                max_workers=settings.AI_RETRIEVAL_MAX_WORKERS, thread_name_prefix='ai-retrieval'
+            )
+        return _retrieval_executor
+
+
+def get_lexical_executor():
+    """
+    Pool for the keyword fallback, separate from the embedding searches: a search that
+    misses its deadline keeps its retrieval thread until it finishes, and the fallback
+    must not queue behind those abandoned searches when the pool is saturated.
+    """
+    global _lexical_executor
+    with _retrieval_lock:
+        if _lexical_executor is None:
+            _lexical_executor = ThreadPoolExecutor(
+                max_workers=settings.AI_RETRIEVAL_MAX_WORKERS, thread_name_prefix='ai-retrieval-lexical'
+            )
+        return _lexical_executor
+
+
+def lexical_search_chunks(query, chunks=None, top_k=5):
+    """
+    Rank chunks by how many of the query's terms they contain. Used when the embedding
+    search misses its deadline; needs one database query and no provider call.
+    """
+    from .models import DocumentChunk
+
+    if chunks is None:
+        chunks = DocumentChunk.objects.all()
+
+    terms = set(text_terms(query))
+    if not terms:
+        return []
+    match = Q()
+    for term in sorted(terms, key=len, reverse=True)[:settings.AI_RETRIEVAL_LEXICAL_TERMS]:
+        match |= Q(chunk_text__icontains=term)
+    candidates = chunks.filter(match).defer('embedding')[:settings.AI_RETRIEVAL_LEXICAL_SCAN]
+
+    scored_chunks = [(len(terms.intersection(text_terms(chunk.chunk_text))), index, chunk)
+                     for index, chunk in enumerate(candidates)]
+    scored_chunks.sort(key=lambda x: (-x[0], x[1]))
+    return [chunk for _, _, chunk in scored_chunks[:top_k]]
+
+
+def run_in_thread(func, *args):
+    """Run `func` on a retrieval thread and close that thread's database connections afterwards."""
     try:
-        pdf = pdfkit.from_string(html_content, False, options=options)
-        response = HttpResponse(pdf, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="{output_filename}"'
-        return response
-    except IOError as e:
+        return func(*args)
+    finally:
+        connections.close_all()
+
+
+def retrieve_chunks(query, chunks=None, top_k=5, budget=None):
+    """
+    Retrieve the top_k chunks for a query within a deadline of `budget` seconds
+    (`AI_RETRIEVAL_BUDGET` by default), so a slow embedding call or vector scan does not
+    hold up the LLM call that needs the context.
+
+    The embedding search runs on a retrieval thread; if it fails or misses the deadline the
+    chunks come from `lexical_search_chunks` on its own pool (within
+    `AI_RETRIEVAL_LEXICAL_BUDGET`), and if
+    that fails too the query goes ahead with no context. Each outcome is counted in
+    `retrieval_metrics`. Returns (chunks, mode) where mode is 'semantic', 'lexical' or 'none'.
+    """
+    budget = settings.AI_RETRIEVAL_BUDGET if budget is None else budget
+    executor = get_retrieval_executor()
+    candidates_k = rerank_candidates(top_k)
+    started = time.monotonic()
+
+    mode, candidates = 'semantic', None
+    future = executor.submit(llm.with_call_context(run_in_thread), search_similar_chunks, query, chunks, candidates_k)
+    try:
+        candidates = future.result(timeout=budget)
+    except FutureTimeout:
+        reason = 'timeout'
+    except Exception as e:
+        reason = 'error'
+        logger.warning(f"Embedding search failed for '{query[:50]}': {e}")
+
+    if candidates is None:
+        mode = 'lexical'
+        future = get_lexical_executor().submit(run_in_thread, lexical_search_chunks, query, chunks, candidates_k)
+        try:
+            candidates = future.result(timeout=settings.AI_RETRIEVAL_LEXICAL_BUDGET)
+        except Exception as e:
+            mode, candidates = 'none', []
+            logger.warning(f"Lexical search failed for '{query[:50]}': {e!r}")
+        logger.warning(
+            f"Retrieval for {llm.current_feature.get()} degraded to {mode} context after embedding search "
+            f"{reason} ({time.monotonic() - started:.3f}s, budget {budget:.3f}s)"
+        )
+
+    with _retrieval_metrics_lock:
+        retrieval_metrics[mode] += 1
+        if mode != 'semantic':
+            retrieval_metrics[f"semantic_{reason}"] += 1
+    return rerank_chunks(query, candidates, top_k), mode
+
+
+def _search_similar_chunks_for_queries(queries, chunks, top_k):
+    return search_similar_chunks_batch(get_query_embeddings(queries), chunks, top_k)
+
+
+def retrieve_chunks_batch(queries, chunks=None, top_k=5, budget=None):
+    """
+    `retrieve_chunks` for several queries: one embedding call and one pass over the chunks,
+    under the same deadline. If the embedding search fails or misses it, each query falls
+    back to `lexical_search_chunks`, run concurrently within `AI_RETRIEVAL_LEXICAL_BUDGET`;
+    queries whose keyword search does not finish in time get no context.
+    Returns (one list of chunks per query, mode).
+    """
+    budget = settings.AI_RETRIEVAL_BUDGET if budget is None else budget
+    executor = get_retrieval_executor()
+    candidates_k = rerank_candidates(top_k)
+    started = time.monotonic()
+
+    mode, candidate_lists = 'semantic', None
+    future = executor.submit(
+        llm.with_call_context(run_in_thread), _search_similar_chunks_for_queries, queries, chunks, candidates_k
+    )
+    try:
+        candidate_lists = future.result(timeout=budget)
+    except FutureTimeout:
+        reason = 'timeout'
+    except Exception as e:
+        reason = 'error'
+        logger.warning(f"Batch embedding search for {len(queries)} queries failed: {e}")
+
+    if candidate_lists is None:
+        mode = 'lexical'
+        lexical_executor = get_lexical_executor()
+        futures = [
+            lexical_executor.submit(run_in_thread, lexical_search_chunks, query, chunks, candidates_k) for query in queries
+        ]
+        wait(futures, timeout=settings.AI_RETRIEVAL_LEXICAL_BUDGET)
+        candidate_lists = []
+        for query, future in zip(queries, futures):
+            if future.done() and not future.exception():
+                candidate_lists.append(future.result())
+            else:
+                future.cancel()
+                candidate_lists.append([])
+        if not any(candidate_lists):
+            mode = 'none'
+        logger.warning(
+            f"Batch retrieval for {llm.current_feature.get()} degraded to {mode} context after embedding search "
+            f"{reason} ({time.monotonic() - started:.3f}s, budget {budget:.3f}s)"
+        )
+
+    with _retrieval_metrics_lock:
+        retrieval_metrics[mode] += len(queries)
+        if mode != 'semantic':
+            retrieval_metrics[f"semantic_{reason}"] += len(queries)
+    if mode == 'semantic':
+        return rerank_chunks_batch(queries, candidate_lists, top_k), mode
+    return [rerank_chunks(query, candidates, top_k) for query, candidates in zip(queries, candidate_lists)], mode
+
+
+def generate_sections(intro, sections, formatting, complete, cache_prefix, scope=None, refresh=()):
+    """
+    Generate the sections of a document as separate, smaller completions running concurrently,
+    then stitch them together in order.
+
+    Every section prompt shares the same header (intro, outline of all sections and formatting
+    instructions) so the sections stay consistent. `complete` takes a prompt and returns the
+    text or None. With a `scope` (one user's document), finished sections are cached under it by
+    prompt hash, so retrying the same generation only redoes the sections that failed or are
+    listed (by title) in `refresh`. Without one nothing is cached.
+    Returns the markdown, or None if any section could not be generated.
+    """
+    outline = "\n".join(f"- {title}" for title, _ in sections)
+    header = f"{intro}\n\nThe complete document has these sections:\n{outline}\n\n{formatting}"
+
+    def run(title, instructions):
+        prompt = (
+            f"{header}\n"
+            f"Write ONLY the section below. Start with the heading '### {title}' and do not repeat "
+            f"content that belongs to the other sections.\n\n"
+            f"### {title}\n{instructions}"
+        )
+        key = f"ai_section:{cache_prefix}:{scope}:{hashlib.sha256(prompt.encode('utf-8')).hexdigest()}"
+        if scope and title not in refresh:
+            cached = cache.get(key)
+            if cached:
+                llm.record_call(None, None, cache='hit', route='section_cache')
+                return cached
+        text = complete(prompt)
+        if text and scope:
+            cache.set(key, text, settings.AI_SECTION_CACHE_TIMEOUT)
+        return text
+
+    max_workers = max(1, min(settings.AI_SECTION_MAX_WORKERS, len(sections)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(llm.with_call_context(lambda section: run(*section)), sections))
+
+    if not all(results):
+        logger.error(f"{sum(1 for text in results if not text)} of {len(sections)} sections failed for {cache_prefix}")
         return None
+    return "\n\n".join(results)
+
+
+# Named render settings for the PDF downloads. `{date}` in an option is replaced by the document's date.
+PDF_DOCUMENT_OPTIONS = {
+    "enable-local-file-access": None,
+    "page-size": "A4",
+    "margin-top": "1in",
+    "margin-right": "1in",
+    "margin-bottom": "1in",
+    "margin-left": "1in",
+    "encoding": "UTF-8",
+    "dpi": 300,
+    "orientation": "Portrait",
+    "zoom": "1.1",
+    "footer-right": "[page] of [topage]",
+    "header-left": "Generated on {date}",
+    "footer-font-size": "10",
+    "header-font-size": "10",
+    "print-media-type": None,
+    "minimum-font-size": 12,
+    "disable-smart-shrinking": None,
+}
+
+PDF_PROFILES = {
+    'default': {'engine': 'pdfkit', 'options': {"enable-local-file-access": None}},
+    'lesson_plan': {'engine': 'weasyprint', 'options': None},
+    'math_lesson_note': {
+        'engine': 'pdfkit',
+        'options': {**PDF_DOCUMENT_OPTIONS, "zoom": "1.2", "no-outline": None, "footer-left": "Math Lesson Plan"},
+    },
+    'writing_prompt': {
+        'engine': 'pdfkit',
+        'options': {**PDF_DOCUMENT_OPTIONS, "footer-left": "Creative Writing Prompt"},
+    },
+    'application': {
+        'engine': 'pdfkit',
+        'options': {**PDF_DOCUMENT_OPTIONS, "footer-left": "Application Details"},
+    },
+}
+
+
+class PDFRenderBusy(IOError):
+    """Raised when a render cannot start or finish within the PDF pool's queue limit or timeout."""
+
+
+_pdf_cache_lock = threading.Lock()
+_pdf_pool_lock = threading.Lock()
+_pdf_executor = None
+_pdf_pending = 0
+_pdf_in_flight = {}  # cache key -> Future, so concurrent requests for the same PDF share one render
+pdf_cache_metrics = defaultdict(int)
+pdf_render_metrics = defaultdict(lambda: {'renders': 0, 'total_time': 0.0, 'max_time': 0.0, 'total_bytes': 0,
+                                          'errors': 0, 'rejected': 0, 'timeouts': 0})
+
+
+def pdf_profile(name, date=None):
+    """(engine, options) of a named profile, with `date` (today by default) filled in."""
+    profile = PDF_PROFILES[name]
+    options = profile['options']
+    if options:
+        date = date or datetime.datetime.now().strftime('%Y-%m-%d')
+        options = {key: value.format(date=date) if isinstance(value, str) else value for key, value in options.items()}
+    return profile['engine'], options
+
+
+def render_pdf(html_content, engine='pdfkit', options=None, base_url=None):
+    """Render HTML to PDF bytes with wkhtmltopdf (pdfkit) or WeasyPrint."""
+    if engine == 'weasyprint':
+        import weasyprint
+        return weasyprint.HTML(string=html_content, base_url=base_url).write_pdf()
+    return pdfkit.from_string(html_content, False, options=options)
+
+
+def pdf_cache_key(html_content, engine='pdfkit', options=None, base_url=None):
+    """SHA-256 of the rendered HTML and everything else that affects the PDF."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([engine, options, base_url], sort_keys=True, default=str).encode('utf-8'))
+    digest.update(html_content.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _pdf_cache_entries(directory):
+    """Cached PDFs, and the resized images they embed (ai_core.documents.image_file_url) under `images/`."""
+    with os.scandir(directory) as scan:
+        for entry in scan:
+            if entry.name.endswith('.pdf') and entry.is_file():
+                yield entry
+    try:
+        with os.scandir(os.path.join(directory, 'images')) as scan:
+            for entry in scan:
+                if not entry.name.endswith('.tmp') and entry.is_file():
+                    yield entry
+    except FileNotFoundError:
+        pass
+
+
+def evict_pdf_cache(directory, max_bytes, keep=None):
+    """
+    Delete the least recently used PDFs and image copies, except `keep`, until the cache
+    directory fits in `max_bytes`.
+    """
+    entries = []
+    total = 0
+    for entry in _pdf_cache_entries(directory):
+        if entry.path != keep:
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        pdf_cache_metrics['evictions'] += 1
 
 
-import PyPDF2
-from io import BytesIO
+def cached_pdf(html_content, profile='default', base_url=None, date=None):
+    """
+    Path and cache key of the PDF for this HTML and profile, rendering it only when it is
+    not in `AI_PDF_CACHE_DIR` yet. Files are named by content hash, so a changed document
+    gets a new file and old ones age out under the `AI_PDF_CACHE_MAX_BYTES` limit; hits
+    refresh the file's mtime so eviction is least recently used.
+    """
+    engine, options = pdf_profile(profile, date)
+    key = pdf_cache_key(html_content, engine, options, base_url)
+    directory = settings.AI_PDF_CACHE_DIR
+    path = os.path.join(directory, f"{key}.pdf")
+    try:
+        os.utime(path)
+        pdf_cache_metrics['hits'] += 1
+        return path, key
+    except FileNotFoundError:
+        pass
+
+    metrics = pdf_render_metrics[profile]
+    started = time.monotonic()
+    try:
+        pdf = render_pdf(html_content, engine, options, base_url)
+    except Exception:
+        metrics['errors'] += 1
+        raise
+    elapsed = time.monotonic() - started
+    metrics['renders'] += 1
+    metrics['total_time'] += elapsed
+    metrics['max_time'] = max(metrics['max_time'], elapsed)
+    metrics['total_bytes'] += len(pdf)
+    logger.info(f"Rendered {profile} PDF with {engine} in {elapsed:.2f}s ({len(pdf)} bytes)")
+
+    os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.{threading.get_ident()}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(pdf)
+    os.replace(temporary, path)  # atomic, so readers never see a partial file
+    pdf_cache_metrics['misses'] += 1
+
+    with _pdf_cache_lock:
+        evict_pdf_cache(directory, settings.AI_PDF_CACHE_MAX_BYTES - len(pdf), keep=path)
+    return path, key
+
+
+def get_pdf_executor():
+    global _pdf_executor
+    with _pdf_pool_lock:
+        if _pdf_executor is None:
+            _pdf_executor = ThreadPoolExecutor(max_workers=settings.AI_PDF_MAX_WORKERS, thread_name_prefix='pdf-render')
+        return _pdf_executor
+
+
+def _release_pdf_slot(key, future):
+    global _pdf_pending
+    with _pdf_pool_lock:
+        _pdf_pending -= 1
+        _pdf_in_flight.pop(key, None)
+
+
+def submit_pdf_task(key, profile, func, *args):
+    """
+    Run `func(*args)` on the PDF pool within the `AI_PDF_MAX_QUEUE` bound and return its
+    Future; tasks submitted under the same `key` while one is in flight share it. Raises
+    PDFRenderBusy when the queue is full.
+    """
+    global _pdf_pending
+    executor = get_pdf_executor()
+    with _pdf_pool_lock:
+        if key in _pdf_in_flight:
+            return _pdf_in_flight[key]
+        if _pdf_pending >= settings.AI_PDF_MAX_QUEUE:
+            pdf_render_metrics[profile]['rejected'] += 1
+            raise PDFRenderBusy(f"{_pdf_pending} PDF renders are already queued")
+        _pdf_pending += 1
+        future = executor.submit(func, *args)
+        _pdf_in_flight[key] = future
+    future.add_done_callback(functools.partial(_release_pdf_slot, key))
+    return future
+
+
+def submit_pdf(html_content, profile='default', base_url=None, date=None):
+    """
+    Queue a render on the PDF pool and return a Future of (path, cache key). At most
+    `AI_PDF_MAX_WORKERS` wkhtmltopdf/WeasyPrint renders run at once per process; raises
+    PDFRenderBusy when `AI_PDF_MAX_QUEUE` renders are already waiting or running.
+    """
+    engine, options = pdf_profile(profile, date)
+    key = pdf_cache_key(html_content, engine, options, base_url)
+    return submit_pdf_task(key, profile, cached_pdf, html_content, profile, base_url, date)
+
+
+def generate_pdf(html_content, profile='default', base_url=None, timeout=None, date=None):
+    """
+    Render (or fetch from the cache) the PDF for `html_content` with a named profile from
+    `PDF_PROFILES` on the shared render pool. Returns (path, cache key). Raises
+    PDFRenderBusy if the render does not finish within `timeout` seconds
+    (`AI_PDF_RENDER_TIMEOUT` by default); it carries on in the background and lands in the
+    cache for the next request. Render errors (IOError from wkhtmltopdf) propagate.
+    """
+    timeout = settings.AI_PDF_RENDER_TIMEOUT if timeout is None else timeout
+    future = submit_pdf(html_content, profile, base_url, date)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        pdf_render_metrics[profile]['timeouts'] += 1
+        raise PDFRenderBusy(f"{profile} PDF render did not finish within {timeout:.0f}s")
+
+
+def pdf_metrics():
+    """Render count, average/max time and average size per profile, and cache counters."""
+    return {
+        'cache': dict(pdf_cache_metrics),
+        'queued': _pdf_pending,
+        'profiles': {
+            profile: dict(
+                metrics,
+                avg_time=round(metrics['total_time'] / metrics['renders'], 3) if metrics['renders'] else None,
+                avg_bytes=metrics['total_bytes'] // metrics['renders'] if metrics['renders'] else None,
+            )
+            for profile, metrics in list(pdf_render_metrics.items())
+        },
+    }
+
+
+def pdf_response(request, html_content, filename, profile='default', base_url=None, date=None):
+    """
+    Serve the PDF for `html_content` as a download through `generate_pdf`, with the cache
+    key as ETag so a browser that already has it gets a 304. Answers 503 with Retry-After
+    while the render pool is saturated. Render errors propagate to the caller.
+    """
+    def open_pdf():
+        try:
+            return open(path, 'rb')
+        except FileNotFoundError:
+            # Evicted by a concurrent render since the cache hit; render it again
+            return open(generate_pdf(html_content, profile, base_url, date=date)[0], 'rb')
+
+    try:
+        path, key = generate_pdf(html_content, profile, base_url, date=date)
+        return pdf_file_response(request, open_pdf, key, filename)
+    except PDFRenderBusy as e:
+        logger.warning(f"PDF download deferred: {e}")
+        response = HttpResponse("The PDF is still being prepared. Please try again in a moment.", status=503)
+        response['Retry-After'] = '10'
+        return response
+
+
+def pdf_file_response(request, open_file, key, filename):
+    """Download response for a rendered PDF with its cache key as ETag; 304 when the browser already has it."""
+    etag = f'"{key}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open_file(), as_attachment=True, filename=filename, content_type='application/pdf')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=0, must-revalidate'
+    return response
+
 
 def extract_text_from_pdf(pdf_file):
     """
     Extracts text from a PDF file.
     :param pdf_file: Uploaded PDF file
     :return: Extracted text as a string
+    :raises PDFLimitExceeded: when the upload is over the size or page limit
     """
     try:
-        reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text()
-        return text
+        return extract_uploaded_pdf_text(pdf_file)
+    except PDFLimitExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error extracting text from PDF: {e}")
         return None
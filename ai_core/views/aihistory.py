@@ -1,16 +1,20 @@
 
-import os
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from django.http import JsonResponse
 from django.views import View
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_groq import ChatGroq
-from ai_core.utils import search_similar_chunks
+from ai_core import llm
+from ai_core.llm import LLMUnavailable
+from ai_core.utils import assemble_context, retrieve_chunks, retrieve_chunks_batch
 from ai_core.models import DocumentChunk
 
-# Set up LangChain Groq with Llama
+logger = logging.getLogger(__name__)
+
 from django.conf import settings
-os.environ["GROQ_API_KEY"] = settings.GROQ_API_KEY
-chat = ChatGroq(temperature=0, model_name="llama-3.3-70b-versatile")
+
+HISTORY_MODEL = "llama-3.3-70b-versatile"
 
 
 system_prompt = (
@@ -37,25 +41,81 @@ prompt = ChatPromptTemplate.from_messages([("system", system_prompt), ("human",
 
 def retrieve_relevant_chunks(query, top_k=5):
     """
-    Retrieve relevant chunks using cosine similarity search.
+    Retrieve relevant chunks within the retrieval deadline (see `retrieve_chunks`).
+    """
+    relevant_chunks, _ = retrieve_chunks(query, top_k=top_k)
+    chunk_texts, _ = assemble_context('history', query, [chunk.chunk_text for chunk in relevant_chunks])
+    return " ".join(chunk_texts)
+
+
+def retrieve_relevant_chunks_batch(queries, top_k=5, budget=None):
+    """
+    Retrieve the context for several queries with one embedding call and one pass over the chunks,
+    within the retrieval deadline (see `retrieve_chunks_batch`).
+    Returns one context string per query, in input order.
     """
-    relevant_chunks = search_similar_chunks(query, top_k=top_k)
-    context = " ".join(chunk.chunk_text for chunk in relevant_chunks)
-    return context
+    relevant_chunks, _ = retrieve_chunks_batch(queries, top_k=top_k, budget=budget)
+    contexts = []
+    for query, chunks in zip(queries, relevant_chunks):
+        chunk_texts, _ = assemble_context('history', query, [chunk.chunk_text for chunk in chunks])
+        contexts.append(" ".join(chunk_texts))
+    return contexts
+
+
+def answer_query_with_context(query, context):
+    """
+    Generate an answer using the assistant with the given document context.
+    """
+    input_text = f"Document Context: {context}\n\nQuestion: {query}\n\nProvide a detailed answer using the syllabus, textbook, and your expertise."
+
+    completion = llm.complete(prompt.format_messages(text=input_text), model=HISTORY_MODEL, temperature=0)
+
+    return completion.text
 
 
 def answer_query_with_assistant(query):
     """
     Generate an answer using the assistant with relevant chunks as context.
+    If the embedding search is unavailable or too slow, the context comes from a keyword
+    search or is left empty (see `retrieve_chunks`).
     """
     context = retrieve_relevant_chunks(query)
+    return answer_query_with_context(query, context)
 
-    input_text = f"Document Context: {context}\n\nQuestion: {query}\n\nProvide a detailed answer using the syllabus, textbook, and your expertise."
-
-    response = prompt | chat
-    answer = response.invoke({"text": input_text})
 
-    return answer
+def answer_queries_concurrently(queries):
+    """
+    Answer several queries at once. Retrieval is batched, the LLM calls run in a bounded
+    thread pool, and anything still running at the deadline is reported as timed out.
+    Returns a list of (answer, error) pairs in input order; exactly one of the two is set.
+    """
+    deadline = time.monotonic() + settings.AI_QUERY_DEADLINE
+
+    try:
+        # Retrieval shares the answer deadline, so it can never use up the time left for the LLM calls
+        budget = min(settings.AI_RETRIEVAL_BUDGET, max(0.0, deadline - time.monotonic()))
+        contexts = retrieve_relevant_chunks_batch(queries, budget=budget)
+    except Exception as e:
+        logger.warning(f"Error retrieving chunks for batch queries: {e}")
+        contexts = [""] * len(queries)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(settings.AI_QUERY_MAX_WORKERS, len(queries))))
+    futures = [executor.submit(llm.with_call_context(answer_query_with_context), query, context) for query, context in zip(queries, contexts)]
+    wait(futures, timeout=max(0, deadline - time.monotonic()))
+    # Don't hold the request open for stragglers; they finish in the background
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    results = []
+    for future in futures:
+        if not future.done():
+            results.append((None, "The request took too long to answer. Please try again."))
+        elif future.cancelled():
+            results.append((None, "The request was cancelled because the batch ran out of time."))
+        elif future.exception() is not None:
+            results.append((None, str(future.exception())))
+        else:
+            results.append((future.result(), None))
+    return results
 
 
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -82,18 +142,22 @@ class QueryView(LoginRequiredMixin, TemplateView):
                 'queries_and_answers': [{'query': query, 'answer': answer_html}]
             }
             return self.render_to_response(context)
+        except LLMUnavailable:
+            raise
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=500)
 
     def post(self, request, *args, **kwargs):
-        queries = request.POST.getlist('query[]')
+        queries = [query for query in request.POST.getlist('query[]') if query.strip()]
         answers = []
-        for query in queries:
-            try:
-                answer = answer_query_with_assistant(query)
-                answer_content = answer.content if hasattr(answer, 'content') else answer
-                answers.append({'query': query, 'answer': markdown(answer_content)})
-            except Exception as e:
-                answers.append({'query': query, 'answer': f"Error processing query: {str(e)}"})
+        if not queries:
+            return self.render_to_response({'queries_and_answers': answers})
+
+        for query, (answer, error) in zip(queries, answer_queries_concurrently(queries)):
+            if error:
+                answers.append({'query': query, 'answer': f"Error processing query: {error}"})
+                continue
+            answer_content = answer.content if hasattr(answer, 'content') else answer
+            answers.append({'query': query, 'answer': markdown(answer_content)})
 
         return self.render_to_response({'queries_and_answers': answers})
@@ -1,27 +1,24 @@
 
-import os
-from django.conf import settings
 from django.shortcuts import render
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views import View
 from django.contrib import messages
 import markdown
 import logging
-from langchain_groq import ChatGroq
-from groq import Groq
 from langchain_core.prompts import ChatPromptTemplate
 
 from ai_core.models import ResourceModel, ResourceType, ClassLevel, DifficultyLevel, DocumentChunk, SubjectChoices
-import PyPDF2
 from django.core.files.storage import default_storage
-from ai_core.utils import extract_text_from_pdf, search_similar_chunks
+from ai_core import llm
+from ai_core.generations import record_generation, text_fingerprint, track_generation
+from ai_core.jobs import enqueue_job, job_queue_enabled
+from ai_core.llm import LLMUnavailable
+from ai_core.pdf_text import PDFLimitExceeded
+from ai_core.uploads import extracted_text
+from ai_core.utils import assemble_context, retrieve_chunks
 
 logger = logging.getLogger(__name__)
-os.environ["GROQ_API_KEY"] = settings.GROQ_API_KEY
-groq_client = Groq(api_key=settings.GROQ_API_KEY)
 
-# Initialize Llama 3 with Groq LPU
-chat = ChatGroq(temperature=0, model_name="deepseek-r1-distill-llama-70b")
 
 # System and human prompts (unchanged)
 system_prompt = (
@@ -114,29 +111,52 @@ class QuestionBankGeneratorView(LoginRequiredMixin, View):
             messages.error(request, "Please fill out all fields.")
             return render(request, self.template_name)
 
-        # Extract text from PDF (if uploaded)
-        pdf_text = extract_text_from_pdf(pdf_file) if pdf_file else None
-
-        # Retrieve relevant FAISS chunks
-        relevant_chunks = self.retrieve_relevant_chunks(topic)
+        # Extract text from PDF (if uploaded); files uploaded before reuse their stored text
+        source_text = None
+        if pdf_file:
+            try:
+                source_text = extracted_text(pdf_file)
+            except PDFLimitExceeded as e:
+                messages.error(request, f"{e} Please upload a smaller file.")
+                return render(request, self.template_name)
+            except Exception as e:
+                logger.error(f"Error extracting text from PDF: {e}")
+        pdf_text = source_text.text if source_text else None
+
+        if job_queue_enabled():
+            # The worker has no access to the request, so store the upload before queueing
+            pdf_file_name = default_storage.save(f"pdfs/{pdf_file.name}", pdf_file) if pdf_file else None
+            job = enqueue_job(
+                request.user, 'question_bank',
+                class_level=class_level, topic=topic, subject=subject, resource_type=resource_type,
+                difficulty_level=difficulty_level, number_of_questions=number_of_questions,
+                pdf_file=pdf_file_name, source_text_id=source_text.id if source_text else None,
+            )
+            return render(
+                request,
+                self.template_name,
+                {
+                    "class_levels": ClassLevel.choices,
+                    "subjects": SubjectChoices.choices,
+                    "resource_types": ResourceType.choices,
+                    "difficulty_levels": DifficultyLevel.choices,
+                    "class_level": class_level,
+                    "subject": subject,
+                    "topic": topic,
+                    "number_of_questions": number_of_questions,
+                    "resource_type": resource_type,
+                    "difficulty_level": difficulty_level,
+                    "job_id": job.id,
+                },
+            )
 
-        # Generate questions
-        resource_content = self.generate_question_content(
-            class_level, topic, subject, resource_type, difficulty_level, number_of_questions, pdf_text, relevant_chunks
+        saved_resource = self.create_resource(
+            class_level, topic, subject, resource_type, difficulty_level, number_of_questions, pdf_text, pdf_file,
+            user=request.user, source_text=source_text,
         )
 
-        if resource_content:
-            content_html = markdown.markdown(resource_content)
-            saved_resource = ResourceModel.objects.create(
-                class_level=class_level,
-                topic=topic,
-                subject=subject,
-                resource_type=resource_type,
-                number_of_questions=number_of_questions,
-                difficulty_level=difficulty_level,
-                content=content_html,
-                pdf_file=pdf_file if pdf_file else None,
-            )
+        if saved_resource:
+            content_html = saved_resource.content
             return render(
                 request,
                 self.template_name,
@@ -159,13 +179,48 @@ class QuestionBankGeneratorView(LoginRequiredMixin, View):
             messages.error(request, "Failed to generate questions. Please try again.")
             return render(request, self.template_name)
 
+    def create_resource(self, class_level, topic, subject, resource_type, difficulty_level, number_of_questions,
+                        pdf_text=None, pdf_file=None, user=None, source_text=None):
+        """Generate questions grounded in the handbooks and save them as a ResourceModel."""
+        with track_generation() as run:
+            # Retrieve relevant handbook chunks
+            relevant_chunks = self.retrieve_relevant_chunks(topic)
+
+            # Generate questions
+            resource_content = self.generate_question_content(
+                class_level, topic, subject, resource_type, difficulty_level, number_of_questions, pdf_text,
+                relevant_chunks
+            )
+        if not resource_content:
+            return None
+
+        resource = ResourceModel.objects.create(
+            user=user,
+            class_level=class_level,
+            topic=topic,
+            subject=subject,
+            resource_type=resource_type,
+            number_of_questions=number_of_questions,
+            difficulty_level=difficulty_level,
+            content=markdown.markdown(resource_content),
+            pdf_file=pdf_file if pdf_file else None,
+            source_text=source_text,
+        )
+        parameters = {
+            'class_level': class_level, 'topic': topic, 'subject': subject, 'resource_type': resource_type,
+            'difficulty_level': difficulty_level, 'number_of_questions': int(number_of_questions),
+            'pdf_text': text_fingerprint(pdf_text),
+        }
+        record_generation(resource, 'question_bank', parameters, run)
+        return resource
+
     def retrieve_relevant_chunks(self, topic):
-        """Retrieve relevant document chunks using cosine similarity search."""
+        """Retrieve relevant handbook chunks within the retrieval deadline (see `retrieve_chunks`)."""
         try:
             handbook_chunks = DocumentChunk.objects.filter(
                 document_type__in=["Primary School Handbook", "JSS Handbook", "SSS Handbook"]
             )
-            relevant = search_similar_chunks(topic, chunks=handbook_chunks, top_k=5)
+            relevant, _ = retrieve_chunks(topic, chunks=handbook_chunks, top_k=5)
             return [chunk.chunk_text for chunk in relevant]
         except Exception as e:
             logger.warning(f"Error retrieving chunks: {e}")
@@ -183,6 +238,10 @@ class QuestionBankGeneratorView(LoginRequiredMixin, View):
                 difficulty_level=difficulty_level,
             )
 
+            relevant_chunks, pdf_text = assemble_context(
+                'question_bank', f"{subject} {topic}", relevant_chunks or [], pdf_text
+            )
+
             if pdf_text:
                 formatted_prompt.append(("system", f"Here is the text extracted from the uploaded PDF:\n\n{pdf_text}"))
 
@@ -190,9 +249,11 @@ class QuestionBankGeneratorView(LoginRequiredMixin, View):
                 chunks_text = "\n\n".join(relevant_chunks)
                 formatted_prompt.append(("system", f"Here are some relevant excerpts from the handbooks:\n\n{chunks_text}"))
 
-            response = chat.invoke(formatted_prompt)
-            return response.content
+            completion = llm.complete(formatted_prompt, task='question_bank', temperature=0)
+            return completion.text
 
+        except LLMUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Error generating content: {e}")
             return None
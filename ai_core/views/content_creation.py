@@ -1,27 +1,85 @@
-import datetime
 import logging
 import os
+import re
+import uuid
 
 import markdown
 from django.conf import settings
 from django.contrib import messages
-from django.http import HttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
-from django.template.loader import render_to_string
-from django.templatetags.static import static
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views import View
 from django.views.generic import ListView
-from groq import Groq
 
+from ai_core import llm
+from ai_core.generations import record_generation, track_generation
+from ai_core.jobs import enqueue_job, job_queue_enabled
+from ai_core.llm import LLMUnavailable
+from ai_core.documents import document_response
+from ai_core.utils import generate_sections
 from core.models import LessonPlan
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
-# Configure Groq client
-groq_client = Groq(api_key=settings.GROQ_API_KEY)
+
+LESSON_PLAN_MODEL = "llama-3.3-70b-versatile"
+
+# Sections of a lesson plan, shared by the single-prompt and section-wise generators
+LESSON_PLAN_SECTIONS = [
+    ("1. Learning Objectives",
+     "   - Define clear learning objectives, explaining how this knowledge benefits students in everyday life.\n"
+     "   - Emphasize practical applications in sectors like agriculture, local industries, health, and technology.\n"),
+    ("2. Introduction and Theory",
+     "   - Provide an accessible overview of the theoretical concepts, using relatable local examples.\n"
+     "   - Integrate storytelling or examples from the local context that connect theory to practice.\n"),
+    ("3. Practical Activities and Case Studies",
+     "   - Design engaging, hands-on activities that demonstrate real-world applications.\n"
+     "   - Include local case studies showing how these concepts address community challenges.\n"
+     "   - Highlight the work of local industries, organizations, or individuals making a positive impact.\n"
+     "   - Suggest collaborative group exercises or projects that encourage problem-solving and critical thinking.\n"),
+    ("4. Lesson Structure and Timings",
+     "   - Present the lesson structure as a table with these columns:\n"
+     "     Time Allocation | Activity/Phase | Description | Teaching Method | Resources Needed\n"),
+    ("5. Assessment and Reflection",
+     "   - Outline assessment methods that measure both theoretical understanding and practical skills.\n"
+     "   - Encourage students to reflect on how they could use the learned concepts in their communities.\n"),
+    ("6. Supplementary Resources",
+     "   - Recommend additional resources such as relevant books, articles, videos, and local sources.\n"
+     "   - Suggest online resources or workshops that could further enhance understanding.\n"),
+    ("7. Community Engagement and Follow-Up Activities",
+     "   - Provide suggestions for follow-up projects, like community engagement or field activities.\n"
+     "   - Encourage community experts or guest speakers to share practical insights.\n"),
+]
+
+# Separates follow-up content appended to a lesson plan from the plan itself
+FOLLOW_UP_SEPARATOR = '<div class="follow-up-separator"><h2>Follow-Up Content</h2></div>'
+
+
+def section_token(value=None):
+    """The section cache token posted back by the form, or a fresh one for a new generation."""
+    if value and re.fullmatch(r'[0-9a-f]{32}', value):
+        return value
+    return uuid.uuid4().hex
+
+
+LESSON_PLAN_FORMATTING = (
+    "### Formatting Instructions\n"
+    "   - For any mathematical expressions, formulas, or equations, use LaTeX notation wrapped in dollar signs.\n"
+    "     Use $...$ for inline math (e.g., $x^2 + y^2 = z^2$) and $$...$$ for display/block math.\n"
+    "   - Include worked examples with step-by-step solutions using LaTeX math notation.\n"
+    "   - Where appropriate, include ONE simple visual diagram using Mermaid syntax in a fenced code block.\n"
+    "     IMPORTANT: Only use simple Mermaid flowcharts (graph TD or graph LR). Keep node labels short and plain-text.\n"
+    "     Do NOT use special characters, LaTeX, parentheses in labels, or quotes inside quotes.\n"
+    "     Example of valid Mermaid syntax:\n"
+    "     ```mermaid\n"
+    "     graph TD\n"
+    "         A[Start] --> B[Step 1]\n"
+    "         B --> C[Step 2]\n"
+    "         C --> D[End]\n"
+    "     ```\n"
+)
 
 
 class LessonPlanGeneratorView(LoginRequiredMixin, View):
@@ -36,8 +94,28 @@ class LessonPlanGeneratorView(LoginRequiredMixin, View):
         # Check for follow-up request
         follow_up_request = request.POST.get('follow_up_request')
         lesson_plan_id = request.POST.get('lesson_plan_id')
+        regenerate_section = request.POST.get('regenerate_section')
+        token = section_token(request.POST.get('section_token'))
+
+        if regenerate_section and lesson_plan_id:
+            # Regenerate one section of a sectioned lesson plan, keeping the others
+            lesson_plan = get_object_or_404(LessonPlan, id=lesson_plan_id, user=request.user)
+            if regenerate_section not in self.section_titles(request.user):
+                messages.error(request, "Please choose a section to regenerate.")
+            elif not self.regenerate_lesson_plan_section(lesson_plan, regenerate_section, token):
+                messages.error(request, "Failed to regenerate the section. Please try again.")
 
-        if follow_up_request and lesson_plan_id:
+            return render(request, self.template_name, {
+                'topic': lesson_plan.topic,
+                'level': lesson_plan.level,
+                'area': lesson_plan.area,
+                'lesson_plan': lesson_plan.content,
+                'lesson_plan_id': lesson_plan.id,
+                'sections': self.section_titles(request.user),
+                'section_token': token,
+                'user_role': request.user.role,
+            })
+        elif follow_up_request and lesson_plan_id:
             # Handle follow-up content generation
             lesson_plan = get_object_or_404(LessonPlan, id=lesson_plan_id, user=request.user)
             follow_up_content = self.generate_follow_up_content(
@@ -47,8 +125,7 @@ class LessonPlanGeneratorView(LoginRequiredMixin, View):
             follow_up_content_html = markdown.markdown(follow_up_content, extensions=['markdown.extensions.tables', 'markdown.extensions.fenced_code'])
 
             # Append follow-up content to the existing lesson plan with a visual separator
-            separator = '<div class="follow-up-separator"><h2>Follow-Up Content</h2></div>'
-            combined_content = lesson_plan.content + separator + follow_up_content_html
+            combined_content = lesson_plan.content + FOLLOW_UP_SEPARATOR + follow_up_content_html
             lesson_plan.content = combined_content
             lesson_plan.follow_up_count += 1
             lesson_plan.save()
@@ -59,6 +136,8 @@ class LessonPlanGeneratorView(LoginRequiredMixin, View):
                 'area': lesson_plan.area,
                 'lesson_plan': combined_content,
                 'lesson_plan_id': lesson_plan.id,
+                'sections': self.section_titles(request.user),
+                'section_token': token,
                 'user_role': request.user.role,
             })
         else:
@@ -73,99 +152,139 @@ class LessonPlanGeneratorView(LoginRequiredMixin, View):
                     'user_role': request.user.role,
                 })
 
-            if request.user.role == 'student':
-                content = self.generate_study_notes(topic, level, area)
-            else:
-                content = self.generate_lesson_plan(topic, level, area)
-
-            if content:
-                content_html = markdown.markdown(content, extensions=['markdown.extensions.tables', 'markdown.extensions.fenced_code'])
-                saved_plan = LessonPlan.objects.create(
-                    user=request.user,
-                    topic=topic,
-                    level=level,
-                    area=area,
-                    content=content_html
-                )
+            if job_queue_enabled():
+                job = enqueue_job(request.user, 'lesson_plan', topic=topic, level=level, area=area, section_token=token)
+                return render(request, self.template_name, {
+                    'topic': topic,
+                    'level': level,
+                    'area': area,
+                    'job_id': job.id,
+                    'user_role': request.user.role,
+                })
+
+            saved_plan = self.create_lesson_plan(request.user, topic, level, area, token)
 
+            if saved_plan:
                 return render(request, self.template_name, {
                     'topic': topic,
                     'level': level,
                     'area': area,
-                    'lesson_plan': content_html,
+                    'lesson_plan': saved_plan.content,
                     'lesson_plan_id': saved_plan.id,
+                    'sections': self.section_titles(request.user),
+                    'section_token': token,
                     'user_role': request.user.role,
                 })
             else:
                 messages.error(request, "Failed to generate content. Please try again.")
+                # Keep the token so retrying the same plan reuses the sections that were generated
                 return render(request, self.template_name, {
+                    'section_token': token,
                     'user_role': request.user.role,
                 })
 
-    def generate_lesson_plan(self, topic, level, area):
-        """Generate a lesson plan using the Groq API tailored for Sierra Leone's education system."""
-        try:
-            prompt = (
-                f"Generate a detailed lesson plan on '{topic}' for {level} students in {area} Sierra Leone. "
-                f"Integrate theory with real-life, culturally relevant applications. "
-                f"Structure the plan as follows:\n\n"
-
-                f"### 1. Learning Objectives\n"
-                f"   - Define clear learning objectives, explaining how this knowledge benefits students in everyday life.\n"
-                f"   - Emphasize practical applications in sectors like agriculture, local industries, health, and technology.\n\n"
-
-                f"### 2. Introduction and Theory\n"
-                f"   - Provide an accessible overview of the theoretical concepts, using relatable local examples.\n"
-                f"   - Integrate storytelling or examples from the local context that connect theory to practice.\n\n"
-
-                f"### 3. Practical Activities and Case Studies\n"
-                f"   - Design engaging, hands-on activities that demonstrate real-world applications.\n"
-                f"   - Include local case studies showing how these concepts address community challenges.\n"
-                f"   - Highlight the work of local industries, organizations, or individuals making a positive impact.\n"
-                f"   - Suggest collaborative group exercises or projects that encourage problem-solving and critical thinking.\n\n"
+    def section_titles(self, user):
+        """Titles of the sections a user can regenerate one at a time, if the plan was generated section-wise."""
+        if user.role == 'student' or not settings.AI_SECTIONED_GENERATION:
+            return []
+        return [title for title, _ in LESSON_PLAN_SECTIONS]
+
+    def section_scope(self, user, token):
+        """Section cache scope of one generation of a user's lesson plan."""
+        return f"{user.pk}:{token}"
+
+    def create_lesson_plan(self, user, topic, level, area, token=None):
+        """Generate study notes or a lesson plan for the user's role and save it as a LessonPlan."""
+        feature = 'study_notes' if user.role == 'student' else 'lesson_plan'
+        with track_generation() as run:
+            if feature == 'study_notes':
+                content = self.generate_study_notes(topic, level, area)
+            else:
+                content = self.generate_lesson_plan(topic, level, area, self.section_scope(user, section_token(token)))
 
-                f"### 4. Lesson Structure and Timings\n"
-                f"   - Present the lesson structure as a table with these columns:\n"
-                f"     Time Allocation | Activity/Phase | Description | Teaching Method | Resources Needed\n\n"
+        if not content:
+            return None
 
-                f"### 5. Assessment and Reflection\n"
-                f"   - Outline assessment methods that measure both theoretical understanding and practical skills.\n"
-                f"   - Encourage students to reflect on how they could use the learned concepts in their communities.\n\n"
+        content_html = markdown.markdown(content, extensions=['markdown.extensions.tables', 'markdown.extensions.fenced_code'])
+        lesson_plan = LessonPlan.objects.create(
+            user=user,
+            topic=topic,
+            level=level,
+            area=area,
+            content=content_html
+        )
+        parameters = {
+            'topic': topic, 'level': level, 'area': area,
+            'sectioned': feature == 'lesson_plan' and settings.AI_SECTIONED_GENERATION,
+        }
+        record_generation(lesson_plan, feature, parameters, run)
+        return lesson_plan
+
+    def regenerate_lesson_plan_section(self, lesson_plan, title, token):
+        """
+        Regenerate one section of a lesson plan, reusing the other sections cached under `token`
+        and keeping any follow-up content. Once the cache has expired every section is regenerated.
+        """
+        with track_generation() as run:
+            content = self.generate_lesson_plan(
+                lesson_plan.topic, lesson_plan.level, lesson_plan.area,
+                self.section_scope(lesson_plan.user, token), refresh=(title,),
+            )
 
-                f"### 6. Supplementary Resources\n"
-                f"   - Recommend additional resources such as relevant books, articles, videos, and local sources.\n"
-                f"   - Suggest online resources or workshops that could further enhance understanding.\n\n"
+        if not content:
+            return None
 
-                f"### 7. Community Engagement and Follow-Up Activities\n"
-                f"   - Provide suggestions for follow-up projects, like community engagement or field activities.\n"
-                f"   - Encourage community experts or guest speakers to share practical insights.\n\n"
+        _, separator, follow_ups = lesson_plan.content.partition(FOLLOW_UP_SEPARATOR)
+        content_html = markdown.markdown(content, extensions=['markdown.extensions.tables', 'markdown.extensions.fenced_code'])
+        lesson_plan.content = content_html + separator + follow_ups
+        lesson_plan.save()
+        parameters = {
+            'topic': lesson_plan.topic, 'level': lesson_plan.level, 'area': lesson_plan.area,
+            'sectioned': True, 'refresh': title,
+        }
+        record_generation(lesson_plan, 'lesson_plan', parameters, run)
+        return lesson_plan
 
-                f"### Formatting Instructions\n"
-                f"   - For any mathematical expressions, formulas, or equations, use LaTeX notation wrapped in dollar signs.\n"
-                f"     Use $...$ for inline math (e.g., $x^2 + y^2 = z^2$) and $$...$$ for display/block math.\n"
-                f"   - Include worked examples with step-by-step solutions using LaTeX math notation.\n"
-                f"   - Where appropriate, include ONE simple visual diagram using Mermaid syntax in a fenced code block.\n"
-                f"     IMPORTANT: Only use simple Mermaid flowcharts (graph TD or graph LR). Keep node labels short and plain-text.\n"
-                f"     Do NOT use special characters, LaTeX, parentheses in labels, or quotes inside quotes.\n"
-                f"     Example of valid Mermaid syntax:\n"
-                f"     ```mermaid\n"
-                f"     graph TD\n"
-                f"         A[Start] --> B[Step 1]\n"
-                f"         B --> C[Step 2]\n"
-                f"         C --> D[End]\n"
-                f"     ```\n"
+    def generate_lesson_plan(self, topic, level, area, scope=None, refresh=()):
+        """Generate a lesson plan using the Groq API tailored for Sierra Leone's education system."""
+        intro = (
+            f"Generate a detailed lesson plan on '{topic}' for {level} students in {area} Sierra Leone. "
+            f"Integrate theory with real-life, culturally relevant applications. "
+        )
+
+        if settings.AI_SECTIONED_GENERATION:
+            return generate_sections(
+                intro, LESSON_PLAN_SECTIONS, LESSON_PLAN_FORMATTING, self.complete_section,
+                cache_prefix=f"lesson_plan:{LESSON_PLAN_MODEL}", scope=scope, refresh=refresh,
             )
 
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
+        try:
+            prompt = (
+                f"{intro}"
+                f"Structure the plan as follows:\n\n"
+                + "".join(f"### {title}\n{instructions}\n" for title, instructions in LESSON_PLAN_SECTIONS)
+                + LESSON_PLAN_FORMATTING
             )
-            return response.choices[0].message.content
+
+            completion = llm.complete(prompt, model=LESSON_PLAN_MODEL, temperature=0.7)
+            return completion.text
+        except LLMUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Error generating lesson plan content: {e}")
             return None
 
+    def complete_section(self, prompt):
+        """Generate one lesson plan section for `generate_sections`."""
+        try:
+            completion = llm.complete(prompt, model=LESSON_PLAN_MODEL, temperature=0.7)
+            return completion.text
+        except LLMUnavailable:
+            raise
+        except Exception as e:
+            logger.error(f"Error generating lesson plan section: {e}")
+            return None
+
     def generate_study_notes(self, topic, level, area):
         """Generate study notes using the Groq API tailored for Sierra Leone's students."""
         try:
@@ -211,12 +330,10 @@ class LessonPlanGeneratorView(LoginRequiredMixin, View):
                 f"     ```\n"
             )
 
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-            )
-            return response.choices[0].message.content
+            completion = llm.complete(prompt, model="llama-3.3-70b-versatile", temperature=0.7)
+            return completion.text
+        except LLMUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Error generating study notes content: {e}")
             return None
@@ -243,12 +360,10 @@ class LessonPlanGeneratorView(LoginRequiredMixin, View):
                 f"Where helpful, include ONE simple diagram using a Mermaid flowchart (graph TD) in a fenced code block. "
                 f"Keep Mermaid node labels short and plain-text only -- no special characters, LaTeX, or parentheses in labels."
             )
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-            )
-            return response.choices[0].message.content
+            completion = llm.complete(prompt, task='follow_up', temperature=0.7)
+            return completion.text
+        except LLMUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Error generating follow-up content: {e}")
             return None
@@ -263,25 +378,8 @@ def download_lesson_plan(request, id):
         messages.error(request, "No lesson plan available to download.")
         return redirect('ai_core:lesson_plan_generator')
 
-    # Resolve static path for the logo
-    logo_url = request.build_absolute_uri(static('core/images/header_logo.png'))
-
-    # Render HTML with Django template
-    lesson_plan_html = render_to_string(
-        'ai_core/lesson_plan_pdf.html',
-        {
-            'lesson_plan_content': lesson_plan.content,
-            'generated_date': datetime.datetime.now().strftime('%Y-%m-%d'),
-            'logo_url': logo_url,
-        }
-    )
-
-    # Generate PDF with WeasyPrint
-    import weasyprint
-    pdf = weasyprint.HTML(string=lesson_plan_html, base_url=request.build_absolute_uri('/')).write_pdf()
-    response = HttpResponse(pdf, content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="lesson_plan.pdf"'
-    return response
+    # Serve the PDF pre-rendered when the plan was saved, or render it now
+    return document_response(request, lesson_plan)
 
 
 class LessonPlanListView(LoginRequiredMixin, ListView):
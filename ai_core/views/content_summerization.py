@@ -80,17 +80,28 @@
 #
 #     return render(request, "ai_core/teacher_summarization_form.html")
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import markdown
-import pdfkit
 from django.conf import settings
 from django.http import HttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db.models import Value
+from django.db.models.functions import Coalesce, NullIf, Substr
 from django.views.generic import ListView
-from groq import Groq
 
+from ai_core import llm
+from ai_core.generations import record_generation, text_fingerprint, track_generation
+from ai_core.jobs import enqueue_job, job_queue_enabled
+from ai_core.llm import LLMUnavailable
+from ai_core.documents import document_response
+from ai_core.pdf_text import PDFLimitExceeded
+from ai_core.uploads import extracted_text
+from ai_core.utils import estimate_tokens, split_text_by_tokens
 from core.models import SummarizedContent
 from django.views import View
 import logging
@@ -98,9 +109,6 @@ import logging
 # Setup logging
 logger = logging.getLogger(__name__)
 
-# Configure Groq client
-groq_client = Groq(api_key=settings.GROQ_API_KEY)
-
 
 class SummarizationView(LoginRequiredMixin, View):
     template_name = 'ai_core/teacher_summarization_form.html'
@@ -112,12 +120,22 @@ class SummarizationView(LoginRequiredMixin, View):
         # Get the content from the form (either pasted or uploaded)
         content = request.POST.get('content')  # Text from input
         file = request.FILES.get('file')  # Uploaded file (PDF, text, etc.)
+        source_text = None
 
         if file:
             # Handle file upload (PDF or text)
             if file.name.endswith('.pdf'):
-                # Extract text from PDF
-                text_content = self.extract_text_from_pdf(file)
+                # Extract text from PDF; files uploaded before reuse their stored text
+                try:
+                    source_text = extracted_text(file)
+                except PDFLimitExceeded as e:
+                    messages.error(request, f"{e} Please upload a smaller file.")
+                    return render(request, self.template_name)
+                except Exception as e:
+                    logger.error(f"Error extracting text from PDF: {e}")
+                    messages.error(request, "The PDF could not be read. Please upload another file.")
+                    return render(request, self.template_name)
+                text_content = source_text.text
             elif file.name.endswith('.txt'):
                 # Read content from text file
                 text_content = file.read().decode('utf-8')
@@ -130,27 +148,134 @@ class SummarizationView(LoginRequiredMixin, View):
             messages.error(request, "Please provide content to summarize.")
             return render(request, self.template_name)
 
-        # Generate the summary using Gemini model
-        summary = self.summarize_content_with_gemini(text_content)
+        if job_queue_enabled():
+            if source_text:
+                job = enqueue_job(request.user, 'summary', source_text_id=source_text.id)
+            else:
+                job = enqueue_job(request.user, 'summary', text_content=text_content)
+            return render(request, self.template_name, {'job_id': job.id})
+
+        summarized_content, summary_stats = self.create_summary(request.user, text_content, source_text)
+
+        return render(request, self.template_name, {
+            'summary': summarized_content.summarized_content,
+            'summary_html': summarized_content.content_html,
+            'summarized_content_id': summarized_content.id,
+            'summary_stats': summary_stats,
+        })
+
+    def create_summary(self, user, text_content, source_text=None):
+        """
+        Summarize the content and save it as SummarizedContent. Returns the row and the run statistics.
+        Text extracted from an uploaded PDF is referenced through `source_text` rather than copied.
+        """
+        if source_text:
+            text_content = source_text.text
+        with track_generation() as run:
+            summary, summary_stats = self.summarize(text_content)
 
         # Convert summary to HTML using markdown
         summary_html = markdown.markdown(summary)
 
         # Save the summarized content to the database
         summarized_content = SummarizedContent.objects.create(
-            user=request.user,
-            original_content=text_content,
+            user=user,
+            original_content='' if source_text else text_content,
+            source_text=source_text,
             summarized_content=summary,
             content_html=summary_html
         )
+        record_generation(summarized_content, 'summary', {'content': text_fingerprint(text_content)}, run)
+        return summarized_content, summary_stats
 
-        return render(request, self.template_name, {
-            'summary': summary,
-            'summary_html': summary_html,
-            'summarized_content_id': summarized_content.id
-        })
+    def summarize(self, content):
+        """
+        Summarize content in a single call when it fits the prompt budget. Larger documents are
+        map-reduced: token-budgeted sections are summarized concurrently, then the partial
+        summaries are reduced into the final teacher-oriented summary.
+        Returns the summary and a dict of per-stage timings and token counts.
+        """
+        stats = {
+            'mode': 'direct',
+            'input_tokens': estimate_tokens(content),
+            'sections': 0,
+            'failed_sections': 0,
+            'map_rounds': 0,
+            'map_seconds': 0.0,
+            'reduce_seconds': 0.0,
+            'prompt_tokens': 0,
+            'completion_tokens': 0,
+        }
+
+        partials = content
+        if stats['input_tokens'] > settings.AI_SUMMARY_DIRECT_MAX_TOKENS:
+            stats['mode'] = 'map_reduce'
+            map_started = time.monotonic()
+            # Map the partial summaries again if they are still too large to reduce in one prompt
+            while (estimate_tokens(partials) > settings.AI_SUMMARY_DIRECT_MAX_TOKENS
+                   and stats['map_rounds'] < settings.AI_SUMMARY_MAX_MAP_ROUNDS):
+                sections = split_text_by_tokens(partials, settings.AI_SUMMARY_SECTION_TOKENS)
+                partial_summaries = self.summarize_sections(sections, stats)
+                if not partial_summaries:
+                    return "An error occurred while generating the summary.", stats
+                stats['sections'] += len(sections)
+                stats['map_rounds'] += 1
+                partials = "\n\n".join(partial_summaries)
+            stats['map_seconds'] = round(time.monotonic() - map_started, 2)
+
+        reduce_started = time.monotonic()
+        summary = self.summarize_content_with_gemini(partials, stats)
+        stats['reduce_seconds'] = round(time.monotonic() - reduce_started, 2)
+
+        logger.info(
+            f"Summary generated: mode={stats['mode']} input_tokens={stats['input_tokens']} "
+            f"sections={stats['sections']} failed_sections={stats['failed_sections']} map_rounds={stats['map_rounds']} map_seconds={stats['map_seconds']} "
+            f"reduce_seconds={stats['reduce_seconds']} prompt_tokens={stats['prompt_tokens']} "
+            f"completion_tokens={stats['completion_tokens']}"
+        )
+        return summary, stats
+
+    def summarize_sections(self, sections, stats):
+        """
+        Summarize document sections concurrently. Sections that fail are left out of the returned
+        summaries and counted in `stats['failed_sections']` so the teacher can see the summary is partial.
+        """
+        max_workers = max(1, min(settings.AI_SUMMARY_MAX_WORKERS, len(sections)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(
+                llm.with_call_context(lambda args: self.summarize_section(*args)),
+                [(section, index, len(sections)) for index, section in enumerate(sections, start=1)],
+            ))
 
-    def summarize_content_with_gemini(self, content):
+        partial_summaries = []
+        for text, prompt_tokens, completion_tokens in results:
+            stats['prompt_tokens'] += prompt_tokens
+            stats['completion_tokens'] += completion_tokens
+            if text:
+                partial_summaries.append(text)
+            else:
+                stats['failed_sections'] += 1
+        return partial_summaries
+
+    def summarize_section(self, section, index, total):
+        """Summarize one section of a larger document. Returns (text, prompt_tokens, completion_tokens)."""
+        try:
+            prompt = (
+                f"The following is section {index} of {total} of a longer educational document. "
+                f"Write concise notes on this section for a teacher in Sierra Leone who will later combine "
+                f"the notes of all sections into one summary. Keep the key concepts, definitions, facts, dates, "
+                f"worked examples and any West African or Sierra Leonean context. Use bullet points and keep "
+                f"the notes under 250 words.\n\n{section}"
+            )
+            completion = llm.complete(prompt, model="llama-3.3-70b-versatile", temperature=0.3)
+            return completion.text, completion.prompt_tokens, completion.completion_tokens
+        except LLMUnavailable:
+            raise
+        except Exception as e:
+            logger.error(f"Error summarizing section {index} of {total}: {e}")
+            return None, 0, 0
+
+    def summarize_content_with_gemini(self, content, stats=None):
         """Summarize the educational content using Groq."""
         try:
             prompt = (
@@ -167,28 +292,17 @@ class SummarizationView(LoginRequiredMixin, View):
                 "and summarize the content in approximately 450-800 words, ensuring that the language is clear, "
                 "concise, and accessible to educators in West Africa."
             )
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-            )
-            return response.choices[0].message.content
+            completion = llm.complete(prompt, model="llama-3.3-70b-versatile", temperature=0.7)
+            if stats is not None:
+                stats['prompt_tokens'] += completion.prompt_tokens
+                stats['completion_tokens'] += completion.completion_tokens
+            return completion.text
+        except LLMUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Error generating summary: {e}")
             return "An error occurred while generating the summary."
 
-    def extract_text_from_pdf(self, file):
-        """Extract text from PDF file."""
-        import pdfplumber
-        try:
-            with pdfplumber.open(file) as pdf:
-                text = "\n".join([page.extract_text() for page in pdf.pages if page.extract_text()])
-            return text
-        except Exception as e:
-            logger.error(f"Error extracting text from PDF: {e}")
-            return ""
-
-
 @login_required
 def download_summarized_content_pdf(request, id):
     """Generate and download the summarized content as a PDF."""
@@ -199,13 +313,8 @@ def download_summarized_content_pdf(request, id):
         messages.error(request, "No summarized content available to download.")
         return redirect('ai_core:teacher_summarization_form')
 
-    # Generate PDF from HTML content
-    pdf = pdfkit.from_string(summarized_content_html, False, options={"enable-local-file-access": None})
-
-    # Return the PDF as an HTTP response to trigger the download
-    response = HttpResponse(pdf, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="summarized_content_{summarized_content.id}.pdf"'
-    return response
+    # Serve the PDF pre-rendered when the summary was saved, or render it now
+    return document_response(request, summarized_content)
 
 
 class SummarizedContentListView(LoginRequiredMixin, ListView):
@@ -215,5 +324,13 @@ class SummarizedContentListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         # Only return summarized content created by the current user
-        return SummarizedContent.objects.filter(user=self.request.user).order_by('-created_at')
+        # Only the start of the source text is shown, so neither full text is loaded
+        return (
+            SummarizedContent.objects.filter(user=self.request.user)
+            .defer('original_content')
+            .annotate(source_excerpt=Coalesce(
+                NullIf(Substr('original_content', 1, 200), Value('')), Substr('source_text__text', 1, 200)
+            ))
+            .order_by('-created_at')
+        )
 
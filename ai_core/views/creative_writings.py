@@ -1,24 +1,20 @@
 import os
 import markdown
-from django.conf import settings
-from django.http import HttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views import View
-import pdfkit
-from groq import Groq
 
+from ai_core import llm
+from ai_core.llm import LLMUnavailable
+from ai_core.documents import document_response
 from core.models import CreativeWritingPrompt
 import logging
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
-# Configure Groq client
-groq_client = Groq(api_key=settings.GROQ_API_KEY)
-
 
 # class CreativeWritingAssistantView(View):
 #     template_name = 'ai_core/creative_writing_assistant.html'
@@ -231,11 +227,7 @@ class CreativeWritingAssistantView(LoginRequiredMixin, View):
                 f"like focusing on plot progression and character development.\n\n"
             )
 
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-            )
+            completion = llm.complete(prompt, model="llama-3.3-70b-versatile", temperature=0.7)
 
             improvement_tips = (
                 "Consider asking follow-up questions to clarify the direction of the story, such as:\n"
@@ -244,8 +236,10 @@ class CreativeWritingAssistantView(LoginRequiredMixin, View):
                 "3. How can the story's theme be emphasized more effectively?"
             )
 
-            return {"prompt": response.choices[0].message.content, "improvement_tips": improvement_tips}
+            return {"prompt": completion.text, "improvement_tips": improvement_tips}
 
+        except LLMUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Error generating content: {e}")
             return None
@@ -259,13 +253,11 @@ class CreativeWritingAssistantView(LoginRequiredMixin, View):
                 f"Keep the content culturally resonant and user-friendly."
             )
 
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-            )
-            return response.choices[0].message.content
+            completion = llm.complete(prompt, task='follow_up', temperature=0.7)
+            return completion.text
 
+        except LLMUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Error generating follow-up content: {e}")
             return None
@@ -273,11 +265,6 @@ class CreativeWritingAssistantView(LoginRequiredMixin, View):
 
 from django.shortcuts import get_object_or_404, redirect
 from django.contrib import messages
-from django.template.loader import render_to_string
-from django.templatetags.static import static
-from django.http import HttpResponse
-import pdfkit
-import datetime
 
 
 @login_required
@@ -289,46 +276,8 @@ def download_writing_prompt_pdf(request, id):
         messages.error(request, "No writing prompt available to download.")
         return redirect('ai_core:creative_writing_assistant')
 
-    # Resolve static path for the logo
-    logo_url = request.build_absolute_uri(static('core/images/header_logo.png'))
-
-    # Render HTML with Django template
-    writing_prompt_html = render_to_string(
-        'ai_core/writing_prompt_pdf.html',
-        {
-            'writing_prompt_content': writing_prompt.prompt,
-            'generated_date': datetime.datetime.now().strftime('%Y-%m-%d'),
-            'logo_url': logo_url,  # Pass the full logo URL to the template
-        }
-    )
-
-    # PDF options for optimal rendering
-    options = {
-        "enable-local-file-access": "",
-        "page-size": "A4",
-        "margin-top": "1in",
-        "margin-right": "1in",
-        "margin-bottom": "1in",
-        "margin-left": "1in",
-        "encoding": "UTF-8",
-        "dpi": 300,
-        "orientation": "Portrait",
-        "zoom": "1.1",
-        "footer-right": "[page] of [topage]",
-        "header-left": f"Generated on {datetime.datetime.now().strftime('%Y-%m-%d')}",
-        "footer-left": "Creative Writing Prompt",
-        "footer-font-size": "10",
-        "header-font-size": "10",
-        "print-media-type": None,
-        "minimum-font-size": 12,
-        "disable-smart-shrinking": None,
-    }
-
-    # Generate and return PDF response
-    pdf = pdfkit.from_string(writing_prompt_html, False, options=options)
-    response = HttpResponse(pdf, content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="creative_writing_prompt.pdf"'
-    return response
+    # Serve the PDF pre-rendered when the prompt was saved, or render it now
+    return document_response(request, writing_prompt)
 
 
 from django.views.generic import ListView
@@ -0,0 +1,137 @@
+import datetime
+import logging
+import zipfile
+from collections import deque
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.http import StreamingHttpResponse
+from django.template.defaultfilters import slugify
+
+from ai_core.documents import build_document, stored_pdf_matches
+from ai_core.models import ResourceModel
+from ai_core.utils import submit_pdf
+from core.models import CreativeWritingPrompt, LessonPlan, SummarizedContent
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+HTML_PAGE = "<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>{title}</title></head><body>\n{body}\n</body></html>\n"
+
+
+class ZipStreamBuffer:
+    """
+    Write-only file object for zipfile that hands over what has been written so far.
+    It has no seek, so zipfile writes entries with data descriptors and never goes back.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def export_items(user):
+    """(folder, row, title) for everything the user has generated, oldest first, without loading it all at once."""
+    sources = [
+        ('lesson_plans', LessonPlan.objects.filter(user=user), lambda row: row.topic),
+        ('writing_prompts', CreativeWritingPrompt.objects.filter(user=user), lambda row: row.title or row.theme),
+        ('summaries', SummarizedContent.objects.filter(user=user).defer('original_content'), lambda row: 'summary'),
+        ('question_banks', ResourceModel.objects.filter(user=user), lambda row: f"{row.topic} {row.resource_type}"),
+    ]
+    for folder, queryset, title in sources:
+        for row in queryset.order_by('created_at').iterator(chunk_size=50):
+            yield folder, row, title(row) or folder
+
+
+def start_entry(folder, row, title):
+    """
+    Begin producing one archive entry: the stored pre-rendered PDF, a PDF render queued on the
+    shared pool (reusing the render cache), or the row's HTML when it has no PDF version.
+    """
+    name = f"{folder}/{row.pk}_{slugify(title)[:60] or row.pk}"
+    if isinstance(row, ResourceModel):
+        return name, 'html', None, HTML_PAGE.format(title=title, body=row.content)
+
+    document = build_document(row)
+    if stored_pdf_matches(row, document):
+        return name, 'stored', row.rendered_pdf, document.html
+    try:
+        future = submit_pdf(document.html, document.profile, document.base_url, document.date)
+    except Exception as e:
+        logger.warning(f"Exporting {name} as HTML: {e}")
+        return name, 'html', None, document.html
+    return name, 'render', future, document.html
+
+
+def write_entry(archive, buffer, name, kind, source, html):
+    """Add one entry to the archive, yielding the compressed bytes as they are produced."""
+    if kind == 'render':
+        try:
+            path, _ = source.result(timeout=settings.AI_PDF_RENDER_TIMEOUT)
+            source = open(path, 'rb')
+        except Exception as e:
+            logger.warning(f"Exporting {name} as HTML, the PDF could not be rendered: {e}")
+            kind = 'html'
+    elif kind == 'stored':
+        source = source.open('rb')
+
+    if kind == 'html':
+        archive.writestr(f"{name}.html", html, compress_type=zipfile.ZIP_DEFLATED)
+        yield buffer.pop()
+        return
+
+    # PDFs are already compressed, so they are stored as they are
+    with source, archive.open(zipfile.ZipInfo(f"{name}.pdf", date_time=datetime.datetime.now().timetuple()[:6]),
+                              'w') as entry:
+        while chunk := source.read(CHUNK_SIZE):
+            entry.write(chunk)
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+def stream_export(user):
+    """
+    Yield a ZIP archive of the user's generated content piece by piece. At most
+    `AI_EXPORT_PREFETCH` PDF renders are queued ahead of the entry being written, so memory
+    use stays flat however many rows there are.
+    """
+    buffer = ZipStreamBuffer()
+    pending = deque()
+    items = export_items(user)
+
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for item in items:
+            pending.append(start_entry(*item))
+            if len(pending) >= settings.AI_EXPORT_PREFETCH:
+                yield from write_entry(archive, buffer, *pending.popleft())
+        while pending:
+            yield from write_entry(archive, buffer, *pending.popleft())
+    yield buffer.pop()
+
+
+@login_required
+def export_content(request):
+    """Download all of the user's lesson plans, notes, writing prompts, summaries and question banks as one ZIP."""
+    response = StreamingHttpResponse(
+        (chunk for chunk in stream_export(request.user) if chunk), content_type='application/zip'
+    )
+    filename = f"edubridge_export_{datetime.date.today():%Y-%m-%d}.zip"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -147,7 +147,6 @@
 #         })
 import base64
 import io
-import os
 import markdown
 from PIL import Image
 from django.shortcuts import render
@@ -156,11 +155,7 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic.edit import CreateView
 from ai_core.models import ReportCardImage
 from account.forms import ReportCardForm
-from groq import Groq
-
-from django.conf import settings
-os.environ["GROQ_API_KEY"] = settings.GROQ_API_KEY
-groq_client = Groq(api_key=settings.GROQ_API_KEY)
+from ai_core import llm
 
 
 class ReportCardUploadView(LoginRequiredMixin, CreateView):
@@ -272,9 +267,8 @@ Provide the extracted information and analysis in a structured format using Mark
         """
 
         # Send request to Groq API
-        response = groq_client.chat.completions.create(
-            model="llama-3.2-11b-vision-preview",
-            messages=[
+        completion = llm.complete(
+            [
                 {
                     "role": "user",
                     "content": [
@@ -282,11 +276,13 @@ Provide the extracted information and analysis in a structured format using Mark
                         {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_image}"}}
                     ]
                 }
-            ]
+            ],
+            model="llama-3.2-11b-vision-preview",
+            temperature=None,
         )
 
         # Extract Markdown response and convert to HTML
-        markdown_response = response.choices[0].message.content
+        markdown_response = completion.text
         formatted_html = markdown.markdown(markdown_response)  # Convert Markdown to HTML
 
         # Pass the formatted response to the template
@@ -0,0 +1,25 @@
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+
+from ai_core.models import GenerationJob, JobStatus
+
+
+@login_required
+def job_status(request, job_id):
+    """Return the state of a queued generation job as JSON for the polling script."""
+    job = get_object_or_404(GenerationJob, id=job_id, user=request.user)
+
+    data = {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.status == JobStatus.COMPLETED:
+        data['result'] = job.result
+    elif job.status == JobStatus.FAILED:
+        data['error'] = "Failed to generate content. Please try again."
+
+    return JsonResponse(data)
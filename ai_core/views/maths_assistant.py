@@ -1,24 +1,29 @@
 import os
 from django.conf import settings
 from django.contrib import messages
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponseRedirect
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views import View
 from django.views.generic import ListView
+from ai_core import llm
+from ai_core.generations import record_generation, track_generation
+from ai_core.jobs import enqueue_job, job_queue_enabled
+from ai_core.llm import LLMUnavailable
+from ai_core.documents import document_response
+from ai_core.utils import generate_sections
+from ai_core.views.content_creation import FOLLOW_UP_SEPARATOR, section_token
 from core.models import LessonPlan
-from groq import Groq
 import markdown2
-import pdfkit
 import logging
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
-# Configure Groq client
-groq_client = Groq(api_key=settings.GROQ_API_KEY)
+
+MATH_LESSON_MODEL = "llama-3.3-70b-versatile"
 
 
 class MathLessonNoteGeneratorView(LoginRequiredMixin, View):
@@ -31,8 +36,26 @@ class MathLessonNoteGeneratorView(LoginRequiredMixin, View):
         # Check if this is a follow-up request
         follow_up_request = request.POST.get('follow_up_request')
         lesson_note_id = request.POST.get('lesson_note_id')
+        regenerate_section = request.POST.get('regenerate_section')
+        token = section_token(request.POST.get('section_token'))
+
+        if regenerate_section and lesson_note_id:
+            # Regenerate one section of a sectioned lesson note, keeping the others
+            lesson_note = get_object_or_404(LessonPlan, id=lesson_note_id, user=request.user)
+            if regenerate_section not in self.section_titles():
+                messages.error(request, "Please choose a section to regenerate.")
+            elif not self.regenerate_lesson_note_section(lesson_note, regenerate_section, token):
+                messages.error(request, "Failed to regenerate the section. Please try again.")
 
-        if follow_up_request and lesson_note_id:
+            return render(request, self.template_name, {
+                'topic': lesson_note.topic,
+                'level': lesson_note.level,
+                'lesson_note': lesson_note.content,
+                'lesson_note_id': lesson_note.id,
+                'sections': self.section_titles(),
+                'section_token': token,
+            })
+        elif follow_up_request and lesson_note_id:
             # Generate follow-up content based on existing lesson note
             lesson_note = get_object_or_404(LessonPlan, id=lesson_note_id, user=request.user)
             follow_up_content = self.generate_follow_up_content(
@@ -41,7 +64,7 @@ class MathLessonNoteGeneratorView(LoginRequiredMixin, View):
             follow_up_content_html = markdown2.markdown(follow_up_content, extras=["tables"])
 
             # Combine the original lesson note and the follow-up content
-            combined_content = lesson_note.content + follow_up_content_html
+            combined_content = lesson_note.content + FOLLOW_UP_SEPARATOR + follow_up_content_html
 
             # Update the lesson note in the database with combined content
             lesson_note.content = combined_content
@@ -53,6 +76,8 @@ class MathLessonNoteGeneratorView(LoginRequiredMixin, View):
                 'lesson_note': lesson_note.content,
                 'follow_up_content': follow_up_content_html,
                 'lesson_note_id': lesson_note.id,
+                'sections': self.section_titles(),
+                'section_token': token,
             })
         else:
             # Original lesson note generation process
@@ -62,70 +87,147 @@ class MathLessonNoteGeneratorView(LoginRequiredMixin, View):
                 messages.error(request, "Please enter a topic.")
                 return render(request, self.template_name)
 
-            # Generate the initial lesson note
-            lesson_note = self.generate_math_lesson_note(topic, level)
-            if lesson_note:
-                lesson_note_html = markdown2.markdown(lesson_note, extras=["tables"])
-
-                # Save the lesson note to the database
-                saved_note = LessonPlan.objects.create(
-                    user=request.user,
-                    topic=topic,
-                    level=level,
-                    content=lesson_note_html
-                )
+            if job_queue_enabled():
+                job = enqueue_job(request.user, 'math_lesson_note', topic=topic, level=level, section_token=token)
+                return render(request, self.template_name, {
+                    'topic': topic,
+                    'level': level,
+                    'job_id': job.id,
+                })
+
+            # Generate the initial lesson note and save it to the database
+            saved_note = self.create_lesson_note(request.user, topic, level, token)
+            if saved_note:
                 return render(request, self.template_name, {
                     'topic': topic,
                     'level': level,
-                    'lesson_note': lesson_note_html,
-                    'lesson_note_id': saved_note.id
+                    'lesson_note': saved_note.content,
+                    'lesson_note_id': saved_note.id,
+                    'sections': self.section_titles(),
+                    'section_token': token,
                 })
             else:
                 messages.error(request, "Failed to generate lesson note. Please try again.")
-                return render(request, self.template_name)
-
-    def generate_math_lesson_note(self, topic, level):
-        """Generate a comprehensive mathematics lesson note using the Groq API."""
-        try:
-            prompt = (
-                f"Create a detailed and practical lesson note for teaching the topic '{topic}' in mathematics "
-                f"for {level} students. The note should include the following structured sections:\n\n"
-
-                f"1. **Theory**: Provide an in-depth explanation of the theoretical foundation of '{topic}'.\n"
-
-                f"2. **Formula**: List the key formulas involved, including a step-by-step derivation to build understanding.\n"
-
-                f"3. **Visual Representation**: Provide graphical explanations where applicable to help students visualize the concepts. "
-                f"Use flowcharts, graphs, or any visual model that can clarify abstract ideas. For example, illustrate concepts such as relationships between variables, geometric shapes, function graphs, or process flows. "
-                f"These visuals should be created using Mermaid syntax or other diagramming tools that support interactive diagrams or charts that clearly communicate the relationships and logic behind the topic.\n"
-
-                f"4. **Real-World Applications**: Describe practical applications of '{topic}', especially within an African context, "
-                f"highlighting how it can be applied to solve problems in fields like agriculture, economics, technology, and local industries in Sierra Leone.\n"
-
-                f"5. **Example Problems**: Include example problems ranging from basic to advanced difficulty, with step-by-step solutions for each problem.\n"
+                # Keep the token so retrying the same note reuses the sections that were generated
+                return render(request, self.template_name, {'section_token': token})
+
+    def section_titles(self):
+        """Titles of the sections that can be regenerated one at a time, if notes are generated section-wise."""
+        if not settings.AI_SECTIONED_GENERATION:
+            return []
+        return [f"{number}. {name}" for number, name, _ in self.math_lesson_sections('')]
+
+    def section_scope(self, user, token):
+        """Section cache scope of one generation of a user's lesson note."""
+        return f"{user.pk}:{token}"
+
+    def create_lesson_note(self, user, topic, level, token=None):
+        """Generate a mathematics lesson note and save it as a LessonPlan."""
+        with track_generation() as run:
+            lesson_note = self.generate_math_lesson_note(topic, level, self.section_scope(user, section_token(token)))
+        if not lesson_note:
+            return None
 
-                f"6. **Class Exercises**: Provide a set of exercises for students to practice in class, covering different levels of complexity.\n"
+        lesson_note_html = markdown2.markdown(lesson_note, extras=["tables"])
+        saved_note = LessonPlan.objects.create(
+            user=user,
+            topic=topic,
+            level=level,
+            content=lesson_note_html,
+            is_math_note=True,
+        )
+        parameters = {'topic': topic, 'level': level, 'sectioned': settings.AI_SECTIONED_GENERATION}
+        record_generation(saved_note, 'math_lesson_note', parameters, run)
+        return saved_note
+
+    def regenerate_lesson_note_section(self, lesson_note, title, token):
+        """
+        Regenerate one section of a lesson note, reusing the other sections cached under `token`
+        and keeping any follow-up content. Once the cache has expired every section is regenerated.
+        """
+        with track_generation() as run:
+            content = self.generate_math_lesson_note(
+                lesson_note.topic, lesson_note.level, self.section_scope(lesson_note.user, token), refresh=(title,),
+            )
 
-                f"7. **Homework Assignments**: List several homework assignments that reinforce the key concepts, with a mix of problem types.\n"
-                f"9. **Follow-Up Questions and Recommendations**: Conclude with a section that suggests potential follow-up questions for students to extend their thinking and deepen their knowledge. Provide recommendations for additional resources, such as articles, videos, or online tools that could further reinforce their understanding of '{topic}'.\n\n"
+        if not content:
+            return None
 
-                f"Ensure the lesson note is comprehensive, accessible, culturally relevant, and tailored to the educational context in Sierra Leone. \n"
-                f"The content should actively promote critical thinking, problem-solving, and practical understanding, aligning with the EduBridge mission to connect theory with real-life applications.\n\n"
+        _, separator, follow_ups = lesson_note.content.partition(FOLLOW_UP_SEPARATOR)
+        lesson_note.content = markdown2.markdown(content, extras=["tables"]) + separator + follow_ups
+        lesson_note.save()
+        parameters = {'topic': lesson_note.topic, 'level': lesson_note.level, 'sectioned': True, 'refresh': title}
+        record_generation(lesson_note, 'math_lesson_note', parameters, run)
+        return lesson_note
 
-                f"Ensure the lesson note is comprehensive, accessible, culturally relevant, and suitable for the educational context in Sierra Leone. "
-                f"The content should encourage critical thinking and practical understanding, following the EduBridge mission to connect theory with real-life applications."
+    def generate_math_lesson_note(self, topic, level, scope=None, refresh=()):
+        """Generate a comprehensive mathematics lesson note using the Groq API."""
+        intro = (
+            f"Create a detailed and practical lesson note for teaching the topic '{topic}' in mathematics "
+            f"for {level} students. "
+        )
+        guidance = (
+            f"Ensure the lesson note is comprehensive, accessible, culturally relevant, and tailored to the educational context in Sierra Leone. \n"
+            f"The content should actively promote critical thinking, problem-solving, and practical understanding, aligning with the EduBridge mission to connect theory with real-life applications.\n\n"
+
+            f"Ensure the lesson note is comprehensive, accessible, culturally relevant, and suitable for the educational context in Sierra Leone. "
+            f"The content should encourage critical thinking and practical understanding, following the EduBridge mission to connect theory with real-life applications."
+        )
+        sections = self.math_lesson_sections(topic)
+
+        if settings.AI_SECTIONED_GENERATION:
+            return generate_sections(
+                intro, [(f"{number}. {name}", instructions) for number, name, instructions in sections], guidance,
+                self.complete_section, cache_prefix=f"math_lesson_note:{MATH_LESSON_MODEL}", scope=scope,
+                refresh=refresh,
             )
 
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
+        try:
+            prompt = (
+                f"{intro}"
+                f"The note should include the following structured sections:\n\n"
+                + "".join(f"{number}. **{name}**: {instructions}\n" for number, name, instructions in sections)
+                + f"\n{guidance}"
             )
-            return response.choices[0].message.content
+
+            completion = llm.complete(prompt, model=MATH_LESSON_MODEL, temperature=0.7)
+            return completion.text
+        except LLMUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Error generating content: {e}")
             return None
 
+    def math_lesson_sections(self, topic):
+        """Sections of a math lesson note as (number, name, instructions), in document order."""
+        return [
+            (1, "Theory", f"Provide an in-depth explanation of the theoretical foundation of '{topic}'."),
+            (2, "Formula", "List the key formulas involved, including a step-by-step derivation to build understanding."),
+            (3, "Visual Representation",
+             "Provide graphical explanations where applicable to help students visualize the concepts. "
+             "Use flowcharts, graphs, or any visual model that can clarify abstract ideas. For example, illustrate concepts such as relationships between variables, geometric shapes, function graphs, or process flows. "
+             "These visuals should be created using Mermaid syntax or other diagramming tools that support interactive diagrams or charts that clearly communicate the relationships and logic behind the topic."),
+            (4, "Real-World Applications",
+             f"Describe practical applications of '{topic}', especially within an African context, "
+             f"highlighting how it can be applied to solve problems in fields like agriculture, economics, technology, and local industries in Sierra Leone."),
+            (5, "Example Problems", "Include example problems ranging from basic to advanced difficulty, with step-by-step solutions for each problem."),
+            (6, "Class Exercises", "Provide a set of exercises for students to practice in class, covering different levels of complexity."),
+            (7, "Homework Assignments", "List several homework assignments that reinforce the key concepts, with a mix of problem types."),
+            (9, "Follow-Up Questions and Recommendations",
+             f"Conclude with a section that suggests potential follow-up questions for students to extend their thinking and deepen their knowledge. Provide recommendations for additional resources, such as articles, videos, or online tools that could further reinforce their understanding of '{topic}'."),
+        ]
+
+    def complete_section(self, prompt):
+        """Generate one lesson note section for `generate_sections`."""
+        try:
+            completion = llm.complete(prompt, model=MATH_LESSON_MODEL, temperature=0.7)
+            return completion.text
+        except LLMUnavailable:
+            raise
+        except Exception as e:
+            logger.error(f"Error generating lesson note section: {e}")
+            return None
+
     def generate_follow_up_content(self, topic, level, follow_up_request):
         """Generate additional content based on a follow-up request."""
         try:
@@ -134,69 +236,30 @@ class MathLessonNoteGeneratorView(LoginRequiredMixin, View):
                 f"{follow_up_request}\n\n"
                 f"Ensure the response is educational, relevant, and tailored for students in Sierra Leone."
             )
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-            )
-            return response.choices[0].message.content
+            completion = llm.complete(prompt, task='follow_up', temperature=0.7)
+            return completion.text
+        except LLMUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Error generating follow-up content: {e}")
             return None
 
 
-
-
-import datetime
-
-
 @login_required
 def download_math_lesson(request, id):
-    """Generate and download the lesson note as a PDF with robust options."""
+    """Download the lesson note as a PDF, pre-rendered when it was saved or rendered now."""
     lesson_note = get_object_or_404(LessonPlan, id=id, user=request.user)
-    lesson_note_html = lesson_note.content
 
-    if not lesson_note_html:
+    if not lesson_note.content:
         messages.error(request, "No lesson note available to download.")
         return redirect('ai_core:math_lesson_note_generator')
 
-    # PDF options for improved robustness and quality
-    options = {
-        "enable-local-file-access": None,
-        "page-size": "A4",
-        "margin-top": "1in",
-        "margin-right": "1in",
-        "margin-bottom": "1in",
-        "margin-left": "1in",
-        "encoding": "UTF-8",
-        "dpi": 300,  # High DPI for better image and text quality
-        "zoom": "1.2",
-        "no-outline": None,
-        "footer-right": "[page] of [topage]",  # Page numbering in footer
-        "header-left": f"Generated on {datetime.datetime.now().strftime('%Y-%m-%d')}",  # Date on header
-        "footer-left": "Math Lesson Plan",  # Document title in footer
-        "footer-font-size": "10",
-        "header-font-size": "10",
-        "print-media-type": None,  # Forces media type to print for improved CSS compatibility
-        "minimum-font-size": 12,  # Ensures minimum readable font size
-        "disable-smart-shrinking": None,  # Avoids text scaling down too much
-    }
-
-    # Optional: Add a watermark or background image if needed (replace path accordingly)
-    #options["background"] = "/path/to/watermark-image.png"  # Uncomment if a watermark is desired
-
     try:
-        pdf = pdfkit.from_string(lesson_note_html, False, options=options)
+        return document_response(request, lesson_note)
     except IOError:
         messages.error(request, "Error generating PDF. Please try again later.")
         return redirect('ai_core:math_lesson_note_generator')
 
-    # Create the HTTP response with PDF content
-    response = HttpResponse(pdf, content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="math_lesson_note.pdf"'
-
-    return response
-
 
 class MathLessonNoteListView(LoginRequiredMixin, ListView):
     model = LessonPlan
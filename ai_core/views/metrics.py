@@ -0,0 +1,43 @@
+import datetime
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.shortcuts import render
+
+from ai_core.llm import PROVIDERS, call_recorder, get_circuit_breaker, model_route_metrics, rate_limiter, routing_metrics
+from ai_core.pdf_text import pdf_text_metrics
+from ai_core.uploads import extraction_cache_metrics
+from ai_core.utils import pdf_metrics, rerank_metrics, retrieval_metrics
+
+
+@staff_member_required
+def rate_limit_metrics(request):
+    """Rate limiter queues and waits and routing outcomes in this process, and the shared circuit breaker states."""
+    return JsonResponse({
+        'rate_limits': rate_limiter.metrics(),
+        'circuits': {provider: get_circuit_breaker(provider).state() for provider in PROVIDERS},
+        'routes': dict(routing_metrics),
+        'model_routes': {
+            key: dict(metrics, avg_latency=round(metrics['total_latency'] / metrics['calls'], 3))
+            for key, metrics in list(model_route_metrics.items()) if metrics['calls']
+        },
+        'rerank': dict(rerank_metrics),
+        'retrieval': dict(retrieval_metrics),
+        'pdf': pdf_metrics(),
+        'pdf_text': pdf_text_metrics(),
+        'extraction_cache': dict(extraction_cache_metrics),
+        'calls': call_recorder.summary(),
+    })
+
+
+@staff_member_required
+def llm_dashboard(request):
+    """Per-feature and per-model latency percentiles and token spend of recent LLM calls in this process."""
+    summary = call_recorder.summary()
+    context = {
+        'since': datetime.datetime.fromtimestamp(summary['since']),
+        'features': [dict(stats, name=name) for name, stats in summary['features'].items()],
+        'models': [dict(stats, name=name) for name, stats in summary['models'].items()],
+        'circuits': {provider: get_circuit_breaker(provider).state()['state'] for provider in PROVIDERS},
+    }
+    return render(request, 'ai_core/llm_dashboard.html', context)
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.15 on 2026-10-19 07:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_application_qr_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='application',
+            name='rendered_pdf',
+            field=models.FileField(blank=True, null=True, upload_to='generated_pdfs/'),
+        ),
+        migrations.AddField(
+            model_name='creativewritingprompt',
+            name='rendered_pdf',
+            field=models.FileField(blank=True, null=True, upload_to='generated_pdfs/'),
+        ),
+        migrations.AddField(
+            model_name='lessonplan',
+            name='rendered_pdf',
+            field=models.FileField(blank=True, null=True, upload_to='generated_pdfs/'),
+        ),
+        migrations.AddField(
+            model_name='summarizedcontent',
+            name='rendered_pdf',
+            field=models.FileField(blank=True, null=True, upload_to='generated_pdfs/'),
+        ),
+    ]
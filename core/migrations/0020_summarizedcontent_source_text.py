@@ -0,0 +1,25 @@
+# Generated by Django 5.1.15 on 2026-10-19 07:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_core', '0011_extractedtext'),
+        ('core', '0019_rendered_pdf'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summarizedcontent',
+            name='source_text',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='summaries', to='ai_core.extractedtext'),
+        ),
+        migrations.AlterField(
+            model_name='summarizedcontent',
+            name='original_content',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.15 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+def mark_math_notes(apps, schema_editor):
+    # Math lesson notes were saved without an area; new ones set is_math_note explicitly
+    LessonPlan = apps.get_model('core', 'LessonPlan')
+    LessonPlan.objects.filter(area='').update(is_math_note=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_summarizedcontent_source_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lessonplan',
+            name='is_math_note',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_math_notes, migrations.RunPython.noop),
+    ]
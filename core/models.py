@@ -128,6 +128,8 @@ class LessonPlan(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     follow_up_count = models.IntegerField(default=0)
+    is_math_note = models.BooleanField(default=False)  # Math lesson note (ai_core.views.maths_assistant)
+    rendered_pdf = models.FileField(upload_to='generated_pdfs/', null=True, blank=True)  # Pre-rendered download (ai_core.documents)
 
     def __str__(self):
         return f"{self.topic} ({self.level}, {self.area})"
@@ -135,10 +137,14 @@ class LessonPlan(models.Model):
 
 class SummarizedContent(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    original_content = models.TextField()
+    original_content = models.TextField(blank=True)  # Pasted text; PDF uploads use source_text instead
+    source_text = models.ForeignKey(
+        'ai_core.ExtractedText', on_delete=models.SET_NULL, related_name='summaries', null=True, blank=True
+    )
     summarized_content = models.TextField()
     content_html = models.TextField(null=True, blank=True)  # For rendering HTML version
     created_at = models.DateTimeField(auto_now_add=True)
+    rendered_pdf = models.FileField(upload_to='generated_pdfs/', null=True, blank=True)  # Pre-rendered download (ai_core.documents)
 
     def __str__(self):
         return f"Summarized content by {self.user.first_name} - {self.created_at}"
@@ -197,6 +203,7 @@ class CreativeWritingPrompt(models.Model):
     prompt = models.TextField(blank=False)  # Store the prompt as HTML (mandatory)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    rendered_pdf = models.FileField(upload_to='generated_pdfs/', null=True, blank=True)  # Pre-rendered download (ai_core.documents)
 
     def __str__(self):
         return f"Prompt for {self.genre or 'Unknown genre'} ({self.level or 'Unknown level'}) in {self.location or 'Unknown location'}"
@@ -335,6 +342,7 @@ class Application(models.Model):
     application_code = models.CharField(max_length=10, unique=True, editable=False)
     application_date = models.DateTimeField(auto_now_add=True)
     qr_code = models.ImageField(upload_to='application_qr_codes/', blank=True, null=True)
+    rendered_pdf = models.FileField(upload_to='generated_pdfs/', null=True, blank=True)  # Pre-rendered download (ai_core.documents)
 
 
     # def save(self, *args, **kwargs):
@@ -3,7 +3,8 @@ from django.views.generic import TemplateView
 
 from ai_core.views.class_notes import QuestionBankGeneratorView
 from core.views.application import ApplicationFormWizard, download_application
-from core.views.home import HomePage, TeacherListView, TeacherProfileDetailView, SchoolListView, SchoolDetailView
+from core.views.home import HomePage, TeacherListView, TeacherProfileDetailView, SchoolListView, SchoolDetailView, \
+    teacher_qr_code
 from core.views.tutor import TutorListView
 
 app_name = 'core'
@@ -14,6 +15,7 @@ urlpatterns = [
     path('tutors/', TutorListView.as_view(), name='tutor-list'),
 
     path("teacher/<int:pk>/", TeacherProfileDetailView.as_view(), name="teacher_profile_detail"),
+    path("teacher/<int:pk>/qr/<str:qr_hash>.png", teacher_qr_code, name="teacher_qr_code"),
     path('schools/', SchoolListView.as_view(), name='school-list'),
     path("school/<int:pk>/", SchoolDetailView.as_view(), name="school_profile_detail"),
     path(
@@ -61,70 +61,13 @@ class ApplicationFormWizard(SessionWizardView, UserIsGuardianMixin):
         return render(self.request, 'application/application_done.html', {'application': application})
 
 
-import base64
-from io import BytesIO
-from django.core.files.storage import default_storage
-
-
-def encode_image(image_field):
-    if not image_field:
-        return None
-    file = default_storage.open(image_field.name)
-    return f"data:image/png;base64,{base64.b64encode(file.read()).decode()}"
-
-
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
-from django.template.loader import render_to_string
-from django.templatetags.static import static
-import pdfkit
-import datetime
+
+from ai_core.documents import document_response
 
 
 def download_application(request, application_id):
-    """Generate and download the application as a PDF."""
+    """Download the application as a PDF, pre-rendered when it was submitted or rendered now."""
     # Fetch the application associated with the user
     application = get_object_or_404(Application, pk=application_id, user=request.user)
-
-    # Resolve static path for the logo (if needed)
-    logo_url = request.build_absolute_uri(static('core/images/header_logo.png'))
-
-    # Render HTML using a Django template
-    application_html = render_to_string(
-        'application/application_pdf.html',
-        {
-            'application': application,
-            'generated_date': datetime.datetime.now().strftime('%Y-%m-%d'),
-            'logo_url': logo_url,  # Pass the logo URL to the template
-            'application_image_base64': encode_image(application.applicant_image),
-            'qr_code_base64': encode_image(application.qr_code),
-        }
-    )
-
-    # PDF options for optimal rendering
-    options = {
-        "enable-local-file-access": "",
-        "page-size": "A4",
-        "margin-top": "1in",
-        "margin-right": "1in",
-        "margin-bottom": "1in",
-        "margin-left": "1in",
-        "encoding": "UTF-8",
-        "dpi": 300,
-        "orientation": "Portrait",
-        "zoom": "1.1",
-        "footer-right": "[page] of [topage]",
-        "header-left": f"Generated on {datetime.datetime.now().strftime('%Y-%m-%d')}",
-        "footer-left": "Application Details",
-        "footer-font-size": "10",
-        "header-font-size": "10",
-        "print-media-type": None,
-        "minimum-font-size": 12,
-        "disable-smart-shrinking": None,
-    }
-
-    # Generate PDF from HTML
-    pdf = pdfkit.from_string(application_html, False, options=options)
-    response = HttpResponse(pdf, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="application_{application.application_code}.pdf"'
-    return response
+    return document_response(request, application)
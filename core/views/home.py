@@ -112,7 +112,10 @@ class TeacherListView(ListView):
 
 
 from django.views.generic.detail import DetailView
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseNotModified
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 from account.models import TeacherProfile, Subject, School
 
@@ -124,7 +127,10 @@ class TeacherProfileDetailView(DetailView):
 
     def get_object(self):
         """Override to fetch teacher profile based on primary key or slug."""
-        return get_object_or_404(TeacherProfile, pk=self.kwargs.get("pk"))
+        return get_object_or_404(
+            TeacherProfile.objects.select_related("user", "school").prefetch_related("subjects"),
+            pk=self.kwargs.get("pk"),
+        )
 
     def get_context_data(self, **kwargs):
         """Add additional context for a more informative page."""
@@ -145,12 +151,46 @@ class TeacherProfileDetailView(DetailView):
         # Information about the teacher's school
         context["school"] = teacher_profile.school
 
-        # Example of QR code generation (if necessary to display dynamically)
-        context["teacher_qr_code"] = teacher_profile.generate_qr_code()
+        # The QR image is served separately under its payload hash, so browsers cache it until the details change.
+        context["teacher_qr_code_url"] = reverse(
+            "core:teacher_qr_code", args=[teacher_profile.pk, teacher_profile.qr_code_hash()]
+        )
 
         return context
 
 
+QR_CODE_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def teacher_qr_code(request, pk, qr_hash):
+    """
+    A teacher's QR code as a PNG. It encodes only what the public profile page shows, so
+    it is public like the page. The URL carries the payload hash, so the response never
+    changes and browsers and shared caches keep it for a year; the image is rendered once
+    per hash and kept in the cache. Any other hash is a 404.
+    """
+    teacher_profile = get_object_or_404(
+        TeacherProfile.objects.select_related("user", "school").prefetch_related("subjects"), pk=pk
+    )
+    current_hash = teacher_profile.qr_code_hash()
+    if qr_hash != current_hash:
+        raise Http404
+
+    etag = f'"{current_hash}"'
+    if request.headers.get("If-None-Match") == etag:
+        response = HttpResponseNotModified()
+    else:
+        cache_key = f"teacher_qr_code:{current_hash}"
+        png = cache.get(cache_key)
+        if png is None:
+            png = teacher_profile.generate_qr_code().read()
+            cache.set(cache_key, png, QR_CODE_CACHE_TIMEOUT)
+        response = HttpResponse(png, content_type="image/png")
+    response["ETag"] = etag
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
 from django.views.generic import ListView
 from django.db.models import Q
 from django.http import JsonResponse
@@ -64,6 +64,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'ai_core.middleware.LLMCallContextMiddleware',
+    'ai_core.middleware.LLMUnavailableMiddleware',
 ]
 
 ROOT_URLCONF = 'eduBridge.urls'
@@ -98,6 +100,11 @@ DATABASES = {
     }
 }
 
+# Cache (use a shared backend such as Redis in production so all workers see the same rate limits)
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -138,6 +145,12 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'uploads'
+# Django's upload handlers, hashing each file as it streams in (ai_core.uploads), so repeat PDF uploads reuse their
+# extracted text
+FILE_UPLOAD_HANDLERS = [
+    'ai_core.uploads.SHA256MemoryFileUploadHandler',
+    'ai_core.uploads.SHA256TemporaryFileUploadHandler',
+]
 STATICFILES_DIRS = [
     BASE_DIR / "static",
 ]
@@ -153,6 +166,161 @@ LOGIN_URL = '/account/login/'
 
 GEMINI_API_KEY = env('GEMINI_API_KEY', default='')
 GROQ_API_KEY = env('GROQ_API_KEY', default='')
+
+# Background generation jobs (see ai_core.jobs and the run_ai_worker command)
+AI_JOB_QUEUE_ENABLED = env.bool('AI_JOB_QUEUE_ENABLED', default=False)
+AI_WORKER_POLL_INTERVAL = env.float('AI_WORKER_POLL_INTERVAL', default=2.0)  # seconds
+AI_JOB_STALE_AFTER = env.int('AI_JOB_STALE_AFTER', default=600)  # seconds a job may stay running
+AI_JOB_MAX_ATTEMPTS = env.int('AI_JOB_MAX_ATTEMPTS', default=3)
+
+# Batch history queries (QueryView.post)
+AI_QUERY_MAX_WORKERS = env.int('AI_QUERY_MAX_WORKERS', default=4)  # concurrent LLM calls per request
+AI_QUERY_DEADLINE = env.float('AI_QUERY_DEADLINE', default=60.0)  # seconds for the whole batch
+
+# Summarisation (SummarizationView): documents above the direct limit are map-reduced
+AI_SUMMARY_DIRECT_MAX_TOKENS = env.int('AI_SUMMARY_DIRECT_MAX_TOKENS', default=6000)
+AI_SUMMARY_SECTION_TOKENS = env.int('AI_SUMMARY_SECTION_TOKENS', default=3000)
+AI_SUMMARY_MAX_WORKERS = env.int('AI_SUMMARY_MAX_WORKERS', default=4)
+AI_SUMMARY_MAX_MAP_ROUNDS = env.int('AI_SUMMARY_MAX_MAP_ROUNDS', default=3)
+
+# Section-wise generation of lesson plans and math lesson notes (ai_core.utils.generate_sections)
+AI_SECTIONED_GENERATION = env.bool('AI_SECTIONED_GENERATION', default=False)
+AI_SECTION_MAX_WORKERS = env.int('AI_SECTION_MAX_WORKERS', default=8)
+AI_SECTION_CACHE_TIMEOUT = env.int('AI_SECTION_CACHE_TIMEOUT', default=60 * 60 * 24)  # seconds
+
+# 'live' calls Groq and Google GenAI; 'stub' answers every chat and embedding call locally (ai_core.stub_provider)
+AI_PROVIDER_BACKEND = env('AI_PROVIDER_BACKEND', default='live')
+AI_STUB = env.json('AI_STUB', default={
+    'seed': 42,
+    'chat': {
+        'ttft': {'distribution': 'lognormal', 'median': 0.4, 'sigma': 0.5},  # seconds to first token
+        'tokens_per_second': 250,
+        'output_tokens': 600,
+        'error_rate': 0.0,
+        'rate_limit_rate': 0.0,
+        'timeout_rate': 0.0,
+    },
+    'embedding': {
+        'latency': {'distribution': 'lognormal', 'median': 0.05, 'sigma': 0.3},
+        'error_rate': 0.0,
+    },
+    'providers': {},  # per-provider overrides, e.g. {'groq': {'chat': {'tokens_per_second': 100}}}
+})
+
+# Client-side rate limits per provider and model (ai_core.llm.rate_limiter); keep below the account quotas
+AI_RATE_LIMITS = env.json('AI_RATE_LIMITS', default={
+    'groq': {
+        'default': {'rpm': 30, 'tpm': 6000},
+        'llama-3.3-70b-versatile': {'rpm': 30, 'tpm': 12000},
+    },
+    'gemini': {
+        'default': {'rpm': 1500, 'tpm': 1000000},
+    },
+})
+AI_RATE_LIMIT_CACHE = env('AI_RATE_LIMIT_CACHE', default='default')
+AI_RATE_LIMIT_MAX_QUEUE = env.int('AI_RATE_LIMIT_MAX_QUEUE', default=50)  # waiting calls per model per process
+AI_RATE_LIMIT_MAX_WAIT = {  # seconds a call may wait for admission, by priority
+    'interactive': env.float('AI_RATE_LIMIT_MAX_WAIT_INTERACTIVE', default=30.0),
+    'batch': env.float('AI_RATE_LIMIT_MAX_WAIT_BATCH', default=300.0),
+}
+AI_EXPECTED_OUTPUT_TOKENS = env.int('AI_EXPECTED_OUTPUT_TOKENS', default=1500)  # reserved until usage is known
+
+# Provider timeouts and circuit breakers (ai_core.llm.CircuitBreaker)
+AI_LLM_TIMEOUT = env.float('AI_LLM_TIMEOUT', default=30.0)  # seconds per Groq call
+AI_LLM_MAX_RETRIES = env.int('AI_LLM_MAX_RETRIES', default=1)
+AI_LLM_RETRY_BACKOFF = env.float('AI_LLM_RETRY_BACKOFF', default=0.5)  # seconds before the first retry, doubling
+AI_EMBEDDING_TIMEOUT = env.float('AI_EMBEDDING_TIMEOUT', default=10.0)  # seconds per GenAI embedding call
+AI_CIRCUIT_WINDOW = env.int('AI_CIRCUIT_WINDOW', default=20)  # recent calls considered per provider
+AI_CIRCUIT_MIN_CALLS = env.int('AI_CIRCUIT_MIN_CALLS', default=5)  # calls needed before the circuit can open
+AI_CIRCUIT_FAILURE_RATE = env.float('AI_CIRCUIT_FAILURE_RATE', default=0.5)
+AI_CIRCUIT_SLOW_CALL = env.float('AI_CIRCUIT_SLOW_CALL', default=25.0)  # seconds; slower calls count as failures
+AI_CIRCUIT_COOL_DOWN = env.int('AI_CIRCUIT_COOL_DOWN', default=30)  # seconds open before a probe call
+AI_FALLBACK_CACHE_TIMEOUT = env.int('AI_FALLBACK_CACHE_TIMEOUT', default=60 * 60 * 24)  # cached answers served while open
+AI_WORKER_MAX_BACKOFF = env.float('AI_WORKER_MAX_BACKOFF', default=60.0)  # seconds
+
+# Text generation routing: 'single' calls the requested provider only; 'hedged' sends the prompt to the
+# secondary as well when the primary has not streamed a first token within the hedge delay (ai_core.llm.hedged_chat)
+AI_ROUTING_MODE = env('AI_ROUTING_MODE', default='single')
+AI_HEDGE_SECONDARY = {
+    'provider': env('AI_HEDGE_SECONDARY_PROVIDER', default='gemini'),
+    'model': env('AI_HEDGE_SECONDARY_MODEL', default='gemini-2.0-flash'),
+}
+AI_HEDGE_PERCENTILE = env.float('AI_HEDGE_PERCENTILE', default=0.95)  # of recent first-token latencies
+AI_HEDGE_DEFAULT_DELAY = env.float('AI_HEDGE_DEFAULT_DELAY', default=3.0)  # seconds, until there are enough samples
+AI_HEDGE_MIN_DELAY = env.float('AI_HEDGE_MIN_DELAY', default=0.5)  # seconds
+AI_HEDGE_SAMPLES = env.int('AI_HEDGE_SAMPLES', default=200)
+AI_HEDGE_MIN_SAMPLES = env.int('AI_HEDGE_MIN_SAMPLES', default=20)
+AI_HEDGE_MAX_WORKERS = env.int('AI_HEDGE_MAX_WORKERS', default=16)  # threads running hedged attempts per process
+
+# Context budgets for RAG prompts in estimated tokens (ai_core.utils.assemble_context)
+AI_CONTEXT_BUDGETS = env.json('AI_CONTEXT_BUDGETS', default={
+    'history': {'chunks': 2000},
+    'question_bank': {'chunks': 1500, 'document': 4000},
+})
+AI_CONTEXT_DUPLICATE_THRESHOLD = env.float('AI_CONTEXT_DUPLICATE_THRESHOLD', default=0.8)  # shared shingle fraction
+AI_CONTEXT_PASSAGE_TOKENS = env.int('AI_CONTEXT_PASSAGE_TOKENS', default=300)  # passage size when trimming uploads
+
+# Optional local cross-encoder rerank of retrieved chunks (needs requirements-ml.txt; ai_core.utils.rerank_chunks_batch)
+AI_RERANK_ENABLED = env.bool('AI_RERANK_ENABLED', default=False)
+AI_RERANK_MODEL = env('AI_RERANK_MODEL', default='cross-encoder/ms-marco-MiniLM-L-6-v2')
+AI_RERANK_CANDIDATES = env.int('AI_RERANK_CANDIDATES', default=25)  # chunks retrieved by cosine score before reranking
+AI_RERANK_BATCH_SIZE = env.int('AI_RERANK_BATCH_SIZE', default=32)
+AI_LLM_PREFILL_TOKENS_PER_SECOND = env.float('AI_LLM_PREFILL_TOKENS_PER_SECOND', default=2000.0)  # to estimate time saved
+
+# Retrieval deadline (ai_core.utils.retrieve_chunks): embedding search that misses the budget falls back to a
+# keyword search, then to no context
+AI_RETRIEVAL_BUDGET = env.float('AI_RETRIEVAL_BUDGET', default=0.3)  # seconds for the embedding call and vector scan
+AI_RETRIEVAL_LEXICAL_BUDGET = env.float('AI_RETRIEVAL_LEXICAL_BUDGET', default=0.1)  # seconds
+AI_RETRIEVAL_LEXICAL_TERMS = env.int('AI_RETRIEVAL_LEXICAL_TERMS', default=5)  # longest query terms matched
+AI_RETRIEVAL_LEXICAL_SCAN = env.int('AI_RETRIEVAL_LEXICAL_SCAN', default=200)  # matching chunks scored
+AI_RETRIEVAL_MAX_WORKERS = env.int('AI_RETRIEVAL_MAX_WORKERS', default=8)
+
+# Model tiers and per-task routing (ai_core.llm.choose_model). A task goes to the fast tier when its prompt and
+# expected output are within the small_* limits (estimated tokens), otherwise to its default tier.
+AI_MODEL_TIERS = env.json('AI_MODEL_TIERS', default={
+    'fast': 'llama-3.1-8b-instant',
+    'standard': 'llama-3.3-70b-versatile',
+    'reasoning': 'deepseek-r1-distill-llama-70b',
+})
+AI_TASK_ROUTES = env.json('AI_TASK_ROUTES', default={
+    'follow_up': {'tier': 'standard', 'small_prompt_tokens': 300, 'small_output_tokens': 800, 'expected_output_tokens': 800},
+    'question_bank': {'tier': 'standard', 'expected_output_tokens': 2500},
+})
+
+# LLM call instrumentation (ai_core.llm.record_call): calls kept per feature for the dashboard, and
+# USD prices per million input/output tokens used to estimate spend
+AI_CALL_STATS_WINDOW = env.int('AI_CALL_STATS_WINDOW', default=500)
+AI_MODEL_PRICES = env.json('AI_MODEL_PRICES', default={
+    'llama-3.1-8b-instant': {'input': 0.05, 'output': 0.08},
+    'llama-3.3-70b-versatile': {'input': 0.59, 'output': 0.79},
+    'deepseek-r1-distill-llama-70b': {'input': 0.75, 'output': 0.99},
+    'gemini-2.0-flash': {'input': 0.10, 'output': 0.40},
+    'text-embedding-004': {'input': 0.0, 'output': 0.0},
+})
+
+# Rendered PDFs, cached on local disk by a hash of their HTML and render options (ai_core.utils.cached_pdf); the size
+# limit covers the resized images embedded in them as well (ai_core.documents.image_file_url)
+AI_PDF_CACHE_DIR = env('AI_PDF_CACHE_DIR', default=str(BASE_DIR / 'pdf_cache'))
+AI_PDF_CACHE_MAX_BYTES = env.int('AI_PDF_CACHE_MAX_BYTES', default=500 * 1024 * 1024)
+# Shared PDF render pool (ai_core.utils.generate_pdf): renders running at once and waiting per process, and the
+# seconds a download waits for its render before answering 503 (the render still finishes into the cache)
+AI_PDF_MAX_WORKERS = env.int('AI_PDF_MAX_WORKERS', default=2)
+AI_PDF_MAX_QUEUE = env.int('AI_PDF_MAX_QUEUE', default=20)
+AI_PDF_RENDER_TIMEOUT = env.float('AI_PDF_RENDER_TIMEOUT', default=30.0)
+# Library used to extract PDF text: pymupdf, pypdf2 or pdfplumber, or auto for the fastest one installed.
+# Compare them on real files with `manage.py benchmark_pdf_engines <directory>`. Extracted text is stored per
+# engine (ai_core.uploads), so after a change each file is extracted again on its next upload.
+AI_PDF_TEXT_ENGINE = env('AI_PDF_TEXT_ENGINE', default='auto')
+# PDF uploads: size and page limits, and the process pool that extracts long documents in page ranges
+# (ai_core.pdf_text); documents over AI_PDF_EXTRACT_PARALLEL_PAGES pages are split across the workers
+AI_PDF_UPLOAD_MAX_BYTES = env.int('AI_PDF_UPLOAD_MAX_BYTES', default=25 * 1024 * 1024)
+AI_PDF_UPLOAD_MAX_PAGES = env.int('AI_PDF_UPLOAD_MAX_PAGES', default=500)
+AI_PDF_EXTRACT_WORKERS = env.int('AI_PDF_EXTRACT_WORKERS', default=2)
+AI_PDF_EXTRACT_PARALLEL_PAGES = env.int('AI_PDF_EXTRACT_PARALLEL_PAGES', default=50)
+AI_PDF_EXTRACT_RANGE_PAGES = env.int('AI_PDF_EXTRACT_RANGE_PAGES', default=25)
+AI_EXPORT_PREFETCH = env.int('AI_EXPORT_PREFETCH', default=4)  # PDF renders queued ahead in a ZIP export
+AI_PDF_PRERENDER = env.bool('AI_PDF_PRERENDER', default=True)  # render downloads in the background on save (ai_core.documents)
+
 PDFKIT_OPTIONS = {
     'page-size': 'Letter',
     'encoding': 'UTF-8',
@@ -176,6 +344,11 @@ LOGGING = {
             'level': 'WARNING',
             'propagate': False,
         },
+        'ai_core.llm.calls': {
+            'handlers': ['console'],
+            'level': env('AI_CALL_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
     },
 }
 